@@ -2,18 +2,35 @@ import argparse
 import datetime
 import sys
 import traceback
-from time import sleep
+from time import sleep, monotonic
+from typing import Type, Optional, Callable, List, TYPE_CHECKING
 
-import pytz
-from selenium.common.exceptions import NoSuchElementException
-
-from niescraper.alarm import play_alarm_until_input
-from niescraper.appointmentchecker import AppointmentChecker, FormValues, IdentificationMethod, FormField, \
-    IntentionSelectionStrategy, OfficeSelectionStrategy
 from niescraper.appointmentscraper import scrape_appointments
+from niescraper.booking import SlotPreference, NoAcceptableSlotException, BookingFailedException
+from niescraper.browserprofile import DriverProfile, browsers, print_page_load_report
+from niescraper.catalog import Catalog
+from niescraper.forms import FormValues, IdentificationMethod, FormField, IntentionSelectionStrategy, \
+    OfficeSelectionStrategy, url, intention_name
+from niescraper.history import AppointmentHistory, Target
 from niescraper.intentionselection import find_assign_nie_option, find_register_eu_citizen_option
+from niescraper.notification import NotificationDispatcher, Notification, SoundSink, DesktopSink, WebhookSink, \
+    FileSink
+from niescraper.options import Option
 from niescraper.officeselection import NearestValenciaOfficeSelectionStrategy, ManualOfficeSelectionStrategy, \
     DFSOfficeSelectionStrategy, SpecificOfficeSelectionStrategy
+from niescraper.readiness import Pacing, steps
+from niescraper.requestbudget import RequestBudget, BlockedException, requests_per_check
+from niescraper.schedule import ReleaseSchedule, default_schedule, ServerClock, sleep_until
+
+# Selenium, asyncio and the crawlers are imported by the modes that use them, so that parsing the arguments and
+# computing the check intervals stay fast
+if TYPE_CHECKING:
+    from niescraper.appointmentchecker import AppointmentChecker
+    from niescraper.checkpoint import CrawlCheckpoint
+    from niescraper.crawl import OfficeResult
+    from niescraper.officescore import OfficeScores
+    from niescraper.pool import WorkerSettings
+    from niescraper.resultwriter import ResultWriter
 
 form_values = FormValues(IdentificationMethod.ByNIE, {
     FormField.NieNumber: "Y1234567X",
@@ -26,83 +43,520 @@ form_values = FormValues(IdentificationMethod.ByNIE, {
 })
 
 
+engines = ("selenium", "http")
+
+
+def checker_class(engine: str) -> Type["AppointmentChecker"]:
+    if engine == "http":
+        from niescraper.httpchecker import FastAppointmentChecker
+        return FastAppointmentChecker
+    from niescraper.appointmentchecker import AppointmentChecker
+    return AppointmentChecker
+
+
 def print_with_time(text):
     print(datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S") + ": " + text)
 
 
-def seconds_until_next_check(now: datetime.datetime = None):
-    tz = pytz.timezone('Europe/Madrid')
+def report_browser_restart(error: BaseException) -> None:
+    print_with_time(f"Restarting the browser after {type(error).__name__}: {str(error).strip()}")
+
+
+def report_block(reason: str, delay: float, requests_per_minute: float) -> None:
+    print_with_time(f"The site blocked the requests ({reason}); pausing for {delay:.0f}s at "
+                    f"{requests_per_minute:.0f} requests per minute")
+
+
+def seconds_until_next_check(now: datetime.datetime = None, schedule: ReleaseSchedule = default_schedule):
     if now is None:
-        now = datetime.datetime.now(tz=tz)
+        now = datetime.datetime.now(tz=schedule.timezone)
+    now = schedule.localize(now)
 
     # all 5min at weekend and night
-    if now.weekday() >= 5 or now.hour < 7 or now.hour >= 22:
+    if now.weekday() not in schedule.weekdays or now.hour < 7 or now.hour >= 22:
         return 5 * 60
 
-    # otherwise, immediately between 7:55 and 10:50
-    if datetime.time(hour=7, minute=55, tzinfo=tz) < now.time() < datetime.time(hour=10, minute=50, tzinfo=tz):
-        # wait 10s if between more then 3min before and after full quarter hour
-        if 3 <= now.minute % 15 < 12:
-            return 10
-        # otherwise, wait only 1s
-        return 1
+    # otherwise, immediately from 5min before the first until 5min after the last release of the day
+    releases = schedule.releases_on(now.date())
+    if releases[0] - datetime.timedelta(minutes=5) < now < releases[-1] + datetime.timedelta(minutes=5):
+        # wait only 1s from 3min before until 3min after a release
+        _, seconds_since_release = schedule.nearest_release(now)
+        if -3 * 60 <= seconds_since_release < 3 * 60:
+            return 1
+        # otherwise, wait 10s
+        return 10
 
     # otherwise, 1 minute
     return 60
 
 
-def keep_checking(checker: AppointmentChecker, selection_strategy: OfficeSelectionStrategy,
-                  intention_strategy: IntentionSelectionStrategy, form_values: FormValues = form_values):
+def seconds_until_budget(checker: "AppointmentChecker") -> float:
+    """How long the next check of the checker would have to wait for the request budget."""
+    if checker.budget is None:
+        return 0
+    return checker.budget.seconds_until(checker.start_url, requests_per_check, checker)
+
+
+def latency_breakdown(checker: "AppointmentChecker") -> str:
+    if checker.instrumentation is None or checker.instrumentation.last_record is None:
+        return ""
+    return f" [{checker.instrumentation.breakdown()}]"
+
+
+def _option_text(option: Optional[Option]) -> str:
+    return option.text if option is not None else ""
+
+
+def record_check(history: AppointmentHistory, checker: "AppointmentChecker",
+                 intention_strategy: IntentionSelectionStrategy, appointments_available: bool, label: str = "") -> bool:
+    """Records the outcome of the last check and prints what changed. Returns whether there are new appointments,
+    or appointments that could not be read from the page.
+    """
+    province, office = _option_text(checker.last_province), _option_text(checker.last_office)
+    intention = intention_name(intention_strategy)
+    if not appointments_available:
+        vanished = sum(len(diff.vanished) for _, diff in
+                       history.record_no_appointments(province, intention, office or None))
+        print_with_time(label + "No appointment available" + (f" anymore, {vanished} vanished" if vanished else "")
+                        + latency_breakdown(checker))
+        return False
+
+    # after a booking, the appointment page is gone, but the booking kept what it offered
+    appointments = checker.last_booking.offered if checker.last_booking is not None \
+        else scrape_appointments(checker.driver)
+    diff = history.record(Target(province, office, intention), appointments)
+    for appointment in diff.new:
+        print_with_time(label + "New appointment: " + appointment.strftime("%a %Y-%m-%d %H:%M"))
+    for appointment in diff.vanished:
+        print_with_time(label + "Vanished appointment: " + appointment.strftime("%a %Y-%m-%d %H:%M"))
+    if diff.new or not diff.available or checker.last_booking is not None:
+        return True
+    print_with_time(label + f"No new appointments, {diff.available} still available" + latency_breakdown(checker))
+    return False
+
+
+def describe_selection(checker: "AppointmentChecker") -> str:
+    return " – ".join(option.text for option in (checker.last_province, checker.last_office) if option is not None)
+
+
+def book_if_wanted(checker: "AppointmentChecker", preference: Optional[SlotPreference], label: str = "") -> None:
+    """Books an appointment right away on the page of a check that found some, if a preference is given."""
+    if preference is None:
+        return
+    try:
+        booking = checker.book(preference)
+    except (NoAcceptableSlotException, BookingFailedException) as e:
+        print_with_time(label + f"Not booked: {e}")
+        return
+    print_with_time(label + f"Booked the appointment at {booking.appointment:%a %Y-%m-%d %H:%M}, "
+                            f"reference {booking.reference}")
+
+
+def appointments_notification(checker: "AppointmentChecker", label: str = "") -> Notification:
+    booking = checker.last_booking
+    if booking is None:
+        return Notification(label + "Appointments available", describe_selection(checker))
+    return Notification(label + "Appointment booked", f"{describe_selection(checker)}: "
+                                                      f"{booking.appointment:%a %Y-%m-%d %H:%M}, reference "
+                                                      f"{booking.reference}")
+
+
+def alert_and_wait(notifier: NotificationDispatcher, notification: Notification) -> None:
+    """Alerts the user and waits until the alert is acknowledged, unless the same alert was raised just before."""
+    alert = notifier.notify(notification)
+    if alert is None:
+        return
+    print("Please press Enter to acknowledge alarm...")
+    notifier.prompt_for_acknowledgement()
+    alert.acknowledged.wait()
+
+
+def keep_checking(checker: "AppointmentChecker", selection_strategy: OfficeSelectionStrategy,
+                  intention_strategy: IntentionSelectionStrategy, form_values: FormValues = form_values,
+                  history: AppointmentHistory = None, schedule: ReleaseSchedule = default_schedule,
+                  notifier: NotificationDispatcher = None, booking: SlotPreference = None):
+    if notifier is None:
+        notifier = NotificationDispatcher([SoundSink()])
+    if checker.catalog is not None:
+        selection_strategy.resolve(checker.catalog)
+    while True:
+        try:
+            while True:
+                available = checker.check_citas_available(form_values, selection_strategy, intention_strategy)
+                if available:
+                    book_if_wanted(checker, booking)
+                if history is not None:
+                    if record_check(history, checker, intention_strategy, available):
+                        break
+                elif available:
+                    break
+                else:
+                    print_with_time("No appointment available" + latency_breakdown(checker))
+                sleep(max(seconds_until_next_check(schedule=schedule), seconds_until_budget(checker)))
+            print_with_time("Appointments available")
+            notification = appointments_notification(checker)
+        except KeyboardInterrupt as e:
+            raise e
+        except BlockedException as e:
+            # the budget holds the next check back until the site accepts requests again
+            print_with_time(f"Blocked: {e}")
+            continue
+        except Exception as e:
+            traceback.print_exc()
+            # the same error is only alarmed once in a while
+            alert_and_wait(notifier, Notification("Checking for appointments failed", f"{type(e).__name__}: {e}",
+                                                  type(e).__name__))
+            # the alarm returns at once if it was held back, and a failing site must not be checked back to back
+            sleep(max(seconds_until_next_check(schedule=schedule), seconds_until_budget(checker)))
+            continue
+        alert_and_wait(notifier, notification)
+
+
+def check_at_release(checker: "AppointmentChecker", selection_strategy: OfficeSelectionStrategy,
+                     intention_strategy: IntentionSelectionStrategy, form_values: FormValues, deadline: float,
+                     lead: float) -> bool:
+    """Goes through the forms shortly before the monotonic deadline and asks for appointments right at it. If the
+    browser fails, the check is repeated at once in a new browser.
+    """
+    sleep_until(deadline - lead)
+    return checker.check_in_browser(form_values, selection_strategy, intention_strategy,
+                                    lambda: sleep_until(deadline))
+
+
+def keep_checking_at_releases(checker: "AppointmentChecker", selection_strategy: OfficeSelectionStrategy,
+                              intention_strategy: IntentionSelectionStrategy, form_values: FormValues = form_values,
+                              schedule: ReleaseSchedule = default_schedule, lead: float = 30,
+                              history: AppointmentHistory = None, resync_interval: float = 10 * 60,
+                              notifier: NotificationDispatcher = None, booking: SlotPreference = None):
+    """Like keep_checking(), but asks for appointments exactly at the releases of the schedule on the server clock.
+    The forms are filled in up to the last page the lead time ahead of every release.
+    """
+    if notifier is None:
+        notifier = NotificationDispatcher([SoundSink()])
+    if checker.catalog is not None:
+        selection_strategy.resolve(checker.catalog)
+    from niescraper.httpchecker import HttpSession
+
+    clock = ServerClock()
+    session = HttpSession(budget=checker.budget)
+    synchronized_at = None
     while True:
         try:
-            while not checker.check_citas_available(form_values, selection_strategy, intention_strategy):
-                print_with_time("No appointment available")
-                sleep(seconds_until_next_check())
+            while True:
+                if synchronized_at is None or monotonic() - synchronized_at > resync_interval:
+                    clock.synchronize(session, checker.start_url)
+                    synchronized_at = monotonic()
+                    print_with_time(f"Server clock is {clock.offset:+.3f}s (±{clock.uncertainty:.3f}s) off")
+                release = schedule.next_release(clock.now())
+                deadline = clock.monotonic_deadline(release)
+                # check as usual while there is enough time left until the release
+                if deadline - monotonic() > 2 * lead:
+                    available = checker.check_citas_available(form_values, selection_strategy, intention_strategy)
+                else:
+                    print_with_time(f"Checking at the release at {schedule.localize(release):%H:%M}")
+                    available = check_at_release(checker, selection_strategy, intention_strategy, form_values,
+                                                 deadline, lead)
+                if available:
+                    book_if_wanted(checker, booking)
+                if history is not None:
+                    if record_check(history, checker, intention_strategy, available):
+                        break
+                elif available:
+                    break
+                else:
+                    print_with_time("No appointment available" + latency_breakdown(checker))
+                sleep(max(0.0, seconds_until_budget(checker),
+                          min(seconds_until_next_check(schedule=schedule), deadline - 2 * lead - monotonic())))
             print_with_time("Appointments available")
+            notification = appointments_notification(checker)
         except KeyboardInterrupt as e:
             raise e
-        except Exception:
+        except BlockedException as e:
+            # the budget holds the next check back until the site accepts requests again
+            print_with_time(f"Blocked: {e}")
+            continue
+        except Exception as e:
             traceback.print_exc()
-        play_alarm_until_input()
+            # the same error is only alarmed once in a while
+            alert_and_wait(notifier, Notification("Checking for appointments failed", f"{type(e).__name__}: {e}",
+                                                  type(e).__name__))
+            # the alarm returns at once if it was held back, and a failing site must not be checked back to back
+            sleep(max(seconds_until_next_check(schedule=schedule), seconds_until_budget(checker)))
+            continue
+        alert_and_wait(notifier, notification)
+
+
+def run_endless_mode(checker: "AppointmentChecker", parsed_args, history: AppointmentHistory = None,
+                     notifier: NotificationDispatcher = None):
+    selection_strategy = parsed_args.office_strategy(parsed_args)
+    if parsed_args.at_releases:
+        keep_checking_at_releases(checker, selection_strategy, parsed_args.intention_strategy,
+                                  schedule=parsed_args.schedule, lead=parsed_args.lead, history=history,
+                                  notifier=notifier, booking=parsed_args.booking)
+    else:
+        keep_checking(checker, selection_strategy, parsed_args.intention_strategy, history=history,
+                      schedule=parsed_args.schedule, notifier=notifier, booking=parsed_args.booking)
+
+
+def run_monitor_mode(parsed_args, create_checker: Callable[..., "AppointmentChecker"],
+                     history: AppointmentHistory = None, notifier: NotificationDispatcher = None,
+                     profile: DriverProfile = None):
+    import asyncio
+    from niescraper.monitor import MonitorTarget, monitor_targets
+    from niescraper.tabs import TabbedBrowser
+
+    if notifier is None:
+        notifier = NotificationDispatcher([SoundSink()])
+    targets = parsed_args.loaded_targets
+    tabbed_browsers = []
+    # more checkers than targets would only idle
+    if parsed_args.tabs > 1:
+        # the browsers are recycled as a whole, since closing a tab frees little of their memory
+        tabbed_browsers = [TabbedBrowser((profile or DriverProfile()).create_driver, parsed_args.recycle_after,
+                                         parsed_args.max_browser_memory)
+                           for _ in range(parsed_args.drivers)]
+        checkers = [create_checker(tabbed_browsers[number % len(tabbed_browsers)].lifecycle())
+                    for number in range(min(parsed_args.drivers * parsed_args.tabs, len(targets)))]
+    else:
+        checkers = [create_checker() for _ in range(min(parsed_args.drivers, len(targets)))]
+    for target in targets:
+        if checkers[0].catalog is not None:
+            target.office_strategy.resolve(checkers[0].catalog)
 
+    def on_result(target: MonitorTarget, checker: "AppointmentChecker", available: bool) -> bool:
+        if available:
+            book_if_wanted(checker, parsed_args.booking, f"{target.name}: ")
+        if history is not None:
+            return record_check(history, checker, target.intention_strategy, available, f"{target.name}: ")
+        if not available:
+            print_with_time(f"{target.name}: No appointment available" + latency_breakdown(checker))
+        return available
 
-def run_manual_mode(checker: AppointmentChecker, intention_strategy: IntentionSelectionStrategy,
+    async def alarm(target: MonitorTarget, checker: "AppointmentChecker"):
+        print_with_time(f"{target.name}: Appointments available")
+        # the other targets are checked while waiting for the acknowledgement
+        await asyncio.to_thread(alert_and_wait, notifier, appointments_notification(checker, f"{target.name}: "))
+
+    def next_interval() -> float:
+        # the next check runs on whichever checker the budget lets through first
+        return max(seconds_until_next_check(schedule=parsed_args.schedule),
+                   min(seconds_until_budget(checker) for checker in checkers))
+
+    try:
+        asyncio.run(monitor_targets(targets, checkers, on_result, alarm, next_interval,
+                                    on_blocked=lambda target, e: print_with_time(f"{target.name}: Blocked: {e}")))
+    finally:
+        for tabbed_browser in tabbed_browsers:
+            tabbed_browser.quit()
+
+
+def run_manual_mode(checker: "AppointmentChecker", intention_strategy: IntentionSelectionStrategy,
                     form_values: FormValues = form_values):
     while True:
         checker.check_citas_available(form_values, ManualOfficeSelectionStrategy(), intention_strategy)
         input("Please press Enter to continue...")
 
 
-def run_check_all_offices(checker: AppointmentChecker, intention_strategy: IntentionSelectionStrategy,
-                          form_values: FormValues = form_values):
-    dfs_strategy = DFSOfficeSelectionStrategy()
+def print_office_result(result: "OfficeResult"):
+    if not result.intention_available:
+        print(f"{result.province} has no proper NIE assignment option")
+    elif result.office is None:
+        print(f"{result.province} has no appointments.")
+    elif result.appointments:
+        print(f"{result.province} – {result.office} has appointments:")
+        for appointment in result.appointments:
+            print("\t" + appointment.strftime("%a %Y-%m-%d %H:%M:%S"))
+    else:
+        print(f"{result.province} – {result.office} has no appointments.")
+
+
+def record_office_result(history: AppointmentHistory, result: "OfficeResult",
+                         intention_strategy: IntentionSelectionStrategy):
+    intention = intention_name(intention_strategy)
+    if result.office is None:
+        history.record_no_appointments(result.province, intention)
+    else:
+        history.record(Target(result.province, result.office, intention), result.appointments)
+
+
+def run_check_all_offices(checker: "AppointmentChecker", intention_strategy: IntentionSelectionStrategy,
+                          form_values: FormValues = form_values, checkpoint: "CrawlCheckpoint" = None,
+                          history: AppointmentHistory = None, writer: "ResultWriter" = None,
+                          scores: "OfficeScores" = None, exploration: float = 0.1, stop_after_hits: int = None):
+    """Checks the likeliest offices first if scores are given, and stops after the given number of offices with
+    appointments.
+    """
+    from niescraper.checkpoint import checkpointed
+    from niescraper.crawl import crawl_offices, until_hits
+
+    if checkpoint is None:
+        dfs_strategy = DFSOfficeSelectionStrategy(scores=scores, exploration=exploration)
+        results = crawl_offices(checker, dfs_strategy, intention_strategy, form_values)
+    else:
+        dfs_strategy = DFSOfficeSelectionStrategy(set(checkpoint.finished_offices),
+                                                  set(checkpoint.finished_provinces), scores=scores,
+                                                  exploration=exploration)
+        results = checkpointed(crawl_offices(checker, dfs_strategy, intention_strategy, form_values), checkpoint,
+                               dfs_strategy.finished_offices, dfs_strategy.finished_provinces)
+    for result in until_hits(results, stop_after_hits):
+        if history is not None:
+            record_office_result(history, result, intention_strategy)
+        if writer is not None:
+            writer.write(result)
+        else:
+            print_office_result(result)
+            sys.stdout.flush()
+
+
+def run_check_all_offices_in_pool(workers: int, intention_strategy: IntentionSelectionStrategy,
+                                  form_values: FormValues = form_values,
+                                  checker_type: Type["AppointmentChecker"] = None,
+                                  profile: DriverProfile = None, pacing: Pacing = None, catalog: Catalog = None,
+                                  checkpoint: "CrawlCheckpoint" = None, history: AppointmentHistory = None,
+                                  writer: "ResultWriter" = None, scores: "OfficeScores" = None,
+                                  exploration: float = 0.1, stop_after_hits: int = None,
+                                  on_browser_restart: Callable[[BaseException], None] = None,
+                                  settings: "WorkerSettings" = None):
+    """Prints a report sorted by office once all workers are done, or writes the results as they come in."""
+    from niescraper.appointmentchecker import AppointmentChecker
+    from niescraper.crawl import until_hits
+    from niescraper.pool import crawl_offices_in_pool, WorkerSettings
+
+    if checker_type is None:
+        checker_type = AppointmentChecker
+    if settings is None:
+        settings = WorkerSettings()
+    results = []
+    for result in until_hits(crawl_offices_in_pool(workers, intention_strategy, form_values, checker_type, profile,
+                                                   pacing, catalog, checkpoint, scores, exploration,
+                                                   on_browser_restart, settings),
+                             stop_after_hits):
+        if history is not None:
+            record_office_result(history, result, intention_strategy)
+        if writer is not None:
+            writer.write(result)
+            continue
+        print_with_time(f"Checked {result.province} – {result.office or 'all offices'}")
+        results.append(result)
+
+    # merge the results of all workers into a single report
+    results.sort(key=lambda result: (result.province, result.office or ""))
+    for result in results:
+        print_office_result(result)
+    sys.stdout.flush()
+
+
+def run_alloffices_mode(checker: "AppointmentChecker", parsed_args, history: AppointmentHistory = None):
+    from niescraper.checkpoint import CrawlCheckpoint
+    from niescraper.officescore import OfficeScores
+    from niescraper.pool import WorkerSettings
+    from niescraper.resultwriter import open_result_writer
+
+    checkpoint = CrawlCheckpoint(parsed_args.checkpoint, parsed_args.resume)
+    writer = open_result_writer(parsed_args.format, parsed_args.output) if parsed_args.format != "text" else None
+    # the offices are ordered by what the history tells about them
+    scores = None
+    if history is not None:
+        scores = OfficeScores.from_history(history, intention_name(parsed_args.intention_strategy))
+    crawl_options = dict(checkpoint=checkpoint, history=history, writer=writer, scores=scores,
+                         exploration=parsed_args.exploration, stop_after_hits=parsed_args.stop_after_hits)
     try:
-        while True:
-            try:
-                if checker.check_citas_available(form_values, dfs_strategy, intention_strategy):
-                    appointments = list(scrape_appointments(checker.driver))
-                    if appointments:
-                        print(f"{dfs_strategy.last_province} – {dfs_strategy.last_office} has appointments:")
-                        appointments.sort()
-                        for appointment in appointments:
-                            print("\t" + appointment.strftime("%a %Y-%m-%d %H:%M:%S"))
-                        continue
-                print(f"{dfs_strategy.last_province} – {dfs_strategy.last_office} has no appointments.")
-                dfs_strategy.notify_about_no_appointments_for_last_selection()
-            except DFSOfficeSelectionStrategy.NoMoreOfficesException:
-                pass
-            except NoSuchElementException:
-                print(f"{dfs_strategy.last_province} has no proper NIE assignment option")
-                dfs_strategy.notify_about_no_appointments_for_last_selection()
+        if parsed_args.workers > 1:
+            run_check_all_offices_in_pool(parsed_args.workers, parsed_args.intention_strategy,
+                                          checker_type=type(checker), profile=checker.profile, pacing=checker.pacing,
+                                          catalog=checker.catalog, on_browser_restart=checker.on_browser_restart,
+                                          settings=WorkerSettings(parsed_args.request_rate,
+                                                                  parsed_args.session_request_rate,
+                                                                  parsed_args.recycle_after,
+                                                                  parsed_args.max_browser_memory,
+                                                                  parsed_args.standby_browser,
+                                                                  parsed_args.instrument, report_block),
+                                          **crawl_options)
+        else:
+            run_check_all_offices(checker, parsed_args.intention_strategy, **crawl_options)
+    finally:
+        checkpoint.close()
+        if writer is not None:
+            writer.close()
+
+
+def run_coordinator_mode(parsed_args, history: AppointmentHistory = None):
+    """Hands out the offices to workers on other hosts until all of them are checked, and reports the results as the
+    workers send them in.
+    """
+    import queue
+    from niescraper.coordinator import CoordinatorServer
+    from niescraper.resultwriter import open_result_writer
+    from niescraper.workqueue import WorkQueue
+
+    intention = intention_name(parsed_args.intention_strategy)
+    work_queue = WorkQueue(parsed_args.queue, parsed_args.lease, parsed_args.max_attempts)
+    writer = open_result_writer(parsed_args.format, parsed_args.output) if parsed_args.format != "text" else None
+    reported: "queue.Queue[OfficeResult]" = queue.Queue()
+
+    def report(result: "OfficeResult"):
+        if history is not None:
+            record_office_result(history, result, parsed_args.intention_strategy)
+        if writer is not None:
+            writer.write(result)
+        else:
+            print_office_result(result)
             sys.stdout.flush()
-    except DFSOfficeSelectionStrategy.NoMoreProvincesException:
-        pass
 
+    def on_results(results: List["OfficeResult"]):
+        for result in results:
+            reported.put(result)
 
-def run():
     try:
-        checker = AppointmentChecker()
+        if not work_queue.seed(intention):
+            # the results of the previous runs come first, as when resuming from a checkpoint
+            for result in work_queue.results(intention):
+                report(result)
+        with CoordinatorServer(work_queue, parsed_args.host, parsed_args.port, on_results) as server:
+            if writer is None:
+                print_with_time(f"Waiting for workers at {server.url}")
+            while not work_queue.finished(intention):
+                try:
+                    report(reported.get(timeout=1))
+                except queue.Empty:
+                    pass
+        # the results of the last requests are only queued once the server is closed
+        while not reported.empty():
+            report(reported.get())
+        if writer is None:
+            for unit, error in work_queue.failed(intention):
+                print(f"Gave up on {unit.province or 'the first province'} – {unit.office or 'all offices'}: {error}")
+    finally:
+        work_queue.close()
+        if writer is not None:
+            writer.close()
 
+
+def run_worker_mode(checker: "AppointmentChecker", parsed_args):
+    import os
+    import socket
+    from niescraper.coordinator import CoordinatorClient, work
+
+    client = CoordinatorClient(parsed_args.coordinator, parsed_args.name or f"{socket.gethostname()}-{os.getpid()}")
+    try:
+        for result in work(client, checker, parsed_args.intention_strategy, form_values):
+            print_with_time(f"Checked {result.province} – {result.office or 'all offices'}"
+                            + (f": {len(result.appointments)} appointments" if result.appointments else ""))
+    except OSError as e:
+        # the coordinator stops serving once all offices are checked
+        print_with_time(f"Cannot reach the coordinator at {client.url}: {e}")
+
+
+def run_page_load_report(parsed_args):
+    profiles = {}
+    for browser in parsed_args.browsers or [parsed_args.browser]:
+        profiles[f"{browser} default"] = DriverProfile(headless=parsed_args.headless, browser=browser)
+        profiles[f"{browser} lean"] = DriverProfile.lean(headless=parsed_args.headless, browser=browser)
+    print_page_load_report(profiles, url, parsed_args.repetitions)
+
+
+def run():
+    try:
         parser = argparse.ArgumentParser(description="Check for available appointments at the Spanish government")
 
         intention_group = parser.add_mutually_exclusive_group(required=True)
@@ -113,17 +567,131 @@ def run():
                                      dest="intention_strategy", action="store_const",
                                      const=find_register_eu_citizen_option)
 
-        parser.add_argument("--slow", action="store_true", help="Wait a second before submitting a page")
+        parser.add_argument("--slow", action="store_true", help="Stay on every page for at least two seconds")
+        parser.add_argument("--step-delay", action="append", default=[], metavar="STEP=SECONDS",
+                            help="Stay on the page of a step for at least the given time. "
+                                 f"The steps are: {', '.join(steps)}")
+        parser.add_argument("--engine", choices=engines, default="selenium",
+                            help="Check with the browser only, or with plain HTTP requests first and with the "
+                                 "browser only if there seem to be appointments (default: %(default)s)")
+        parser.add_argument("--catalog", metavar="FILE",
+                            help="Cache the provinces, offices and trámites in this file")
+        parser.add_argument("--catalog-ttl", type=float, default=7 * 24, metavar="HOURS",
+                            help="Read cached options from the page again after this time (default: %(default)s)")
+        parser.add_argument("--history", metavar="FILE",
+                            help="Store the found appointments in this database and only alarm about new ones")
+        parser.add_argument("--release-time", action="append", default=[], metavar="HH:MM[-HH:MM/MINUTES]",
+                            help="When new appointments are released, in Spanish time "
+                                 "(default: 08:00-10:45/15, i.e. every quarter hour)")
+        parser.add_argument("--instrument", metavar="FILE",
+                            help="Time the steps of every check, write them to this JSON lines file and print "
+                                 "the times with every result")
+        parser.add_argument("--recycle-after", type=int, metavar="CHECKS",
+                            help="Replace the browser after this number of checks")
+        parser.add_argument("--max-browser-memory", type=float, metavar="MB",
+                            help="Replace the browser once it uses more memory than this (only on Linux)")
+        parser.add_argument("--standby-browser", action="store_true",
+                            help="Keep a second browser running to replace the current one without delay")
+        parser.add_argument("--request-rate", type=float, default=180, metavar="PER_MINUTE",
+                            help="Send at most this many page requests per minute to the site, and halve the rate "
+                                 "whenever the site blocks them (default: %(default)s)")
+        parser.add_argument("--session-request-rate", type=float, default=120, metavar="PER_MINUTE",
+                            help="Send at most this many page requests per minute per browser or HTTP session "
+                                 "(default: %(default)s)")
+        parser.add_argument("--no-sound", action="store_true", help="Do not play an alarm sound")
+        parser.add_argument("--desktop-notifications", action="store_true",
+                            help="Show a desktop notification when appointments are available")
+        parser.add_argument("--webhook", metavar="URL", help="Post the notifications as JSON to this URL")
+        parser.add_argument("--notification-file", metavar="FILE",
+                            help="Append the notifications as JSON lines to this file")
+        parser.add_argument("--browser", choices=browsers, default="firefox",
+                            help="Control Firefox through geckodriver or Chromium through the DevTools protocol "
+                                 "(default: %(default)s)")
+        parser.add_argument("--headless", action="store_true", help="Do not show the browser window")
+        parser.add_argument("--book", action="store_true",
+                            help="Book the earliest appointment that matches the --book-* limits as soon as a check "
+                                 "finds appointments")
+        parser.add_argument("--book-times", metavar="HH:MM-HH:MM",
+                            help="Only book appointments at these times of the day, e.g. 09:00-12:30")
+        parser.add_argument("--book-weekdays", metavar="DAYS",
+                            help="Only book appointments on these days, e.g. mon,wed")
+        parser.add_argument("--book-from", metavar="YYYY-MM-DD", help="Only book appointments on or after this day")
+        parser.add_argument("--book-until", metavar="YYYY-MM-DD", help="Only book appointments on or before this day")
+        parser.add_argument("--lean", action="store_true",
+                            help="Do not load images, stylesheets, fonts and third-party resources")
 
         mode_parsers = parser.add_subparsers(required=True, dest="mode", title="mode")
         mode_parsers.add_parser("manual", help="Select offices manually") \
             .set_defaults(mode=lambda parsed_args: run_manual_mode(checker, parsed_args.intention_strategy))
-        mode_parsers.add_parser("alloffices", help="List all appointments for all offices") \
-            .set_defaults(mode=lambda parsed_args: run_check_all_offices(checker, parsed_args.intention_strategy))
+        alloffices_parser = mode_parsers.add_parser("alloffices", help="List all appointments for all offices")
+        alloffices_parser.add_argument("--workers", type=int, default=1,
+                                       help="Number of browsers checking offices in parallel")
+        alloffices_parser.add_argument("--checkpoint", default="alloffices-checkpoint.jsonl", metavar="FILE",
+                                       help="Record the progress in this file (default: %(default)s)")
+        alloffices_parser.add_argument("--resume", action="store_true",
+                                       help="Continue the crawl recorded in the checkpoint file")
+        alloffices_parser.add_argument("--format", choices=("text", "jsonl", "csv"), default="text",
+                                       help="Print a report, or write a JSON line or CSV row per office as soon as "
+                                            "it is checked (default: %(default)s)")
+        alloffices_parser.add_argument("--output", metavar="FILE",
+                                       help="Write the JSON lines or CSV rows to this file instead of stdout")
+        alloffices_parser.add_argument("--stop-after-hits", type=int, metavar="N",
+                                       help="Stop once N offices with appointments were found")
+        alloffices_parser.add_argument("--exploration", type=float, default=0.1, metavar="P",
+                                       help="With --history, the likeliest offices are checked first, except that "
+                                            "a random office is picked with this probability (default: %(default)s)")
+        alloffices_parser.set_defaults(mode=lambda parsed_args: run_alloffices_mode(checker, parsed_args, history))
+        coordinator_parser = mode_parsers.add_parser("coordinator",
+                                                     help="Hand out all offices to workers on other hosts and list "
+                                                          "the appointments they find")
+        coordinator_parser.add_argument("--queue", default="alloffices-queue.sqlite", metavar="FILE",
+                                        help="Keep the offices and results in this database, so that the crawl can "
+                                             "be continued after a restart (default: %(default)s)")
+        coordinator_parser.add_argument("--host", default="0.0.0.0",
+                                        help="Listen on this address (default: %(default)s)")
+        coordinator_parser.add_argument("--port", type=int, default=8750,
+                                        help="Listen on this port (default: %(default)s)")
+        coordinator_parser.add_argument("--lease", type=float, default=5 * 60, metavar="SECONDS",
+                                        help="Hand an office out again if its worker did not report back within "
+                                             "this time (default: %(default)s)")
+        coordinator_parser.add_argument("--max-attempts", type=int, default=3,
+                                        help="Give up on an office after this many failed checks "
+                                             "(default: %(default)s)")
+        coordinator_parser.add_argument("--format", choices=("text", "jsonl", "csv"), default="text",
+                                        help="Print the results, or write them as JSON lines or CSV rows "
+                                             "(default: %(default)s)")
+        coordinator_parser.add_argument("--output", metavar="FILE",
+                                        help="Write the JSON lines or CSV rows to this file instead of stdout")
+        coordinator_parser.set_defaults(mode=lambda parsed_args: run_coordinator_mode(parsed_args, history))
+        worker_parser = mode_parsers.add_parser("worker", help="Check the offices handed out by a coordinator")
+        worker_parser.add_argument("coordinator", metavar="URL", help="The coordinator, e.g. http://10.0.0.2:8750")
+        worker_parser.add_argument("--name", help="Name of this worker for the coordinator (default: host and process)")
+        worker_parser.set_defaults(mode=lambda parsed_args: run_worker_mode(checker, parsed_args))
+        load_timing_parser = mode_parsers.add_parser("loadtiming",
+                                                     help="Compare page load times of the default and lean browser")
+        load_timing_parser.add_argument("--repetitions", type=int, default=5,
+                                        help="Page loads per browser profile (default: %(default)s)")
+        load_timing_parser.add_argument("--browsers", nargs="+", choices=browsers, metavar="BROWSER",
+                                        help="Compare these browsers instead of the one chosen with --browser")
+        load_timing_parser.set_defaults(mode=run_page_load_report)
         endless_parser = mode_parsers.add_parser("endless", help="Keep checking for appointments in an endless loop")
-        endless_parser.set_defaults(mode=lambda parsed_args: keep_checking(checker,
-                                                                           parsed_args.office_strategy(parsed_args),
-                                                                           parsed_args.intention_strategy))
+        endless_parser.add_argument("--at-releases", action="store_true",
+                                    help="Fill in the forms ahead of every release and ask for appointments exactly "
+                                         "at the release on the server clock")
+        endless_parser.add_argument("--lead", type=float, default=30, metavar="SECONDS",
+                                    help="Start filling in the forms this long before a release (default: %(default)s)")
+        endless_parser.set_defaults(mode=lambda parsed_args: run_endless_mode(checker, parsed_args, history,
+                                                                                     notifier))
+        monitor_parser = mode_parsers.add_parser("monitor", help="Keep checking several targets in an endless loop")
+        monitor_parser.add_argument("targets", metavar="TARGETS_FILE",
+                                    help="JSON file with the offices, trámites and applicant data to check")
+        monitor_parser.add_argument("--drivers", type=int, default=2,
+                                    help="Number of browsers shared by the targets (default: %(default)s)")
+        monitor_parser.add_argument("--tabs", type=int, default=1,
+                                    help="Check this many targets at once in tabs of each browser, so that one tab "
+                                         "goes on while another waits for the site (default: %(default)s)")
+        monitor_parser.set_defaults(mode=lambda parsed_args: run_monitor_mode(parsed_args, create_checker, history,
+                                                                              notifier, profile))
         office_parsers = endless_parser.add_subparsers(title="office selection mode",
                                                        required=True)
         office_parsers.add_parser("nearvalencia", help="The office in Valencia nearest to the city is chosen") \
@@ -136,8 +704,65 @@ def run():
                                                                                                 parsed_args.office))
 
         args = parser.parse_args()
-        checker.slow = args.slow
-        args.mode(args)
+        try:
+            args.schedule = ReleaseSchedule.parse(args.release_time) if args.release_time else default_schedule
+        except ValueError as e:
+            parser.error(f"Invalid release time: {e}")
+        try:
+            args.booking = SlotPreference.parse(args.book_times, args.book_weekdays, args.book_from,
+                                                args.book_until) if args.book else None
+        except ValueError as e:
+            parser.error(f"Invalid booking preference: {e}")
+        try:
+            pacing = (Pacing.human() if args.slow else Pacing()).with_step_delays(args.step_delay)
+        except ValueError as e:
+            parser.error(f"Invalid step delay: {e}")
+        if getattr(args, "targets", None) is not None:
+            from niescraper.monitor import load_targets
+            try:
+                args.loaded_targets = load_targets(args.targets)
+            except (OSError, ValueError, KeyError) as e:
+                parser.error(f"Invalid targets file: {e}")
+        from niescraper.driverlifecycle import DriverLifecycle
+        from niescraper.instrumentation import CheckInstrumentation
+
+        profile = DriverProfile.lean(args.headless, args.browser) if args.lean \
+            else DriverProfile(headless=args.headless, browser=args.browser)
+        catalog = Catalog(args.catalog, args.catalog_ttl * 60 * 60) if args.catalog else None
+        history = AppointmentHistory(args.history) if args.history else None
+        sinks = [] if args.no_sound else [SoundSink()]
+        if args.desktop_notifications:
+            sinks.append(DesktopSink())
+        if args.webhook:
+            sinks.append(WebhookSink(args.webhook))
+        if args.notification_file:
+            sinks.append(FileSink(args.notification_file))
+        notifier = NotificationDispatcher(sinks)
+        # shared by all checkers of this process; the workers of the alloffices pool build budgets of their own
+        budget = RequestBudget(args.request_rate, args.session_request_rate, on_block=report_block)
+
+        instrumentations = []
+
+        def create_checker(lifecycle: DriverLifecycle = None) -> "AppointmentChecker":
+            instrumentation = None
+            if args.instrument:
+                instrumentation = CheckInstrumentation(args.instrument)
+                instrumentations.append(instrumentation)
+            # the driver is a tab of a shared browser if the lifecycle of the tab is given
+            if lifecycle is None:
+                lifecycle = DriverLifecycle(profile.create_driver, args.recycle_after, args.max_browser_memory,
+                                            args.standby_browser)
+            return checker_class(args.engine)(profile=profile, pacing=pacing, catalog=catalog,
+                                              instrumentation=instrumentation, lifecycle=lifecycle, budget=budget,
+                                              on_browser_restart=report_browser_restart)
+
+        checker = create_checker()
+        try:
+            args.mode(args)
+        finally:
+            for instrumentation in instrumentations:
+                if instrumentation.last_record is not None:
+                    print("\n".join(instrumentation.summary_lines()))
     except KeyboardInterrupt:
         pass
 
@@ -1,206 +1,369 @@
-import abc
-from enum import auto, unique, Enum
-from time import sleep
-from typing import List, Callable, Dict, Optional, Mapping, Iterator
-
-from selenium import webdriver
-from selenium.common.exceptions import NoSuchElementException, StaleElementReferenceException
-from selenium.webdriver.common.by import By
-from selenium.webdriver.remote.webdriver import WebDriver
-from selenium.webdriver.remote.webelement import WebElement
-
-url = "https://icp.administracionelectronica.gob.es/icpplus/index.html"
-
-
-class OfficeSelectionStrategy(abc.ABC):
-    @abc.abstractmethod
-    def select_province(self, provinces: List[WebElement]) -> None:
-        pass
-
-    @abc.abstractmethod
-    def select_office(self, offices: List[WebElement]) -> None:
-        pass
-
-    def pre_select_office(self, offices: List[WebElement]) -> None:
-        """Selects an office right after selecting the province.
-        This can be useful for appointments that require a specific office, e.g. registration as EU citizen.
-        Otherwise, this method can just do nothing and let select_office() handle the selection later.
-        """
-        pass
-
-
-IntentionSelectionStrategy = Callable[[List[WebElement]], WebElement]
-
-
-@unique
-class FormField(Enum):
-    PassportId = auto()
-    NieNumber = auto()
-    Name = auto()
-    YearOfBirth = auto()
-    NativeCountry = auto()
-    PhoneNumber = auto()
-    Email = auto()
-    AdditionalNotes = auto()
-
-
-@unique
-class IdentificationMethod(Enum):
-    ByDNI = "rdbTipoDocDni"
-    ByNIE = "rdbTipoDocNie"
-    ByPassport = "rdbTipoDocPas"
-
-
-class FormValues(Mapping[FormField, Optional[str]]):
-    def __init__(self, identification_method: IdentificationMethod, data: Dict[FormField, str] = None):
-        if data is None:
-            data = dict()
-        self.identification_method = identification_method
-        self._data = data
-
-    @property
-    def identifier(self) -> Optional[str]:
-        if self.identification_method is IdentificationMethod.ByDNI:
-            return self[FormField.PassportId]
-        elif self.identification_method is IdentificationMethod.ByNIE:
-            return self[FormField.NieNumber]
-        elif self.identification_method is IdentificationMethod.ByPassport:
-            return self[FormField.PassportId]
-        raise NotImplementedError(f"Identifier deviation for {self.identification_method} not implemented")
-
-    def __getitem__(self, k: FormField) -> Optional[str]:
-        return self._data.get(k, None)
-
-    def __len__(self) -> int:
-        return len(self._data)
-
-    def __iter__(self) -> Iterator[FormField]:
-        return self._data.__iter__()
+import contextlib
+from typing import List, Callable, Dict, Optional, TypeVar, Tuple
+
+from selenium.common.exceptions import NoSuchElementException, TimeoutException
+
+from niescraper.appointmentscraper import scrape_slots_from_html
+from niescraper.booking import SlotPreference, Booking, NoAcceptableSlotException, BookingFailedException
+from niescraper.browserbackend import BrowserBackend
+from niescraper.browserprofile import DriverProfile
+from niescraper.catalog import Catalog
+from niescraper.driverlifecycle import DriverLifecycle, is_browser_failure
+from niescraper.forms import url, OfficeSelectionStrategy, IntentionSelectionStrategy, FormField, \
+    IdentificationMethod, FormValues, intention_name, is_intention_option
+from niescraper.instrumentation import CheckInstrumentation
+from niescraper.options import Option, read_options, normalize_option_text
+from niescraper.readiness import Pacing, PageTimer, element_clickable, element_present, mark_page, page_replaced, \
+    result_state, booking_reference
+from niescraper.requestbudget import RequestBudget, BlockedException, block_reason
+
+T = TypeVar('T')
+
+# clicks the element that selects an appointment, i.e. its radio button or its link
+_select_slot_script = """
+var element = document.querySelector(arguments[0]);
+if (!element) {
+    return false;
+}
+element.click();
+return true;
+"""
 
 
 class AppointmentChecker:
-    def __init__(self, slow: bool = False):
-        self.slow = slow
-        self._driver: Optional[WebDriver] = None
+    def __init__(self, slow: bool = False, profile: DriverProfile = None, pacing: Pacing = None,
+                 catalog: Catalog = None, start_url: str = url, instrumentation: CheckInstrumentation = None,
+                 lifecycle: DriverLifecycle = None, budget: RequestBudget = None,
+                 on_browser_restart: Callable[[BaseException], None] = None):
+        self.start_url = start_url
+        # told about the failure before a failed browser is replaced and the check is repeated
+        self.on_browser_restart = on_browser_restart
+        # paces the page requests and detects block pages, if given
+        self.budget = budget
+        self.instrumentation = instrumentation
+        self.catalog = catalog
+        self.profile = profile if profile is not None else DriverProfile()
+        self.lifecycle = lifecycle if lifecycle is not None else DriverLifecycle(self.profile.create_driver)
+        if pacing is None:
+            pacing = Pacing.human() if slow else Pacing()
+        self.pacing = pacing
+        self._driver: Optional[BrowserBackend] = None
+        self._page_timer = PageTimer()
+        # normalized country name -> value of the native country option
+        self._country_values: Dict[str, str] = {}
+        # the options selected during the last check, if they were selected automatically
+        self.last_province: Optional[Option] = None
+        self.last_office: Optional[Option] = None
+        # the booking made on the page of the last check, if any
+        self.last_booking: Optional[Booking] = None
 
     @property
-    def driver(self) -> WebDriver:
-        if self._driver is not None:
-            return self._driver
-        driver = webdriver.Firefox()
-        self._driver = driver
+    def driver(self) -> BrowserBackend:
+        driver = self.lifecycle.driver
+        if driver is not self._driver:
+            if self.instrumentation is not None:
+                self.instrumentation.wrap(driver)
+            self._driver = driver
         return driver
 
-    def _wait_if_slow(self):
-        if self.slow:
-            sleep(2)
-
-    def _scroll_into_view(self, element):
-        # sometimes the cookie banner is in the way; do not accept or rate limits will apply
+    def _wait(self, step: str, condition: Callable[[BrowserBackend], T], timeout: float = None) -> T:
+        if timeout is None:
+            timeout = self.pacing[step].timeout
         try:
-            cookie_element = self.driver.find_element(value="cookie-law-info-bar")
-            self.driver.execute_script("arguments[0].remove();", cookie_element)
-        except NoSuchElementException:
-            pass
-        self.driver.execute_script("arguments[0].scrollIntoView(true);", element)
-
-    def _scroll_and_click(self, element):
-        self._scroll_into_view(element)
-        element.click()
-
-    def _fill_input_if_present(self, input_id: str, value: Optional[str]):
-        if not value:
+            return self.driver.wait(condition, timeout, self.pacing.poll_interval,
+                                    f"Timed out waiting for the {step} page")
+        except TimeoutException as e:
+            # a block page has none of the elements that are waited for
+            reason = self._block_reason()
+            if reason is not None:
+                self.budget.record_block(reason)
+                raise BlockedException(f"{step} page: {reason}") from e
+            raise
+
+    def _block_reason(self) -> Optional[str]:
+        if self.budget is None:
+            return None
+        return block_reason(self.driver.execute_script("return document.body ? document.body.textContent : '';")
+                            or "")
+
+    def _request(self) -> None:
+        """Waits until the budget allows another page request."""
+        if self.budget is None:
             return
+        waited = self.budget.acquire(self, self.start_url)
+        if waited and self.instrumentation is not None:
+            self.instrumentation.add_sleep(waited)
+
+    def _enter_step(self, step: str) -> None:
+        if self.instrumentation is not None:
+            self.instrumentation.enter_step(step)
+
+    @contextlib.contextmanager
+    def _recording_errors(self):
         try:
-            self.driver.find_element(value=input_id).send_keys(value)
-        except NoSuchElementException:
-            pass
+            yield
+        except Exception as e:
+            if self.instrumentation is not None:
+                self.instrumentation.finish_check(*self._selection_texts(), error=e)
+            raise
+
+    def _selection_texts(self) -> Tuple[Optional[str], Optional[str]]:
+        return (self.last_province.text if self.last_province is not None else None,
+                self.last_office.text if self.last_office is not None else None)
+
+    def _wait_for_page(self, step: str, condition: Callable[[BrowserBackend], T]) -> T:
+        self._enter_step(step)
+        result = self._wait(step, condition)
+        self._page_timer.page_ready()
+        if self.budget is not None:
+            self.budget.record_success()
+        return result
+
+    def _click(self, button_id: str):
+        # sometimes the cookie banner is in the way; do not accept or rate limits will apply
+        if self.profile.cookie_banner_in_the_way:
+            self.driver.execute_script("var banner = document.getElementById('cookie-law-info-bar');"
+                                       "if (banner) { banner.remove(); }")
+        self.driver.click(button_id)
+
+    def _submit(self, step: str, button_id: str):
+        """Clicks the button once it can be clicked and waits until the next page has replaced the current one."""
+        self._wait(step, element_clickable(button_id))
+        mark_page(self.driver)
+        slept = self._page_timer.wait_min_delay(self.pacing[step])
+        if slept and self.instrumentation is not None:
+            self.instrumentation.add_sleep(slept)
+        self._request()
+        self._click(button_id)
+        self._wait(step, page_replaced)
 
     def _fill_applicant_data(self, form_values: FormValues):
-        self._scroll_and_click(self.driver.find_element(value=form_values.identification_method.value))
-        self._fill_input_if_present("txtIdCitado", form_values.identifier)
-        self._fill_input_if_present("txtDesCitado", form_values[FormField.Name])
-        self._fill_input_if_present("txtAnnoCitado", form_values[FormField.YearOfBirth])
-        try:
-            countries = self.driver.find_elements(by=By.XPATH,
-                                                  value="//select[@id = 'txtPaisNac']/option[text() != '']")
-            native_country = form_values[FormField.NativeCountry]
-            self._scroll_and_click(next(country for country in countries if
-                                        country.text.lower().strip() == native_country.lower().strip()))
-        except StopIteration:
-            pass
-        self._wait_if_slow()
-        self._scroll_and_click(self.driver.find_element(value="btnEnviar"))
+        self._wait_for_page("applicant", element_clickable("btnEnviar"))
+        values = {
+            form_values.identification_method.value: True,
+            "txtIdCitado": form_values.identifier,
+            "txtDesCitado": form_values[FormField.Name],
+            "txtAnnoCitado": form_values[FormField.YearOfBirth],
+        }
+        native_country = normalize_option_text(form_values[FormField.NativeCountry] or "")
+        if native_country in self._country_values:
+            values["txtPaisNac"] = self._country_values[native_country]
+            self.driver.fill(values)
+        else:
+            # the country values are only read once; afterwards, the country is filled in with the other fields
+            countries = self.driver.fill(values, "txtPaisNac") or []
+            self._country_values.update((country.normalized, country.value) for country in countries if country.text)
+            if native_country in self._country_values:
+                self.driver.fill({"txtPaisNac": self._country_values[native_country]})
+        self._submit("applicant", "btnEnviar")
 
     def _fill_additional_info(self, form_values: FormValues):
-        self._fill_input_if_present("txtTelefonoCitado", form_values[FormField.PhoneNumber])
-        self._fill_input_if_present("emailUNO", form_values[FormField.Email])
-        self._fill_input_if_present("emailDOS", form_values[FormField.Email])
-        self._fill_input_if_present("txtObservaciones", form_values[FormField.AdditionalNotes])
-        self._wait_if_slow()
-        self._scroll_and_click(self.driver.find_element(value="btnSiguiente"))
-
-    def _select_province(self, selection_strategy: OfficeSelectionStrategy):
-        def find_provinces():
-            return self.driver.find_elements(by=By.XPATH, value="//select[@id = 'form']/option[@value != '']")
-
-        provinces = find_provinces()
-        if not provinces and \
-                self.driver.find_elements(by=By.XPATH, value="//*[@id='prov_selecc']"):
-            self._scroll_and_click(self.driver.find_element(value="btnVolver"))
-            provinces = find_provinces()
-        selection_strategy.select_province(provinces)
-        self._wait_if_slow()
-        self.driver.find_element(value="btnAceptar").click()
-
-    def check_citas_available(self, form_values: FormValues, office_strategy: OfficeSelectionStrategy,
-                              intention_strategy: IntentionSelectionStrategy):
-        self.driver.get(url)
-        self._select_province(office_strategy)
-        offices = self.driver.find_elements(by=By.XPATH,
-                                            value="//select[@id = 'sede']/optgroup/option[@value != '' and @value != '99']")
-        office_strategy.pre_select_office(offices)
-
-        for attempts in range(5, -1, -1):
+        self._wait_for_page("contact", element_clickable("btnSiguiente"))
+        self.driver.fill({
+            "txtTelefonoCitado": form_values[FormField.PhoneNumber],
+            "emailUNO": form_values[FormField.Email],
+            "emailDOS": form_values[FormField.Email],
+            "txtObservaciones": form_values[FormField.AdditionalNotes],
+        })
+        self._submit("contact", "btnSiguiente")
+
+    def _cataloged(self, kind: str, key: Optional[str]) -> Optional[List[Option]]:
+        if self.catalog is None or key is None:
+            return None
+        return self.catalog.get(kind, key)
+
+    def _catalog(self, kind: str, key: Optional[str], options: List[Option]) -> None:
+        if self.catalog is not None and key is not None:
+            self.catalog.update(kind, options, key)
+
+    def _select_from_catalog(self, kind: str, key: Optional[str], read_live: Callable[[], List[Option]],
+                             choose: Callable[[List[Option]], Optional[Option]],
+                             accept: Callable[[Option], bool]) -> Optional[Option]:
+        """Lets the strategy choose among the cataloged options and selects the choice by value. The live options of
+        the select are read in the same call and merged into the catalog, so that new options are picked up before
+        the entry expires. The strategy chooses again among the live options if its choice is not on the page.
+        """
+        cached = self._cataloged(kind, key)
+        if cached is not None:
+            option = choose(cached)
+            if option is None:
+                return None
+            options = [live for live in self.driver.fill({option.select_id: option.value}, option.select_id) or []
+                       if accept(live)]
+            self._catalog(kind, key, options)
+            if any(live.value == option.value for live in options):
+                return option
+        else:
+            options = read_live()
+            self._catalog(kind, key, options)
+        option = choose(options)
+        self.driver.select_by_value(option)
+        return option
+
+    def _select_province(self, selection_strategy: OfficeSelectionStrategy) -> Optional[Option]:
+        def is_province(option: Option) -> bool:
+            return option.value != ""
+
+        def find_provinces(driver: BrowserBackend) -> List[Option]:
+            return read_options(driver, "select#form option", is_province)
+
+        # the province might still be selected from a previous check
+        ready = self._wait_for_page("province", element_present("select#form option[value]", "#prov_selecc"))
+        if ready == "#prov_selecc":
+            self._submit("province", "btnVolver")
+            self._wait_for_page("province", find_provinces)
+        province = self._select_from_catalog(Catalog.provinces, "", lambda: find_provinces(self.driver),
+                                             selection_strategy.select_province, is_province)
+        self._submit("province", "btnAceptar")
+        return province
+
+    def _select_intention(self, province: Optional[Option], office_strategy: OfficeSelectionStrategy,
+                          intention_strategy: IntentionSelectionStrategy):
+        def is_office(option: Option) -> bool:
+            return option.value not in ("", "99")
+
+        def find_intention_options(driver: BrowserBackend) -> List[Option]:
+            return read_options(driver, "select[id*='tramiteGrupo['] option", is_intention_option)
+
+        def find_intention(driver: BrowserBackend) -> Optional[Option]:
             try:
-                options = self.driver.find_elements(by=By.XPATH, value="//select[contains(@id, 'tramiteGrupo[')]/"
-                                                                       "option[@value >= 0]")
-                self._scroll_and_click(intention_strategy(options))
-                break
-            except (NoSuchElementException, StaleElementReferenceException) as e:
-                if attempts:
-                    sleep(0.1)
-                else:
-                    raise e
-        self._wait_if_slow()
-        self.driver.find_element(value="btnAceptar").click()
-
-        self._wait_if_slow()
-        self._scroll_and_click(self.driver.find_element(value="btnEntrar"))
-
-        self._fill_applicant_data(form_values)
-        self._wait_if_slow()
-        self._scroll_and_click(self.driver.find_element(value="btnEnviar"))
-
-        try:
-            self.driver.find_element(by=By.XPATH,
-                                     value="//*[contains(text(), 'En este momento no hay citas disponibles')]")
-            self._wait_if_slow()
+                return intention_strategy(find_intention_options(driver))
+            except NoSuchElementException:
+                return None
+
+        self._wait_for_page("intention", element_present("select[id*='tramiteGrupo[']"))
+        # without knowing the province, the options of this page cannot be cataloged
+        province_key = province.value if province is not None else None
+        self.last_office = self._select_from_catalog(Catalog.offices, province_key, lambda: read_options(
+            self.driver, "select#sede > optgroup > option", is_office), office_strategy.pre_select_office, is_office)
+
+        intention_key = None
+        if province_key is not None:
+            intention_key = province_key + "/" + intention_name(intention_strategy)
+        cached = self._cataloged(Catalog.intentions, intention_key)
+        if not cached or not self.driver.select_by_value(cached[0]):
+            # the trámites can change after selecting an office
+            try:
+                intention = self._wait("intention", find_intention, timeout=self.pacing.option_timeout)
+            except TimeoutException:
+                # let the strategy tell what it did not find
+                intention = intention_strategy(find_intention_options(self.driver))
+            self.driver.select_by_value(intention)
+            self._catalog(Catalog.intentions, intention_key, [intention])
+        self._submit("intention", "btnAceptar")
+
+    def prepare_check(self, form_values: FormValues, office_strategy: OfficeSelectionStrategy,
+                      intention_strategy: IntentionSelectionStrategy):
+        """Goes through the forms until the button that asks for appointments can be clicked."""
+        self.last_province = self.last_office = None
+        self.last_booking = None
+        if self.instrumentation is not None:
+            self.instrumentation.start_check()
+        with self._recording_errors():
+            self._enter_step("province")
+            self._request()
+            self.driver.navigate(self.start_url)
+            self.last_province = self._select_province(office_strategy)
+            self._select_intention(self.last_province, office_strategy, intention_strategy)
+
+            self._wait_for_page("entrar", element_clickable("btnEntrar"))
+            self._submit("entrar", "btnEntrar")
+
+            self._fill_applicant_data(form_values)
+
+            self._wait_for_page("result", element_clickable("btnEnviar"))
+        if self.instrumentation is not None:
+            self.instrumentation.pause()
+
+    def finish_check(self, form_values: FormValues, office_strategy: OfficeSelectionStrategy) -> bool:
+        """Asks for appointments on the page reached by prepare_check()."""
+        with self._recording_errors():
+            available = self._ask_for_appointments(form_values, office_strategy)
+        if self.instrumentation is not None:
+            self.instrumentation.finish_check(*self._selection_texts(), available=available)
+        # the browser must not be replaced while the user might still need the appointment page
+        if not available:
+            self.lifecycle.check_done()
+        return available
+
+    def _ask_for_appointments(self, form_values: FormValues, office_strategy: OfficeSelectionStrategy) -> bool:
+        self._enter_step("result")
+        self._submit("result", "btnEnviar")
+        state = self._wait_for_page("result", result_state)
+        if state == "none":
             return False
-        except NoSuchElementException:
-            pass
 
-        if self.driver.find_elements(by=By.XPATH, value="//select[@id = 'idSede']"):
-            offices = self.driver.find_elements(by=By.XPATH, value="//select[@id = 'idSede']/option[@value != '']")
-            office_strategy.select_office(offices)
-            self._wait_if_slow()
-            self._scroll_and_click(self.driver.find_element(value="btnSiguiente"))
+        if state == "office":
+            self._enter_step("office")
+            offices = read_options(self.driver, "select#idSede option", lambda option: option.value != "")
+            office = office_strategy.select_office(offices)
+            if office is not None:
+                self.last_office = office
+            self.driver.select_by_value(office)
+            self._submit("office", "btnSiguiente")
 
         self._fill_additional_info(form_values)
-        self._wait_if_slow()
         return True
 
+    def book(self, preference: SlotPreference) -> Booking:
+        """Books the preferred appointment on the page reached by a check that found appointments.
+        The appointments are read from a single snapshot of the page, and every page is submitted as soon as it can
+        be. Raises a NoAcceptableSlotException if no appointment is acceptable, and a BookingFailedException if the
+        site does not confirm the booking.
+        """
+        self._enter_step("slot")
+        slots = list(scrape_slots_from_html(self.driver.snapshot()))
+        slot = preference.choose(slots)
+        if slot is None:
+            raise NoAcceptableSlotException(f"None of the {len(slots)} appointments is acceptable")
+        try:
+            if not self.driver.execute_script(_select_slot_script, slot.selector):
+                raise BookingFailedException(f"Cannot select the appointment at {slot.appointment}")
+            self._submit("slot", "btnSiguiente")
+            self._wait_for_page("confirm", element_clickable("btnConfirmar"))
+            self.driver.fill({"chkTotal": True, "enviarCorreo": True})
+            self._submit("confirm", "btnConfirmar")
+            reference = self._wait("confirm", booking_reference)
+        except (TimeoutException, NoSuchElementException) as e:
+            raise BookingFailedException(f"The appointment at {slot.appointment} was not confirmed") from e
+        finally:
+            if self.instrumentation is not None:
+                self.instrumentation.pause()
+        self.last_booking = Booking(slot.appointment, reference, [offered.appointment for offered in slots])
+        return self.last_booking
+
+    def _prepare_and_finish_check(self, form_values: FormValues, office_strategy: OfficeSelectionStrategy,
+                                  intention_strategy: IntentionSelectionStrategy,
+                                  before_asking: Optional[Callable[[], None]]) -> bool:
+        self.prepare_check(form_values, office_strategy, intention_strategy)
+        if before_asking is not None:
+            before_asking()
+        return self.finish_check(form_values, office_strategy)
+
+    def check_in_browser(self, form_values: FormValues, office_strategy: OfficeSelectionStrategy,
+                         intention_strategy: IntentionSelectionStrategy,
+                         before_asking: Callable[[], None] = None) -> bool:
+        """Checks in the browser and calls before_asking, if given, once appointments can be asked for, e.g. to wait
+        for a release. A failed browser is replaced and the check is repeated once.
+        """
+        try:
+            return self._prepare_and_finish_check(form_values, office_strategy, intention_strategy, before_asking)
+        except Exception as e:
+            if not is_browser_failure(e):
+                raise
+            if self.on_browser_restart is not None:
+                self.on_browser_restart(e)
+            if self.last_office is not None:
+                office_strategy.release_office(self.last_province, self.last_office)
+        # a second failure is not the browser's fault
+        self.lifecycle.recycle()
+        return self._prepare_and_finish_check(form_values, office_strategy, intention_strategy, before_asking)
+
+    def check_citas_available(self, form_values: FormValues, office_strategy: OfficeSelectionStrategy,
+                              intention_strategy: IntentionSelectionStrategy) -> bool:
+        return self.check_in_browser(form_values, office_strategy, intention_strategy)
+
     def __del__(self):
-        if self._driver is not None:
-            self._driver.quit()
-            self._driver = None
+        lifecycle = getattr(self, "lifecycle", None)
+        if lifecycle is not None:
+            lifecycle.quit()
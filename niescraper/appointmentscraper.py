@@ -1,40 +1,140 @@
-from datetime import datetime, date, time
-from typing import Sequence
-
-from selenium.common.exceptions import NoSuchElementException
-from selenium.webdriver.common.by import By
-from selenium.webdriver.firefox.webdriver import WebDriver
-from selenium.webdriver.remote.webelement import WebElement
-
-
-def scrape_appointments(driver: WebDriver) -> Sequence[datetime]:
-    box_appointments = driver.find_elements(by='xpath', value="//label[contains(@id, 'lCita_')]")
-    if box_appointments:
-        return _scrape_box_appointments(box_appointments)
-
-    try:
-        table_appointments = driver.find_element(value="VistaMapa_Datatable")
-        return _scrape_table_appointments(table_appointments)
-    except NoSuchElementException:
-        return []
-
-
-def _scrape_box_appointments(box_appointments: Sequence[WebElement]) -> Sequence[datetime]:
-    for appointment in box_appointments:
-        lines = appointment.text.split('\n', 2)
-        appointment_date = lines[1].split(' ', 1)[1]
-        (day, month, year) = appointment_date.split('/')
-        appointment_time = lines[2].split(' ', 1)[1]
-        (hour, minute) = appointment_time.split(':')
-        yield datetime(int(year), int(month), int(day), int(hour), int(minute))
-
-
-def _scrape_table_appointments(table: WebElement) -> Sequence[datetime]:
-    heads = [th for th in table.find_elements(by=By.TAG_NAME, value='th') if th.text]
-    dates = [datetime.strptime(head.text, '%d/%m/%Y').date() for head in heads]
-    for row in table.find_element(by=By.TAG_NAME, value="tbody").find_elements(by=By.TAG_NAME, value='tr'):
-        tds = row.find_elements(by=By.TAG_NAME, value='td')
-        appointment_time = datetime.strptime(tds[0].text, '%H:%M').time()
-        for appointment_date, td in zip(dates, tds[1:]):
-            if "libre" in td.text.lower():
-                yield datetime.combine(appointment_date, appointment_time)
+import re
+from datetime import datetime
+from html.parser import HTMLParser
+from typing import Iterator, List, Optional, NamedTuple, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from niescraper.browserbackend import BrowserBackend
+
+_date_pattern = re.compile(r"(\d{1,2})/(\d{1,2})/(\d{4})")
+_time_pattern = re.compile(r"(\d{1,2}):(\d{2})")
+
+# elements that start a new line in the rendered text
+_line_breaking_tags = {"br", "p", "div", "li", "tr", "h1", "h2", "h3", "h4", "h5", "h6"}
+
+
+class Slot(NamedTuple):
+    """An offered appointment and the CSS selector of the element that selects it, if there is one."""
+    appointment: datetime
+    selector: Optional[str]
+
+
+class _AppointmentPageParser(HTMLParser):
+    """Collects the texts of the appointment boxes and of the appointment table in a single pass over the page."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.box_texts: List[str] = []
+        # the ids of the radio buttons the boxes are labels for
+        self.box_targets: List[Optional[str]] = []
+        self.table_heads: List[str] = []
+        self.table_rows: List[List[str]] = []
+        self._box_depth = 0
+        self._box_parts: List[str] = []
+        self._table_depth = 0
+        self._in_tbody = False
+        self._cell_parts: Optional[List[str]] = None
+        self._cell_is_head = False
+
+    def handle_starttag(self, tag, attrs):
+        if self._box_depth:
+            if tag == "label":
+                self._box_depth += 1
+            if tag in _line_breaking_tags:
+                self._box_parts.append("\n")
+        elif tag == "label" and "lCita_" in (dict(attrs).get("id") or ""):
+            self._box_depth = 1
+            self._box_parts = []
+            self.box_targets.append(dict(attrs).get("for"))
+
+        if self._table_depth:
+            if tag == "table":
+                self._table_depth += 1
+            elif self._table_depth == 1:
+                if tag == "tbody":
+                    self._in_tbody = True
+                elif tag == "tr" and self._in_tbody:
+                    self.table_rows.append([])
+                elif tag in ("th", "td"):
+                    self._finish_cell()
+                    self._cell_parts = []
+                    self._cell_is_head = tag == "th"
+        elif tag == "table" and dict(attrs).get("id") == "VistaMapa_Datatable":
+            self._table_depth = 1
+
+    def handle_endtag(self, tag):
+        if self._box_depth and tag == "label":
+            self._box_depth -= 1
+            if not self._box_depth:
+                self.box_texts.append("".join(self._box_parts))
+
+        if self._table_depth:
+            if tag == "table":
+                self._table_depth -= 1
+                if not self._table_depth:
+                    self._finish_cell()
+            elif self._table_depth == 1:
+                if tag in ("th", "td", "tr"):
+                    self._finish_cell()
+                elif tag == "tbody":
+                    self._finish_cell()
+                    self._in_tbody = False
+
+    def handle_data(self, data):
+        if self._box_depth:
+            self._box_parts.append(data)
+        if self._cell_parts is not None:
+            self._cell_parts.append(data)
+
+    def _finish_cell(self):
+        if self._cell_parts is None:
+            return
+        text = " ".join("".join(self._cell_parts).split())
+        if self._cell_is_head and text:
+            self.table_heads.append(text)
+        if not self._cell_is_head and self._in_tbody and self.table_rows:
+            self.table_rows[-1].append(text)
+        self._cell_parts = None
+
+
+def scrape_appointments(driver: "BrowserBackend") -> Iterator[datetime]:
+    return scrape_appointments_from_html(driver.page_source)
+
+
+def scrape_appointments_from_html(page_source: str) -> Iterator[datetime]:
+    """Yields the available appointments of an appointment page, which shows them either as boxes or in a table."""
+    return (slot.appointment for slot in scrape_slots_from_html(page_source))
+
+
+def scrape_slots_from_html(page_source: str) -> Iterator[Slot]:
+    """Like scrape_appointments_from_html(), but yields how to select every appointment as well."""
+    parser = _AppointmentPageParser()
+    parser.feed(page_source)
+    parser.close()
+
+    if parser.box_texts:
+        return _scrape_box_slots(parser.box_texts, parser.box_targets)
+    if parser.table_heads or parser.table_rows:
+        return _scrape_table_slots(parser.table_heads, parser.table_rows)
+    return iter([])
+
+
+def _scrape_box_slots(box_texts: List[str], box_targets: List[Optional[str]]) -> Iterator[Slot]:
+    for text, target in zip(box_texts, box_targets):
+        (day, month, year) = _date_pattern.search(text).groups()
+        (hour, minute) = _time_pattern.search(text).groups()
+        yield Slot(datetime(int(year), int(month), int(day), int(hour), int(minute)),
+                   f'[id="{target}"]' if target else None)
+
+
+def _scrape_table_slots(heads: List[str], rows: List[List[str]]) -> Iterator[Slot]:
+    dates = [datetime.strptime(head, '%d/%m/%Y').date() for head in heads]
+    for row, cells in enumerate(rows, start=1):
+        if not cells:
+            continue
+        appointment_time = datetime.strptime(cells[0], '%H:%M').time()
+        for column, (appointment_date, cell) in enumerate(zip(dates, cells[1:]), start=2):
+            if "libre" in cell.lower():
+                # the link in the cell selects the appointment
+                yield Slot(datetime.combine(appointment_date, appointment_time),
+                           f"#VistaMapa_Datatable > tbody > tr:nth-of-type({row}) > td:nth-of-type({column}) a")
@@ -0,0 +1,75 @@
+import datetime
+from typing import NamedTuple, Optional, List, Collection, Iterable
+
+from niescraper.appointmentscraper import Slot
+
+weekday_names = ("mon", "tue", "wed", "thu", "fri", "sat", "sun")
+
+
+class Booking(NamedTuple):
+    appointment: datetime.datetime
+    # the number of the booking confirmation ("justificante") shown by the site
+    reference: str
+    # all appointments that were offered, read from the same page as the booked one
+    offered: List[datetime.datetime]
+
+
+class NoAcceptableSlotException(Exception):
+    """None of the offered appointments matches the preference."""
+
+
+class BookingFailedException(Exception):
+    """The site did not confirm the booking, e.g. because someone else booked the appointment first."""
+
+
+class SlotPreference:
+    """Which of the offered appointments to book: the earliest one within all given limits.
+    The time window applies to the time of day, the dates to the day of the appointment.
+    """
+
+    def __init__(self, start_time: datetime.time = None, end_time: datetime.time = None,
+                 weekdays: Collection[int] = None, first_date: datetime.date = None, last_date: datetime.date = None):
+        self.start_time = start_time
+        self.end_time = end_time
+        self.weekdays = frozenset(weekdays) if weekdays is not None else None
+        self.first_date = first_date
+        self.last_date = last_date
+
+    @staticmethod
+    def parse(time_window: str = None, weekdays: str = None, first_date: str = None, last_date: str = None) \
+            -> "SlotPreference":
+        """Parses a time window like "09:00-12:30", weekdays like "mon,wed,fri" and dates like "2022-02-01"."""
+        start_time = end_time = None
+        if time_window:
+            start, _, end = time_window.partition("-")
+            start_time = datetime.datetime.strptime(start.strip(), "%H:%M").time() if start.strip() else None
+            end_time = datetime.datetime.strptime(end.strip(), "%H:%M").time() if end.strip() else None
+        days = None
+        if weekdays:
+            days = []
+            for name in weekdays.split(","):
+                name = name.strip().lower()[:3]
+                if name not in weekday_names:
+                    raise ValueError(f"Unknown weekday {name}; the weekdays are {', '.join(weekday_names)}")
+                days.append(weekday_names.index(name))
+        return SlotPreference(start_time, end_time, days,
+                              datetime.date.fromisoformat(first_date) if first_date else None,
+                              datetime.date.fromisoformat(last_date) if last_date else None)
+
+    def accepts(self, appointment: datetime.datetime) -> bool:
+        if self.start_time is not None and appointment.time() < self.start_time:
+            return False
+        if self.end_time is not None and appointment.time() > self.end_time:
+            return False
+        if self.weekdays is not None and appointment.weekday() not in self.weekdays:
+            return False
+        if self.first_date is not None and appointment.date() < self.first_date:
+            return False
+        if self.last_date is not None and appointment.date() > self.last_date:
+            return False
+        return True
+
+    def choose(self, slots: Iterable[Slot]) -> Optional[Slot]:
+        """Returns the earliest acceptable slot that can be selected, or None."""
+        return min((slot for slot in slots if slot.selector is not None and self.accepts(slot.appointment)),
+                   key=lambda slot: slot.appointment, default=None)
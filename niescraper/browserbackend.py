@@ -0,0 +1,76 @@
+import abc
+from time import monotonic, sleep
+from typing import Callable, TypeVar, Optional, Dict, Union, List, Any
+
+from selenium.common.exceptions import NoSuchElementException, TimeoutException
+
+from niescraper.formfill import fill_form
+from niescraper.options import Option, select_option
+
+T = TypeVar('T')
+
+
+class BrowserBackend(abc.ABC):
+    """The commands the checks need from a browser. The forms are read and changed by scripts, so a backend only has
+    to navigate, run scripts, click and quit; everything else is built on top of these.
+    Errors are reported with the exceptions of Selenium, so that all backends fail alike, and every command goes
+    through a method named execute(), which the instrumentation wraps to count them.
+    """
+
+    @abc.abstractmethod
+    def navigate(self, url: str) -> None:
+        """Opens the URL and returns once the page is loaded as far as the page load strategy asks for."""
+        pass
+
+    @abc.abstractmethod
+    def execute_script(self, script: str, *args) -> Any:
+        """Runs the body of a function with the given arguments and returns its result, which must be JSON."""
+        pass
+
+    @abc.abstractmethod
+    def click(self, element_id: str) -> None:
+        """Scrolls the element into view and clicks it. Raises a NoSuchElementException if there is no such element."""
+        pass
+
+    @abc.abstractmethod
+    def quit(self) -> None:
+        pass
+
+    @property
+    def process_id(self) -> Optional[int]:
+        """The process of the browser, if known."""
+        return None
+
+    def open_tab(self) -> "BrowserBackend":
+        """Opens another tab of the browser and returns a backend for it. The backends of the tabs can be used from
+        different threads; quitting one of them only closes its tab.
+        """
+        raise NotImplementedError(f"{type(self).__name__} cannot open tabs")
+
+    def snapshot(self) -> str:
+        return self.execute_script("return document.documentElement.outerHTML;")
+
+    @property
+    def page_source(self) -> str:
+        return self.snapshot()
+
+    def select_by_value(self, option: Optional[Option]) -> bool:
+        return select_option(self, option)
+
+    def fill(self, values: Dict[str, Union[str, bool]], read_options_of: str = None) -> Optional[List[Option]]:
+        return fill_form(self, values, read_options_of)
+
+    def wait(self, condition: Callable[["BrowserBackend"], T], timeout: float, poll_interval: float = 0.05,
+             message: str = "") -> T:
+        """Calls the condition until it returns something truthy, and returns that."""
+        deadline = monotonic() + timeout
+        while True:
+            try:
+                value = condition(self)
+                if value:
+                    return value
+            except NoSuchElementException:
+                pass
+            if monotonic() >= deadline:
+                raise TimeoutException(message)
+            sleep(poll_interval)
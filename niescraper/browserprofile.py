@@ -0,0 +1,213 @@
+import base64
+import json
+import statistics
+import time
+from typing import Sequence, Dict, List, Optional, TYPE_CHECKING
+
+from niescraper.browserbackend import BrowserBackend
+
+if TYPE_CHECKING:
+    from selenium.webdriver.firefox.options import Options as FirefoxOptions
+
+# hosts the appointment flow needs; everything else is third party
+icp_hosts = ("icp.administracionelectronica.gob.es",)
+
+# the preferences in this dict are applied to every profile
+_base_preferences = {
+    # background traffic that does not help checking appointments
+    "app.update.auto": False,
+    "browser.safebrowsing.malware.enabled": False,
+    "browser.safebrowsing.phishing.enabled": False,
+    "browser.safebrowsing.downloads.enabled": False,
+    "datareporting.healthreport.uploadEnabled": False,
+    "datareporting.policy.dataSubmissionEnabled": False,
+    "toolkit.telemetry.enabled": False,
+    "extensions.pocket.enabled": False,
+    "browser.newtabpage.enabled": False,
+    "browser.startup.page": 0,
+}
+
+_prefetch_preferences = {
+    # every check loads the same few pages in order, so guessing what comes next only costs bandwidth
+    "network.prefetch-next": False,
+    "network.dns.disablePrefetch": True,
+    "network.predictor.enabled": False,
+    "network.http.speculative-parallel-limit": 0,
+    "browser.urlbar.speculativeConnect.enabled": False,
+}
+
+_disk_cache_preferences = {
+    # the profile is thrown away with the driver; the memory cache is enough for the scripts shared by the pages
+    "browser.cache.disk.enable": False,
+    "browser.cache.offline.enable": False,
+}
+
+_block_value = 2
+
+browsers = ("firefox", "chromium")
+
+_chromium_base_arguments = (
+    "--no-first-run",
+    "--no-default-browser-check",
+    "--disable-background-networking",
+    "--disable-component-update",
+    "--disable-sync",
+    "--disable-extensions",
+)
+
+# Chromium has no switches to block stylesheets and fonts, so their requests are blocked by URL
+_stylesheet_url_patterns = ("*.css", "*.css?*")
+_font_url_patterns = ("*.woff", "*.woff?*", "*.woff2", "*.woff2?*", "*.ttf", "*.ttf?*", "*.otf", "*.otf?*")
+
+
+class DriverProfile:
+    """Describes how the browser for checking appointments is started."""
+
+    def __init__(self, headless: bool = False, block_images: bool = False, block_stylesheets: bool = False,
+                 block_fonts: bool = False, block_third_party_hosts: bool = False,
+                 allowed_hosts: Sequence[str] = icp_hosts, disable_prefetch: bool = False,
+                 disable_disk_cache: bool = False, page_load_strategy: str = "normal", browser: str = "firefox"):
+        if browser not in browsers:
+            raise ValueError(f"Unknown browser {browser}; the browsers are {', '.join(browsers)}")
+        self.browser = browser
+        self.headless = headless
+        self.block_images = block_images
+        self.block_stylesheets = block_stylesheets
+        self.block_fonts = block_fonts
+        self.block_third_party_hosts = block_third_party_hosts
+        self.allowed_hosts = tuple(allowed_hosts)
+        self.disable_prefetch = disable_prefetch
+        self.disable_disk_cache = disable_disk_cache
+        self.page_load_strategy = page_load_strategy
+
+    @staticmethod
+    def lean(headless: bool = False, browser: str = "firefox") -> "DriverProfile":
+        # "eager" returns as soon as the DOM is ready; the forms do not need images or late scripts
+        return DriverProfile(headless=headless, block_images=True, block_stylesheets=True, block_fonts=True,
+                             block_third_party_hosts=True, disable_prefetch=True, disable_disk_cache=True,
+                             page_load_strategy="eager", browser=browser)
+
+    @property
+    def cookie_banner_in_the_way(self) -> bool:
+        # without stylesheets, the banner is not positioned above the page content
+        return not self.block_stylesheets
+
+    def _proxy_auto_config(self) -> str:
+        # hosts that are not allowed are sent to a proxy that does not exist, so their requests fail immediately
+        script = (f"var allowed = {json.dumps(list(self.allowed_hosts))};"
+                  "function FindProxyForURL(url, host) {"
+                  "  for (var i = 0; i < allowed.length; i++) {"
+                  "    if (host === allowed[i] || dnsDomainIs(host, '.' + allowed[i])) { return 'DIRECT'; }"
+                  "  }"
+                  "  if (isPlainHostName(host) || host === '127.0.0.1') { return 'DIRECT'; }"
+                  "  return 'PROXY 127.0.0.1:9';"
+                  "}")
+        return "data:application/x-ns-proxy-autoconfig;base64," + base64.b64encode(script.encode()).decode()
+
+    def preferences(self) -> Dict[str, object]:
+        preferences = dict(_base_preferences)
+        if self.block_images:
+            preferences["permissions.default.image"] = _block_value
+        if self.block_stylesheets:
+            preferences["permissions.default.stylesheet"] = _block_value
+        if self.block_fonts:
+            preferences["gfx.downloadable_fonts.enabled"] = False
+            preferences["browser.display.use_document_fonts"] = 0
+        if self.block_third_party_hosts:
+            preferences["network.proxy.type"] = 2
+            preferences["network.proxy.autoconfig_url"] = self._proxy_auto_config()
+        if self.disable_prefetch:
+            preferences.update(_prefetch_preferences)
+        if self.disable_disk_cache:
+            preferences.update(_disk_cache_preferences)
+        return preferences
+
+    def firefox_options(self) -> "FirefoxOptions":
+        from selenium.webdriver.firefox.options import Options as FirefoxOptions
+
+        options = FirefoxOptions()
+        if self.headless:
+            options.add_argument("-headless")
+        for name, value in self.preferences().items():
+            options.set_preference(name, value)
+        options.page_load_strategy = self.page_load_strategy
+        return options
+
+    def chromium_arguments(self) -> List[str]:
+        arguments = list(_chromium_base_arguments)
+        if self.headless:
+            arguments.append("--headless=new")
+        if self.block_images:
+            arguments.append("--blink-settings=imagesEnabled=false")
+        if self.block_third_party_hosts:
+            arguments.append("--proxy-pac-url=" + self._proxy_auto_config())
+        if self.disable_prefetch:
+            arguments.append("--dns-prefetch-disable")
+        if self.disable_disk_cache:
+            arguments.append("--disk-cache-size=1")
+        return arguments
+
+    def blocked_url_patterns(self) -> List[str]:
+        """The URLs that Chromium is told to block; Firefox blocks them with preferences instead."""
+        patterns = []
+        if self.block_stylesheets:
+            patterns.extend(_stylesheet_url_patterns)
+        if self.block_fonts:
+            patterns.extend(_font_url_patterns)
+        return patterns
+
+    def create_driver(self) -> BrowserBackend:
+        if self.browser == "chromium":
+            from niescraper.chromiumbackend import ChromiumBackend
+            return ChromiumBackend.launch(self)
+        from niescraper.firefoxbackend import FirefoxBackend
+        return FirefoxBackend(options=self.firefox_options())
+
+
+class PageLoadTiming:
+    def __init__(self, wall_seconds: float, dom_content_loaded_seconds: Optional[float], resources: int):
+        self.wall_seconds = wall_seconds
+        self.dom_content_loaded_seconds = dom_content_loaded_seconds
+        self.resources = resources
+
+
+_navigation_timing_script = """
+var navigation = performance.getEntriesByType('navigation')[0];
+return [navigation ? navigation.domContentLoadedEventEnd / 1000 : null,
+        performance.getEntriesByType('resource').length];
+"""
+
+
+def measure_page_loads(profile: DriverProfile, url: str, repetitions: int = 5) -> List[PageLoadTiming]:
+    driver = profile.create_driver()
+    try:
+        timings = []
+        for _ in range(repetitions):
+            start = time.perf_counter()
+            driver.navigate(url)
+            wall_seconds = time.perf_counter() - start
+            dom_content_loaded, resources = driver.execute_script(_navigation_timing_script)
+            timings.append(PageLoadTiming(wall_seconds, dom_content_loaded, resources))
+        return timings
+    finally:
+        driver.quit()
+
+
+def print_page_load_report(profiles: Dict[str, DriverProfile], url: str, repetitions: int = 5):
+    print(f"Loading {url} {repetitions} times per profile")
+    print(f"{'profile':<16} {'median load':>12} {'max load':>10} {'median DOM ready':>17} {'resources':>10}")
+    medians = {}
+    for name, profile in profiles.items():
+        timings = measure_page_loads(profile, url, repetitions)
+        wall = [timing.wall_seconds for timing in timings]
+        dom_ready = [timing.dom_content_loaded_seconds for timing in timings
+                     if timing.dom_content_loaded_seconds is not None]
+        medians[name] = statistics.median(wall)
+        print(f"{name:<16} {medians[name]:>11.3f}s {max(wall):>9.3f}s "
+              f"{statistics.median(dom_ready) if dom_ready else float('nan'):>16.3f}s "
+              f"{statistics.median(timing.resources for timing in timings):>10.0f}")
+
+    if len(medians) > 1:
+        (first_name, first), *others = medians.items()
+        for name, median in others:
+            print(f"{name} saves {first - median:.3f}s per page load compared to {first_name}")
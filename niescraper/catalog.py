@@ -0,0 +1,65 @@
+import json
+import os
+import tempfile
+import time
+from typing import Optional, List, Dict
+
+from niescraper.options import Option
+
+
+class Catalog:
+    """On-disk cache of the options of the province, office and trámite selects.
+    Entries older than the time to live are ignored and replaced by the live options the next time they are read.
+    The checks also store the live options they see along the way, so that changes show up before an entry expires.
+    """
+
+    provinces = "provinces"
+    offices = "offices"
+    intentions = "intentions"
+
+    def __init__(self, path: str, ttl: float = 7 * 24 * 60 * 60):
+        self.path = path
+        self.ttl = ttl
+        # kind -> key -> {"updated": timestamp, "options": [[select id, value, text], ...]}
+        self._entries: Dict[str, Dict[str, dict]] = self._load()
+
+    def _load(self) -> Dict[str, Dict[str, dict]]:
+        try:
+            with open(self.path, encoding="utf-8") as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return dict()
+        except ValueError:
+            # a broken catalog is only a cache miss
+            return dict()
+
+    def save(self) -> None:
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        # write to a temporary file first so that other processes never read a half-written catalog
+        with tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=directory, delete=False) as file:
+            json.dump(self._entries, file, ensure_ascii=False)
+        os.replace(file.name, self.path)
+
+    def get(self, kind: str, key: str = "") -> Optional[List[Option]]:
+        """Returns the cataloged options or None if there are none or if they are outdated."""
+        entry = self._entries.get(kind, {}).get(key)
+        if entry is None or time.time() - entry["updated"] > self.ttl:
+            return None
+        return [Option.create(*option) for option in entry["options"]]
+
+    def update(self, kind: str, options: List[Option], key: str = "") -> bool:
+        """Stores the live options. Only writes the catalog if they differ from the cataloged ones or if those are
+        outdated. Returns whether the catalog was written.
+        """
+        stored = [[option.select_id, option.value, option.text] for option in options]
+        entry = self._entries.get(kind, {}).get(key)
+        if entry is not None and entry["options"] == stored and time.time() - entry["updated"] <= self.ttl:
+            return False
+        self._entries.setdefault(kind, {})[key] = {"updated": time.time(), "options": stored}
+        self.save()
+        return True
+
+    def invalidate(self, kind: str, key: str = "") -> None:
+        if self._entries.get(kind, {}).pop(key, None) is not None:
+            self.save()
@@ -0,0 +1,79 @@
+import json
+import os
+from datetime import datetime
+from typing import Optional, Set, Tuple, List, Iterable, Iterator, AbstractSet
+
+from niescraper.crawl import OfficeResult
+
+
+class CrawlCheckpoint:
+    """Append-only record of an all-offices crawl, written after every office so that the crawl can be resumed.
+    Every line holds the result of an office and the offices and provinces finished since the previous line.
+    """
+
+    def __init__(self, path: str, resume: bool = False):
+        self.path = path
+        # the results of the previous runs; new results are only written to the file
+        self.results: List[OfficeResult] = []
+        self.finished_offices: Set[Tuple[str, str]] = set()
+        self.finished_provinces: Set[str] = set()
+        if resume:
+            self._load()
+        self._file = open(path, "a" if resume else "w", encoding="utf-8")
+
+    def _load(self) -> None:
+        try:
+            with open(self.path, encoding="utf-8") as file:
+                for line in file:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # the last line might be incomplete if the process was killed while writing it
+                        continue
+                    self.finished_offices.update(tuple(office) for office in record["finished_offices"])
+                    self.finished_provinces.update(record["finished_provinces"])
+                    if record["province"] is not None:
+                        checked_at = record.get("checked_at")
+                        self.results.append(OfficeResult(
+                            record["province"], record["office"],
+                            [datetime.fromisoformat(appointment) for appointment in record["appointments"]],
+                            record["intention_available"],
+                            datetime.fromisoformat(checked_at) if checked_at else None, record.get("seconds")))
+        except FileNotFoundError:
+            pass
+
+    def record(self, result: Optional[OfficeResult], finished_offices: AbstractSet[Tuple[str, str]],
+               finished_provinces: AbstractSet[str]) -> None:
+        new_offices = [office for office in finished_offices if office not in self.finished_offices]
+        new_provinces = [province for province in finished_provinces if province not in self.finished_provinces]
+        if result is None and not new_offices and not new_provinces:
+            return
+        record = {
+            "province": result.province if result else None,
+            "office": result.office if result else None,
+            "appointments": [appointment.isoformat() for appointment in result.appointments] if result else [],
+            "intention_available": result.intention_available if result else True,
+            "checked_at": result.checked_at.isoformat() if result and result.checked_at else None,
+            "seconds": result.seconds if result else None,
+            "finished_offices": new_offices,
+            "finished_provinces": new_provinces,
+        }
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self.finished_offices.update(new_offices)
+        self.finished_provinces.update(new_provinces)
+
+    def close(self) -> None:
+        self._file.close()
+
+
+def checkpointed(results: Iterable[OfficeResult], checkpoint: CrawlCheckpoint,
+                 finished_offices: AbstractSet[Tuple[str, str]], finished_provinces: AbstractSet[str]) \
+        -> Iterator[OfficeResult]:
+    """Yields the results of the previous runs first, then records and yields the new results."""
+    yield from list(checkpoint.results)
+    for result in results:
+        checkpoint.record(result, finished_offices, finished_provinces)
+        yield result
+    checkpoint.record(None, finished_offices, finished_provinces)
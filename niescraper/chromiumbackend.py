@@ -0,0 +1,249 @@
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+import urllib.request
+from typing import Optional, Any, Dict, List, Sequence, TYPE_CHECKING
+
+import websocket
+from selenium.common.exceptions import WebDriverException, JavascriptException, NoSuchElementException
+
+from niescraper.browserbackend import BrowserBackend
+from niescraper.readiness import mark_page, new_page_state, ready_states
+
+if TYPE_CHECKING:
+    from niescraper.browserprofile import DriverProfile
+
+# the names under which Chromium is installed, in order of preference
+chromium_executables = ("chromium", "chromium-browser", "google-chrome", "google-chrome-stable")
+
+# the browser is told about a port of 0 to choose a free one, which it writes into this file of the profile
+_active_port_file = "DevToolsActivePort"
+
+
+class CdpError(WebDriverException):
+    """The answer to a command of the DevTools protocol was an error."""
+
+    def __init__(self, message: str, method: str):
+        super().__init__(f"{method}: {message}")
+        self.reason = message
+
+    @property
+    def lost_context(self) -> bool:
+        # a script was sent while the page was being replaced
+        return "context" in self.reason.lower()
+
+
+class CdpConnection:
+    """A websocket connection to a page of Chromium that sends commands of the DevTools protocol one at a time.
+    The events of the page are not enabled, and those that are sent anyway are skipped.
+    """
+
+    def __init__(self, websocket_url: str, timeout: float = 60):
+        try:
+            self._socket = websocket.create_connection(websocket_url, timeout=timeout, suppress_origin=True)
+        except (websocket.WebSocketException, OSError) as e:
+            raise WebDriverException(f"Cannot connect to Chromium: {e}") from e
+        self._last_id = 0
+
+    def send(self, method: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        """Sends a command and returns its result. Errors of the protocol raise a CdpError, while a lost
+        connection raises a plain WebDriverException, i.e. a browser failure.
+        """
+        self._last_id += 1
+        command_id = self._last_id
+        try:
+            self._socket.send(json.dumps({"id": command_id, "method": method, "params": params}))
+            while True:
+                message = json.loads(self._socket.recv())
+                if message.get("id") == command_id:
+                    break
+        except (websocket.WebSocketException, OSError, ValueError) as e:
+            raise WebDriverException(f"Lost the connection to Chromium: {e}") from e
+        if "error" in message:
+            raise CdpError(message["error"].get("message", ""), method)
+        return message.get("result", {})
+
+    def close(self) -> None:
+        try:
+            self._socket.close()
+        except (websocket.WebSocketException, OSError):
+            pass
+
+
+_click_point_script = """
+var element = document.getElementById(arguments[0]);
+if (!element) {
+    return null;
+}
+element.scrollIntoView(true);
+var rect = element.getBoundingClientRect();
+return [rect.left + rect.width / 2, rect.top + rect.height / 2];
+"""
+
+
+class ChromiumBackend(BrowserBackend):
+    """Chromium controlled through the DevTools protocol, without a driver process in between. Scripts are
+    evaluated in the page and clicks are sent as mouse events, so every command is a single message on the websocket.
+    """
+
+    def __init__(self, connection: CdpConnection, process: subprocess.Popen = None, user_data_dir: str = None,
+                 page_load_strategy: str = "normal", page_load_timeout: float = 300, poll_interval: float = 0.05,
+                 context_timeout: float = 10, port: int = None, target_id: str = None):
+        self.connection = connection
+        self.process = process
+        self.user_data_dir = user_data_dir
+        # the DevTools port of the browser and the page of this backend, which are needed to open and close tabs
+        self.port = port
+        self.target_id = target_id
+        # the page the browser started with becomes the first tab instead of idling next to the others
+        self.initial_page_taken = False
+        self.blocked_url_patterns: List[str] = []
+        self.page_load_strategy = page_load_strategy
+        self.page_load_timeout = page_load_timeout
+        self.poll_interval = poll_interval
+        # how long a script is retried while there is no page to run it in
+        self.context_timeout = context_timeout
+
+    @staticmethod
+    def launch(profile: "DriverProfile", startup_timeout: float = 30) -> "ChromiumBackend":
+        executable = next((path for path in map(shutil.which, chromium_executables) if path), None)
+        if executable is None:
+            raise WebDriverException(f"Chromium is not installed; looked for {', '.join(chromium_executables)}")
+        user_data_dir = tempfile.mkdtemp(prefix="niescraper-chromium-")
+        process = subprocess.Popen([executable, "--remote-debugging-port=0", f"--user-data-dir={user_data_dir}",
+                                    *profile.chromium_arguments(), "about:blank"],
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            port = _wait_for_port(process, user_data_dir, startup_timeout)
+            target = _page_target(port)
+            backend = ChromiumBackend(CdpConnection(target["webSocketDebuggerUrl"]), process, user_data_dir,
+                                      profile.page_load_strategy, port=port, target_id=target["id"])
+            backend._block_urls(profile.blocked_url_patterns())
+            return backend
+        except BaseException:
+            _stop(process, user_data_dir)
+            raise
+
+    def _block_urls(self, patterns: Sequence[str]) -> None:
+        self.blocked_url_patterns = list(patterns)
+        if patterns:
+            self.execute("Network.enable", {})
+            self.execute("Network.setBlockedURLs", {"urls": list(patterns)})
+
+    def execute(self, method: str, params: Dict[str, Any] = None) -> Dict[str, Any]:
+        """Sends a command of the DevTools protocol. All commands go through here, so that they can be counted."""
+        return self.connection.send(method, params if params is not None else {})
+
+    def _evaluate(self, expression: str) -> Dict[str, Any]:
+        deadline = time.monotonic() + self.context_timeout
+        while True:
+            try:
+                return self.execute("Runtime.evaluate", {"expression": expression, "returnByValue": True})
+            except CdpError as e:
+                if not e.lost_context or time.monotonic() >= deadline:
+                    raise
+            time.sleep(self.poll_interval)
+
+    def execute_script(self, script: str, *args) -> Any:
+        response = self._evaluate(f"(function () {{\n{script}\n}}).apply(null, {json.dumps(list(args))})")
+        if "exceptionDetails" in response:
+            details = response["exceptionDetails"]
+            raise JavascriptException(details.get("exception", {}).get("description") or details.get("text"))
+        return response.get("result", {}).get("value")
+
+    def navigate(self, url: str) -> None:
+        mark_page(self)
+        response = self.execute("Page.navigate", {"url": url})
+        if response.get("errorText"):
+            raise WebDriverException(f"Cannot open {url}: {response['errorText']}")
+        states = ready_states.get(self.page_load_strategy, ready_states["normal"])
+        self.wait(lambda backend: new_page_state(backend) in states, self.page_load_timeout, self.poll_interval,
+                  f"Timed out loading {url}")
+
+    def click(self, element_id: str) -> None:
+        point = self.execute_script(_click_point_script, element_id)
+        if point is None:
+            raise NoSuchElementException(f"No element with the id {element_id}")
+        x, y = point
+        for event in ("mousePressed", "mouseReleased"):
+            self.execute("Input.dispatchMouseEvent", {"type": event, "x": x, "y": y, "button": "left",
+                                                      "clickCount": 1})
+
+    @property
+    def process_id(self) -> Optional[int]:
+        return self.process.pid if self.process is not None else None
+
+    def open_tab(self) -> "ChromiumBackend":
+        """Opens a page with a connection of its own, so that its commands do not wait for those of other tabs.
+        The first tab is the page the browser started with, whose connection is only used by the tab from then on.
+        """
+        if self.port is None:
+            raise WebDriverException("Tabs can only be opened in a launched Chromium")
+        if not self.initial_page_taken:
+            self.initial_page_taken = True
+            tab = ChromiumBackend(self.connection, None, None, self.page_load_strategy, self.page_load_timeout,
+                                  self.poll_interval, self.context_timeout, self.port, self.target_id)
+            tab.blocked_url_patterns = self.blocked_url_patterns
+            return tab
+        target = _devtools_json(self.port, "/json/new?about:blank", "PUT")
+        tab = ChromiumBackend(CdpConnection(target["webSocketDebuggerUrl"]), None, None, self.page_load_strategy,
+                              self.page_load_timeout, self.poll_interval, self.context_timeout, self.port,
+                              target["id"])
+        tab._block_urls(self.blocked_url_patterns)
+        return tab
+
+    def quit(self) -> None:
+        self.connection.close()
+        if self.process is None and self.port is not None and self.target_id is not None:
+            # a tab of a browser that keeps running
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{self.port}/json/close/{self.target_id}", timeout=10):
+                    pass
+            except OSError:
+                pass
+        _stop(self.process, self.user_data_dir)
+
+
+def _wait_for_port(process: subprocess.Popen, user_data_dir: str, timeout: float) -> int:
+    path = os.path.join(user_data_dir, _active_port_file)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise WebDriverException(f"Chromium exited with status {process.returncode} while starting")
+        try:
+            with open(path) as file:
+                port = file.readline().strip()
+            if port:
+                return int(port)
+        except (OSError, ValueError):
+            pass
+        time.sleep(0.05)
+    raise WebDriverException("Timed out waiting for Chromium to start")
+
+
+def _devtools_json(port: int, path: str, method: str = "GET") -> Any:
+    request = urllib.request.Request(f"http://127.0.0.1:{port}{path}", method=method)
+    with urllib.request.urlopen(request, timeout=10) as response:
+        return json.load(response)
+
+
+def _page_target(port: int) -> Dict[str, str]:
+    for target in _devtools_json(port, "/json/list"):
+        if target.get("type") == "page":
+            return target
+    raise WebDriverException("Chromium has no page to control")
+
+
+def _stop(process: Optional[subprocess.Popen], user_data_dir: Optional[str]) -> None:
+    if process is not None and process.poll() is None:
+        process.terminate()
+        try:
+            process.wait(5)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+    if user_data_dir is not None:
+        shutil.rmtree(user_data_dir, ignore_errors=True)
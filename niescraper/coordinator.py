@@ -0,0 +1,161 @@
+import json
+import threading
+import traceback
+import urllib.request
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from time import sleep
+from typing import Callable, List, Optional, Iterator
+
+from niescraper.appointmentchecker import AppointmentChecker
+from niescraper.crawl import OfficeResult, check_work_unit
+from niescraper.forms import FormValues, IntentionSelectionStrategy, intention_name
+from niescraper.resultwriter import office_record, office_result
+from niescraper.workqueue import WorkQueue, WorkUnit, Lease
+
+
+def _lease_record(lease: Lease) -> dict:
+    return {"token": lease.token, "unit": lease.unit._asdict(), "expires": lease.expires}
+
+
+def _lease(record: dict) -> Lease:
+    return Lease(record["token"], WorkUnit(**record["unit"]), record["expires"])
+
+
+class _JoiningHTTPServer(ThreadingHTTPServer):
+    # the requests are handled in threads that server_close() waits for, so that the results a worker reported just
+    # before the crawl finished are passed on before the queue and the results are closed
+    daemon_threads = False
+    block_on_close = True
+
+
+class CoordinatorServer:
+    """Hands out the units of a work queue to workers on other hosts, with JSON requests over HTTP.
+    The new results are passed to the callback in the thread of the request that reported them.
+    """
+
+    def __init__(self, queue: WorkQueue, host: str = "127.0.0.1", port: int = 0,
+                 on_results: Callable[[List[OfficeResult]], None] = None):
+        self.queue = queue
+        self.on_results = on_results
+        self.server = _JoiningHTTPServer((host, port), self._handler())
+        self._thread = threading.Thread(target=self.server.serve_forever, name="niescraper-coordinator", daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def __enter__(self) -> "CoordinatorServer":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.server.shutdown()
+        # waits for the requests that are still handled, see _JoiningHTTPServer
+        self.server.server_close()
+
+    def _claim(self, request: dict) -> dict:
+        try:
+            lease = self.queue.claim(request["worker"], request["intention"])
+        except WorkQueue.NoMoreUnitsException:
+            return {"lease": None, "finished": True}
+        return {"lease": _lease_record(lease) if lease is not None else None, "finished": False}
+
+    def _complete(self, request: dict) -> dict:
+        results = self.queue.complete(WorkUnit(**request["unit"]),
+                                      [office_result(record) for record in request["results"]],
+                                      [tuple(unit) for unit in request["discovered"]])
+        if results and self.on_results is not None:
+            self.on_results(results)
+        return {"new_results": len(results)}
+
+    def _fail(self, request: dict) -> dict:
+        return {"handed_out_again": self.queue.fail(request["token"], request["error"])}
+
+    def _handler(self):
+        routes = {"/claim": self._claim, "/complete": self._complete, "/fail": self._fail}
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _respond(self, status: int, response: dict):
+                content = json.dumps(response, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def do_POST(self):
+                route = routes.get(self.path)
+                if route is None:
+                    self._respond(404, {"error": f"Unknown path {self.path}"})
+                    return
+                try:
+                    request = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)))
+                    self._respond(200, route(request))
+                except (ValueError, KeyError, TypeError) as e:
+                    self._respond(400, {"error": repr(e)})
+
+        return Handler
+
+
+class CoordinatorClient:
+    """The requests of a worker to the coordinator."""
+
+    def __init__(self, url: str, worker: str, timeout: float = 30):
+        self.url = url.rstrip("/")
+        self.worker = worker
+        self.timeout = timeout
+
+    def _post(self, path: str, request: dict) -> dict:
+        body = json.dumps(request, ensure_ascii=False).encode("utf-8")
+        http_request = urllib.request.Request(self.url + path, body, {"Content-Type": "application/json"},
+                                              method="POST")
+        with urllib.request.urlopen(http_request, timeout=self.timeout) as response:
+            return json.load(response)
+
+    def claim(self, intention: str) -> Optional[Lease]:
+        """Returns a lease, or None if all remaining units are leased by other workers. Raises a
+        NoMoreUnitsException if the crawl is done.
+        """
+        response = self._post("/claim", {"worker": self.worker, "intention": intention})
+        if response["finished"]:
+            raise WorkQueue.NoMoreUnitsException()
+        return _lease(response["lease"]) if response["lease"] is not None else None
+
+    def complete(self, lease: Lease, results: List[OfficeResult], discovered: List[tuple]) -> int:
+        """Reports the results of the unit and returns how many of them were new."""
+        return self._post("/complete", {"unit": lease.unit._asdict(),
+                                        "results": [office_record(result) for result in results],
+                                        "discovered": discovered})["new_results"]
+
+    def fail(self, lease: Lease, error: str) -> None:
+        self._post("/fail", {"token": lease.token, "error": error})
+
+
+def work(client: CoordinatorClient, checker: AppointmentChecker, intention_strategy: IntentionSelectionStrategy,
+         form_values: FormValues, poll_interval: float = 5) -> Iterator[OfficeResult]:
+    """Checks the units handed out by the coordinator until the crawl is done, and yields the results. Units that
+    fail are reported to the coordinator, which hands them out again.
+    """
+    intention = intention_name(intention_strategy)
+    while True:
+        try:
+            lease = client.claim(intention)
+        except WorkQueue.NoMoreUnitsException:
+            return
+        if lease is None:
+            # the units leased by other workers are handed out again if their leases run out
+            sleep(poll_interval)
+            continue
+        try:
+            results, discovered = check_work_unit(checker, lease.unit.province, lease.unit.office,
+                                                  intention_strategy, form_values)
+        except Exception as e:
+            traceback.print_exc()
+            client.fail(lease, repr(e))
+            continue
+        client.complete(lease, results, discovered)
+        yield from results
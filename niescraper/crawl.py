@@ -0,0 +1,97 @@
+from datetime import datetime
+from time import monotonic
+from typing import NamedTuple, Optional, List, Iterator, Iterable, Tuple
+
+from selenium.common.exceptions import NoSuchElementException
+
+from niescraper.appointmentchecker import AppointmentChecker, FormValues, IntentionSelectionStrategy
+from niescraper.appointmentscraper import scrape_appointments
+from niescraper.officeselection import DFSOfficeSelectionStrategy, WorkUnitOfficeSelectionStrategy
+from niescraper.requestbudget import BlockedException
+
+
+class OfficeResult(NamedTuple):
+    province: str
+    office: Optional[str]
+    appointments: List[datetime]
+    intention_available: bool = True
+    # when the check of the office started and how long it took including the scraping
+    checked_at: Optional[datetime] = None
+    seconds: Optional[float] = None
+
+
+def crawl_offices(checker: AppointmentChecker, dfs_strategy: DFSOfficeSelectionStrategy,
+                  intention_strategy: IntentionSelectionStrategy, form_values: FormValues) -> Iterator[OfficeResult]:
+    try:
+        while True:
+            checked_at, start = datetime.now(), monotonic()
+            try:
+                if checker.check_citas_available(form_values, dfs_strategy, intention_strategy):
+                    # in date order, while the table view lists them by time of day
+                    appointments = sorted(scrape_appointments(checker.driver))
+                    if appointments:
+                        yield OfficeResult(dfs_strategy.last_province, dfs_strategy.last_office, appointments,
+                                           checked_at=checked_at, seconds=round(monotonic() - start, 3))
+                        continue
+                # update the bookkeeping before yielding so that it is complete when the result is checkpointed
+                dfs_strategy.notify_about_no_appointments_for_last_selection()
+                yield OfficeResult(dfs_strategy.last_province, dfs_strategy.last_office, [], checked_at=checked_at,
+                                   seconds=round(monotonic() - start, 3))
+            except DFSOfficeSelectionStrategy.NoMoreOfficesException:
+                pass
+            except BlockedException:
+                # the office is handed back and checked again once the request budget lets the next check through
+                if checker.last_office is not None:
+                    dfs_strategy.release_office(checker.last_province, checker.last_office)
+            except NoSuchElementException:
+                dfs_strategy.notify_about_no_appointments_for_last_selection()
+                yield OfficeResult(dfs_strategy.last_province, None, [], intention_available=False,
+                                   checked_at=checked_at, seconds=round(monotonic() - start, 3))
+    except DFSOfficeSelectionStrategy.NoMoreProvincesException:
+        pass
+
+
+def check_work_unit(checker: AppointmentChecker, province: Optional[str], office: Optional[str],
+                    intention_strategy: IntentionSelectionStrategy, form_values: FormValues) \
+        -> Tuple[List[OfficeResult], List[Tuple[str, Optional[str]]]]:
+    """Checks the office of a work unit of a distributed crawl, or the first office or province offered if the unit
+    does not name it. Returns the result, unless the province is not offered anymore, and the other provinces and
+    offices offered on the way, as (province, office or None).
+    """
+    strategy = WorkUnitOfficeSelectionStrategy(province, office)
+    while True:
+        checked_at, start = datetime.now(), monotonic()
+        intention_available = True
+        appointments = []
+        try:
+            if checker.check_citas_available(form_values, strategy, intention_strategy):
+                appointments = sorted(scrape_appointments(checker.driver))
+        except BlockedException:
+            # checked again once the request budget lets the next check through
+            continue
+        except WorkUnitOfficeSelectionStrategy.OptionNotFoundException:
+            if strategy.last_province is None:
+                return [], strategy.discovered
+            # an office that is not offered has no appointments
+        except NoSuchElementException:
+            intention_available = False
+        break
+    return [OfficeResult(strategy.last_province, strategy.last_office if intention_available else None, appointments,
+                         intention_available, checked_at, round(monotonic() - start, 3))], strategy.discovered
+
+
+def until_hits(results: Iterable[OfficeResult], hits: Optional[int]) -> Iterator[OfficeResult]:
+    """Passes the results on until the given number of offices with appointments was found, then stops the crawl
+    by closing the results. All results are passed on if no number is given.
+    """
+    found = 0
+    try:
+        for result in results:
+            yield result
+            found += bool(result.appointments)
+            if hits is not None and found >= hits:
+                return
+    finally:
+        close = getattr(results, "close", None)
+        if close is not None:
+            close()
@@ -0,0 +1,142 @@
+import concurrent.futures
+import os
+import threading
+from typing import Callable, Optional, List, TYPE_CHECKING
+
+from selenium.common.exceptions import WebDriverException, InvalidSessionIdException, NoSuchWindowException
+from urllib3.exceptions import MaxRetryError, ProtocolError, ReadTimeoutError
+
+if TYPE_CHECKING:
+    from niescraper.browserbackend import BrowserBackend
+
+# errors of the session and of the connection to the browser, after which the browser is not trusted anymore; a hung
+# browser does not answer the driver in time. The other WebDriverExceptions are answers of a working browser, e.g.
+# NoSuchElementException, or a TimeoutException while a slow site does not show the expected page.
+browser_failures = (InvalidSessionIdException, NoSuchWindowException, MaxRetryError, ProtocolError, ReadTimeoutError,
+                    OSError)
+
+
+def is_browser_failure(error: BaseException) -> bool:
+    # a plain WebDriverException is raised if the driver cannot talk to the browser anymore
+    return isinstance(error, browser_failures) or type(error) is WebDriverException
+
+
+def _children(pid: int) -> List[int]:
+    children = []
+    try:
+        for task in os.listdir(f"/proc/{pid}/task"):
+            with open(f"/proc/{pid}/task/{task}/children") as file:
+                children.extend(int(child) for child in file.read().split())
+    except OSError:
+        pass
+    return children
+
+
+def _resident_kilobytes(pid: int) -> int:
+    try:
+        with open(f"/proc/{pid}/status") as file:
+            for line in file:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def browser_memory_mb(driver: "BrowserBackend") -> Optional[float]:
+    """Returns the resident memory of the browser and its content processes, or None if it cannot be determined.
+    Only works on Linux, where the process tree can be read from /proc.
+    """
+    pid = driver.process_id
+    if pid is None or not os.path.isdir("/proc"):
+        return None
+    pids = [pid]
+    kilobytes = 0
+    while pids:
+        pid = pids.pop()
+        kilobytes += _resident_kilobytes(pid)
+        pids.extend(_children(pid))
+    return kilobytes / 1024
+
+
+def _quit(driver: "BrowserBackend") -> None:
+    try:
+        driver.quit()
+    except Exception:
+        # the browser might be gone already
+        pass
+
+
+class DriverLifecycle:
+    """Owns the browser of a checker and replaces it after a number of checks, when it uses too much memory or after
+    it failed. A standby browser can be launched in the background, so that replacing the browser does not delay the
+    next check.
+    """
+
+    def __init__(self, create_driver: Callable[[], "BrowserBackend"], max_checks: int = None,
+                 max_memory_mb: float = None, standby: bool = False,
+                 memory: Callable[["BrowserBackend"], Optional[float]] = browser_memory_mb):
+        self.create_driver = create_driver
+        self.max_checks = max_checks
+        self.max_memory_mb = max_memory_mb
+        self.standby = standby
+        self._memory = memory
+        self._driver: Optional["BrowserBackend"] = None
+        self._standby: Optional[concurrent.futures.Future] = None
+        self._executor: Optional[concurrent.futures.ThreadPoolExecutor] = None
+        self.checks = 0
+        self.recycled = 0
+
+    @property
+    def driver(self) -> "BrowserBackend":
+        if self._driver is None:
+            self._driver = self._take_standby() if self._standby is not None else self.create_driver()
+            self.checks = 0
+            self._launch_standby()
+        return self._driver
+
+    def _launch_standby(self) -> None:
+        if not self.standby or self._standby is not None:
+            return
+        if self._executor is None:
+            self._executor = concurrent.futures.ThreadPoolExecutor(1, thread_name_prefix="standby-browser")
+        self._standby = self._executor.submit(self.create_driver)
+
+    def _take_standby(self) -> "BrowserBackend":
+        standby, self._standby = self._standby, None
+        try:
+            return standby.result()
+        except Exception:
+            # the standby failed to start; try once more in the foreground
+            return self.create_driver()
+
+    def check_done(self) -> None:
+        """Counts a finished check and recycles the browser if it reached the number of checks or the memory limit."""
+        self.checks += 1
+        if self.max_checks is not None and self.checks >= self.max_checks:
+            self.recycle()
+        elif self.max_memory_mb is not None and self._driver is not None:
+            memory = self._memory(self._driver)
+            if memory is not None and memory > self.max_memory_mb:
+                self.recycle()
+
+    def recycle(self) -> None:
+        """Quits the browser in the background. The next access to the driver gets the standby or a new browser."""
+        driver, self._driver = self._driver, None
+        if driver is not None:
+            self.recycled += 1
+            threading.Thread(target=_quit, args=(driver,), daemon=True).start()
+
+    def quit(self) -> None:
+        if self._driver is not None:
+            _quit(self._driver)
+            self._driver = None
+        if self._standby is not None:
+            standby, self._standby = self._standby, None
+            try:
+                _quit(standby.result())
+            except Exception:
+                pass
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
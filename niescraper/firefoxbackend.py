@@ -0,0 +1,107 @@
+import threading
+from typing import Optional, Any, Dict
+
+from selenium import webdriver
+from selenium.common.exceptions import NoSuchElementException
+from selenium.webdriver.common.by import By
+from selenium.webdriver.remote.command import Command
+
+from niescraper.browserbackend import BrowserBackend
+from niescraper.readiness import mark_page, new_page_state, ready_states
+
+# the click and the navigation run after the script returned, since WebDriver would otherwise wait for the new page
+_click_later_script = """
+var element = document.getElementById(arguments[0]);
+if (!element) {
+    return false;
+}
+element.scrollIntoView(true);
+setTimeout(function () { element.click(); }, 0);
+return true;
+"""
+_navigate_later_script = """
+var url = arguments[0];
+setTimeout(function () { window.location.href = url; }, 0);
+"""
+
+
+class FirefoxBackend(webdriver.Firefox, BrowserBackend):
+    """Firefox controlled by geckodriver. Every command is a WebDriver request sent through execute()."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # WebDriver talks to one tab at a time, so the tabs take turns and switch to their own tab when needed
+        self.tab_lock = threading.RLock()
+        self.current_tab: Optional[str] = None
+        # the window the browser started with becomes the first tab instead of idling next to the others
+        self.initial_window_taken = False
+
+    def navigate(self, url: str) -> None:
+        self.get(url)
+
+    def click(self, element_id: str) -> None:
+        # a native click, so that the page sees the same events as from a user
+        element = self.find_element(By.ID, element_id)
+        self.execute_script("arguments[0].scrollIntoView(true);", element)
+        element.click()
+
+    @property
+    def process_id(self) -> Optional[int]:
+        return self.capabilities.get("moz:processID") if self.capabilities else None
+
+    def open_tab(self) -> "WebDriverTab":
+        with self.tab_lock:
+            if self.initial_window_taken:
+                self.switch_to.new_window("tab")
+            self.initial_window_taken = True
+            self.current_tab = self.current_window_handle
+            return WebDriverTab(self, self.current_tab, self.capabilities.get("pageLoadStrategy", "normal"))
+
+
+class WebDriverTab(BrowserBackend):
+    """A tab of a Firefox shared with other tabs. Every command switches to the tab first if another tab was used
+    last. Pages are opened and buttons clicked by scripts that return at once, so that the other tabs go on while a
+    page loads, and the wait for the new page only takes turns for single polls.
+    """
+
+    def __init__(self, browser: FirefoxBackend, handle: str, page_load_strategy: str = "normal",
+                 page_load_timeout: float = 300, poll_interval: float = 0.05):
+        self.browser = browser
+        self.handle = handle
+        self.page_load_strategy = page_load_strategy
+        self.page_load_timeout = page_load_timeout
+        self.poll_interval = poll_interval
+
+    def execute(self, command: str, params: Dict[str, Any] = None) -> Dict[str, Any]:
+        """Sends a WebDriver command to the tab. All commands go through here, so that they can be counted."""
+        with self.browser.tab_lock:
+            if self.browser.current_tab != self.handle:
+                self.browser.switch_to.window(self.handle)
+                self.browser.current_tab = self.handle
+            return self.browser.execute(command, params)
+
+    def execute_script(self, script: str, *args) -> Any:
+        return self.execute(Command.W3C_EXECUTE_SCRIPT, {"script": script, "args": list(args)})["value"]
+
+    def navigate(self, url: str) -> None:
+        mark_page(self)
+        self.execute_script(_navigate_later_script, url)
+        states = ready_states.get(self.page_load_strategy, ready_states["normal"])
+        self.wait(lambda tab: new_page_state(tab) in states, self.page_load_timeout, self.poll_interval,
+                  f"Timed out loading {url}")
+
+    def click(self, element_id: str) -> None:
+        if not self.execute_script(_click_later_script, element_id):
+            raise NoSuchElementException(f"No element with the id {element_id}")
+
+    @property
+    def process_id(self) -> Optional[int]:
+        return self.browser.process_id
+
+    def quit(self) -> None:
+        with self.browser.tab_lock:
+            try:
+                self.execute(Command.CLOSE)
+            finally:
+                # the browser shows another tab now
+                self.browser.current_tab = None
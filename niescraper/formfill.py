@@ -0,0 +1,51 @@
+from typing import Dict, Union, List, Optional, TYPE_CHECKING
+
+from niescraper.options import Option
+
+if TYPE_CHECKING:
+    from niescraper.browserbackend import BrowserBackend
+
+# Sets all values at once. Radio buttons and checkboxes are clicked so that their handlers run; for all other
+# elements the events a user would trigger while typing are fired. Missing elements are skipped.
+# If the id of a select is given as second argument, its options are returned as [select id, value, text].
+_fill_form_script = """
+var values = arguments[0];
+for (var id in values) {
+    var element = document.getElementById(id);
+    if (!element) {
+        continue;
+    }
+    if (element.type === 'radio' || element.type === 'checkbox') {
+        if (!element.checked) {
+            element.click();
+        }
+        continue;
+    }
+    element.focus();
+    element.value = values[id];
+    ['keydown', 'keypress', 'input', 'keyup', 'change'].forEach(function (type) {
+        element.dispatchEvent(new Event(type, {bubbles: true}));
+    });
+    element.blur();
+}
+var select = arguments[1] ? document.getElementById(arguments[1]) : null;
+if (!select) {
+    return null;
+}
+return Array.from(select.options, function (option) {
+    return [select.id, option.value, option.textContent];
+});
+"""
+
+
+def fill_form(driver: "BrowserBackend", values: Dict[str, Union[str, bool]], read_options_of: str = None) \
+        -> Optional[List[Option]]:
+    """Fills the form elements with the given ids in one script call.
+    Radio buttons and checkboxes are checked if their value is truthy. Empty values are skipped.
+    Optionally, the options of a select are returned in the same call.
+    """
+    values = {element_id: value for element_id, value in values.items() if value}
+    options = driver.execute_script(_fill_form_script, values, read_options_of)
+    if options is None:
+        return None
+    return [Option.create(*option) for option in options]
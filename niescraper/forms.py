@@ -0,0 +1,103 @@
+import abc
+from enum import auto, unique, Enum
+from typing import List, Callable, Dict, Optional, Mapping, Iterator
+
+from niescraper.catalog import Catalog
+from niescraper.options import Option
+
+url = "https://icp.administracionelectronica.gob.es/icpplus/index.html"
+
+
+class OfficeSelectionStrategy(abc.ABC):
+    """Chooses the province and the office among the options on the page.
+    Returning None means that nothing should be selected automatically.
+    """
+
+    # whether the strategy asks the user to select in the browser, so that the forms must be filled in there
+    interactive = False
+
+    @abc.abstractmethod
+    def select_province(self, provinces: List[Option]) -> Optional[Option]:
+        pass
+
+    @abc.abstractmethod
+    def select_office(self, offices: List[Option]) -> Optional[Option]:
+        pass
+
+    def pre_select_office(self, offices: List[Option]) -> Optional[Option]:
+        """Selects an office right after selecting the province.
+        This can be useful for appointments that require a specific office, e.g. registration as EU citizen.
+        Otherwise, this method can just return None and let select_office() handle the selection later.
+        """
+        return None
+
+    def release_office(self, province: Option, office: Option) -> None:
+        """Called if the check of the office the strategy chose failed and is repeated, so that a strategy that chooses
+        every office once can choose it again.
+        """
+        pass
+
+    def resolve(self, catalog: Catalog) -> None:
+        """Chooses among the cataloged options ahead of the checks, if the strategy always chooses the same."""
+        pass
+
+
+IntentionSelectionStrategy = Callable[[List[Option]], Option]
+
+
+@unique
+class FormField(Enum):
+    PassportId = auto()
+    NieNumber = auto()
+    Name = auto()
+    YearOfBirth = auto()
+    NativeCountry = auto()
+    PhoneNumber = auto()
+    Email = auto()
+    AdditionalNotes = auto()
+
+
+@unique
+class IdentificationMethod(Enum):
+    ByDNI = "rdbTipoDocDni"
+    ByNIE = "rdbTipoDocNie"
+    ByPassport = "rdbTipoDocPas"
+
+
+class FormValues(Mapping[FormField, Optional[str]]):
+    def __init__(self, identification_method: IdentificationMethod, data: Dict[FormField, str] = None):
+        if data is None:
+            data = dict()
+        self.identification_method = identification_method
+        self._data = data
+
+    @property
+    def identifier(self) -> Optional[str]:
+        if self.identification_method is IdentificationMethod.ByDNI:
+            return self[FormField.PassportId]
+        elif self.identification_method is IdentificationMethod.ByNIE:
+            return self[FormField.NieNumber]
+        elif self.identification_method is IdentificationMethod.ByPassport:
+            return self[FormField.PassportId]
+        raise NotImplementedError(f"Identifier deviation for {self.identification_method} not implemented")
+
+    def __getitem__(self, k: FormField) -> Optional[str]:
+        return self._data.get(k, None)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __iter__(self) -> Iterator[FormField]:
+        return self._data.__iter__()
+
+
+def intention_name(intention_strategy: IntentionSelectionStrategy) -> str:
+    return getattr(intention_strategy, "__name__", repr(intention_strategy))
+
+
+def is_intention_option(option: Option) -> bool:
+    # the placeholder options of the trámite selects have negative values
+    try:
+        return float(option.value) >= 0
+    except ValueError:
+        return False
@@ -0,0 +1,176 @@
+import sqlite3
+from datetime import datetime
+from typing import NamedTuple, Iterable, List, Tuple, Set
+
+_schema = """
+CREATE TABLE IF NOT EXISTS targets (
+    id INTEGER PRIMARY KEY,
+    province TEXT NOT NULL,
+    office TEXT NOT NULL,
+    intention TEXT NOT NULL,
+    UNIQUE (province, office, intention)
+);
+-- consecutive scrapes with the same slots are merged into one row
+CREATE TABLE IF NOT EXISTS observations (
+    target_id INTEGER NOT NULL REFERENCES targets (id),
+    first_seen INTEGER NOT NULL,
+    last_seen INTEGER NOT NULL,
+    scrapes INTEGER NOT NULL,
+    slot_count INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS observations_by_target ON observations (target_id, first_seen);
+-- only the changes of the slots are stored
+CREATE TABLE IF NOT EXISTS slot_events (
+    target_id INTEGER NOT NULL REFERENCES targets (id),
+    seen INTEGER NOT NULL,
+    slot INTEGER NOT NULL,
+    appeared INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS slot_events_by_target ON slot_events (target_id, seen);
+CREATE TABLE IF NOT EXISTS current_slots (
+    target_id INTEGER NOT NULL REFERENCES targets (id),
+    slot INTEGER NOT NULL,
+    PRIMARY KEY (target_id, slot)
+) WITHOUT ROWID;
+"""
+
+
+class Target(NamedTuple):
+    province: str
+    office: str
+    intention: str
+
+
+class SlotDiff(NamedTuple):
+    new: List[datetime]
+    vanished: List[datetime]
+    available: int
+
+    def __bool__(self) -> bool:
+        return bool(self.new or self.vanished)
+
+
+class SlotEvent(NamedTuple):
+    seen: datetime
+    slot: datetime
+    appeared: bool
+
+
+def _encode_slot(slot: datetime) -> int:
+    # e.g. 202201270950; compact, sortable and independent of time zones
+    return int(slot.strftime("%Y%m%d%H%M"))
+
+
+def _decode_slot(slot: int) -> datetime:
+    return datetime.strptime(str(slot), "%Y%m%d%H%M")
+
+
+def _encode_time(time: datetime) -> int:
+    return int(time.timestamp())
+
+
+class AppointmentHistory:
+    """Local store of the scraped appointments that only keeps what changed between two scrapes of a target."""
+
+    def __init__(self, path: str):
+        self._connection = sqlite3.connect(path)
+        self._connection.execute("PRAGMA journal_mode = WAL")
+        self._connection.executescript(_schema)
+
+    def _target_id(self, target: Target) -> int:
+        self._connection.execute("INSERT OR IGNORE INTO targets (province, office, intention) VALUES (?, ?, ?)",
+                                 target)
+        return self._connection.execute("SELECT id FROM targets WHERE province = ? AND office = ? AND intention = ?",
+                                        target).fetchone()[0]
+
+    def record(self, target: Target, slots: Iterable[datetime], seen: datetime = None) -> SlotDiff:
+        """Stores a scrape and returns the slots that appeared or vanished since the previous scrape of the target."""
+        seen = _encode_time(seen if seen is not None else datetime.now())
+        slots: Set[int] = {_encode_slot(slot) for slot in slots}
+        with self._connection:
+            target_id = self._target_id(target)
+            previous = {slot for (slot,) in self._connection.execute(
+                "SELECT slot FROM current_slots WHERE target_id = ?", (target_id,))}
+            new, vanished = sorted(slots - previous), sorted(previous - slots)
+
+            self._connection.executemany(
+                "INSERT INTO slot_events (target_id, seen, slot, appeared) VALUES (?, ?, ?, ?)",
+                [(target_id, seen, slot, 1) for slot in new] + [(target_id, seen, slot, 0) for slot in vanished])
+            self._connection.executemany("INSERT INTO current_slots (target_id, slot) VALUES (?, ?)",
+                                         [(target_id, slot) for slot in new])
+            self._connection.executemany("DELETE FROM current_slots WHERE target_id = ? AND slot = ?",
+                                         [(target_id, slot) for slot in vanished])
+
+            last_observation = self._connection.execute(
+                "SELECT rowid, slot_count FROM observations WHERE target_id = ? ORDER BY rowid DESC LIMIT 1",
+                (target_id,)).fetchone()
+            if last_observation is not None and not new and not vanished and last_observation[1] == len(slots):
+                self._connection.execute(
+                    "UPDATE observations SET last_seen = ?, scrapes = scrapes + 1 WHERE rowid = ?",
+                    (seen, last_observation[0]))
+            else:
+                self._connection.execute("INSERT INTO observations (target_id, first_seen, last_seen, scrapes, "
+                                         "slot_count) VALUES (?, ?, ?, 1, ?)", (target_id, seen, seen, len(slots)))
+        return SlotDiff([_decode_slot(slot) for slot in new], [_decode_slot(slot) for slot in vanished], len(slots))
+
+    def record_no_appointments(self, province: str, intention: str, office: str = None, seen: datetime = None) \
+            -> List[Tuple[Target, SlotDiff]]:
+        """Records that there are no appointments for the province, or only for the office if it is given.
+        The site does not tell which offices it checked, so all known offices of the province are updated.
+        """
+        targets = [target for target in self.targets() if target.province == province and
+                   target.intention == intention and (office is None or target.office == office)]
+        if office is not None and not targets:
+            targets = [Target(province, office, intention)]
+        return [(target, self.record(target, [], seen)) for target in targets]
+
+    def current_slots(self, target: Target) -> List[datetime]:
+        return [_decode_slot(slot) for (slot,) in self._connection.execute(
+            "SELECT slot FROM current_slots JOIN targets ON targets.id = target_id "
+            "WHERE province = ? AND office = ? AND intention = ? ORDER BY slot", target)]
+
+    def availability(self, target: Target, since: datetime = None, until: datetime = None) \
+            -> List[Tuple[datetime, datetime, int]]:
+        """Returns the periods in which the number of available slots stayed the same, as (from, to, count)."""
+        rows = self._connection.execute(
+            "SELECT first_seen, last_seen, slot_count FROM observations JOIN targets ON targets.id = target_id "
+            "WHERE province = ? AND office = ? AND intention = ? AND last_seen >= ? AND first_seen <= ? "
+            "ORDER BY first_seen",
+            (*target, _encode_time(since) if since else 0, _encode_time(until) if until else 2 ** 62))
+        return [(datetime.fromtimestamp(first), datetime.fromtimestamp(last), count) for first, last, count in rows]
+
+    def events(self, target: Target, since: datetime = None) -> List[SlotEvent]:
+        rows = self._connection.execute(
+            "SELECT seen, slot, appeared FROM slot_events JOIN targets ON targets.id = target_id "
+            "WHERE province = ? AND office = ? AND intention = ? AND seen >= ? ORDER BY seen, slot",
+            (*target, _encode_time(since) if since else 0))
+        return [SlotEvent(datetime.fromtimestamp(seen), _decode_slot(slot), bool(appeared))
+                for seen, slot, appeared in rows]
+
+    def slot_lifetimes(self, target: Target) -> List[Tuple[datetime, float]]:
+        """Returns how many seconds each vanished slot was available, which tells how fast one has to be."""
+        appeared_at = {}
+        lifetimes = []
+        for event in self.events(target):
+            if event.appeared:
+                appeared_at[event.slot] = event.seen
+            elif event.slot in appeared_at:
+                lifetimes.append((event.slot, (event.seen - appeared_at.pop(event.slot)).total_seconds()))
+        return lifetimes
+
+    def observations(self, intention: str) -> List[Tuple[str, str, datetime, int, int]]:
+        """Returns all observations of the offices for the intention as (province, office, first seen, scrapes,
+        slot count), in the order they were made.
+        """
+        rows = self._connection.execute(
+            "SELECT province, office, first_seen, scrapes, slot_count FROM observations "
+            "JOIN targets ON targets.id = target_id WHERE intention = ? ORDER BY first_seen", (intention,))
+        return [(province, office, datetime.fromtimestamp(first_seen), scrapes, slot_count)
+                for province, office, first_seen, scrapes, slot_count in rows]
+
+    def targets(self) -> List[Target]:
+        return [Target(*row) for row in self._connection.execute(
+            "SELECT province, office, intention FROM targets ORDER BY province, office, intention")]
+
+    def close(self) -> None:
+        self._connection.close()
@@ -0,0 +1,446 @@
+import html
+import http.client
+import http.cookiejar
+import urllib.parse
+import urllib.request
+from html.parser import HTMLParser
+from typing import Dict, Tuple, List, Optional, NamedTuple, Callable
+
+from niescraper.appointmentchecker import url, AppointmentChecker, FormValues, FormField, OfficeSelectionStrategy, \
+    IntentionSelectionStrategy, is_intention_option
+from niescraper.browserprofile import DriverProfile
+from niescraper.catalog import Catalog
+from niescraper.driverlifecycle import DriverLifecycle
+from niescraper.instrumentation import CheckInstrumentation
+from niescraper.options import Option, normalize_option_text
+from niescraper.readiness import Pacing
+from niescraper.requestbudget import RequestBudget, BlockedException, block_reason
+
+no_appointments_text = "En este momento no hay citas disponibles"
+
+
+class HttpResponse(NamedTuple):
+    url: str
+    status: int
+    headers: http.client.HTTPMessage
+    text: str
+
+
+class _CookieResponse:
+    """Adapter that lets a cookie jar read the headers of an http.client response."""
+
+    def __init__(self, headers: http.client.HTTPMessage):
+        self._headers = headers
+
+    def info(self) -> http.client.HTTPMessage:
+        return self._headers
+
+
+class HttpSession:
+    """Minimal HTTP client that keeps one persistent connection per host and handles cookies and redirects.
+    With a budget, every request waits for its turn, and responses that look like block pages raise a
+    BlockedException.
+    """
+
+    user_agent = "Mozilla/5.0 (X11; Linux x86_64; rv:109.0) Gecko/20100101 Firefox/115.0"
+
+    def __init__(self, timeout: float = 30, budget: RequestBudget = None):
+        self.timeout = timeout
+        self.budget = budget
+        self.cookies = http.cookiejar.CookieJar()
+        self._connections: Dict[Tuple[str, str, int], http.client.HTTPConnection] = {}
+
+    def _connection(self, scheme: str, host: str, port: int) -> http.client.HTTPConnection:
+        key = (scheme, host, port)
+        connection = self._connections.get(key)
+        if connection is None:
+            connection_type = http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+            connection = connection_type(host, port, timeout=self.timeout)
+            self._connections[key] = connection
+        return connection
+
+    def _send(self, method: str, target: str, body: Optional[bytes], headers: Dict[str, str]) \
+            -> http.client.HTTPResponse:
+        parts = urllib.parse.urlsplit(target)
+        path = urllib.parse.urlunsplit(("", "", parts.path or "/", parts.query, ""))
+        key = self._connection_key(target)
+        while True:
+            reused = key in self._connections
+            connection = self._connection(*key)
+            try:
+                connection.request(method, path, body=body, headers=headers)
+                return connection.getresponse()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError,
+                    http.client.CannotSendRequest):
+                connection.close()
+                del self._connections[key]
+                # only retry if the server closed a kept-alive connection
+                if not reused:
+                    raise
+
+    def request(self, method: str, target: str, data: List[Tuple[str, str]] = None, referer: str = None,
+                encoding: str = "utf-8", max_redirects: int = 10) -> HttpResponse:
+        body = urllib.parse.urlencode(data, encoding=encoding).encode("ascii") if data is not None else None
+        for _ in range(max_redirects + 1):
+            cookie_request = urllib.request.Request(target, method=method)
+            self.cookies.add_cookie_header(cookie_request)
+            headers = {"User-Agent": self.user_agent, "Connection": "keep-alive",
+                       **dict(cookie_request.header_items())}
+            if referer:
+                headers["Referer"] = referer
+            if body is not None:
+                headers["Content-Type"] = "application/x-www-form-urlencoded"
+
+            if self.budget is not None:
+                self.budget.acquire(self, target)
+            response = self._send(method, target, body, headers)
+            content = response.read()
+            self.cookies.extract_cookies(_CookieResponse(response.msg), cookie_request)
+            if response.will_close:
+                self._connections.pop(self._connection_key(target), None)
+
+            if response.status in (301, 302, 303, 307, 308) and response.getheader("Location"):
+                referer = target
+                target = urllib.parse.urljoin(target, response.getheader("Location"))
+                if response.status not in (307, 308):
+                    method, body = "GET", None
+                continue
+
+            charset = response.msg.get_content_charset() or "utf-8"
+            text = content.decode(charset, errors="replace")
+            if self.budget is not None:
+                reason = block_reason(text, response.status)
+                if reason is not None:
+                    self.budget.record_block(reason)
+                    raise BlockedException(f"{target}: {reason}")
+                self.budget.record_success()
+            return HttpResponse(target, response.status, response.msg, text)
+        raise FlowDivergedException(f"Too many redirects for {target}")
+
+    @staticmethod
+    def _connection_key(target: str) -> Tuple[str, str, int]:
+        parts = urllib.parse.urlsplit(target)
+        return parts.scheme, parts.hostname, parts.port or (443 if parts.scheme == "https" else 80)
+
+    def close(self):
+        for connection in self._connections.values():
+            connection.close()
+        self._connections.clear()
+
+
+class FlowDivergedException(Exception):
+    pass
+
+
+class _Field:
+    def __init__(self, attrs: Dict[str, str]):
+        self.id = attrs.get("id")
+        self.name = attrs.get("name")
+        self.type = attrs.get("type", "text").lower()
+        self.value = attrs.get("value", "")
+        self.checked = "checked" in attrs
+
+
+class _Select:
+    def __init__(self, attrs: Dict[str, str]):
+        self.id = attrs.get("id")
+        self.name = attrs.get("name")
+        self.options: List[Option] = []
+        self.value: Optional[str] = None
+
+
+class _Form:
+    def __init__(self, attrs: Dict[str, str]):
+        self.id = attrs.get("id")
+        self.action = attrs.get("action", "")
+        self.method = attrs.get("method", "get").upper()
+        self.fields: List[_Field] = []
+        self.selects: List[_Select] = []
+        self.element_ids = set()
+
+    def data(self) -> List[Tuple[str, str]]:
+        data = []
+        for field in self.fields:
+            if not field.name or field.type in ("button", "submit", "reset", "image", "file"):
+                continue
+            if field.type in ("radio", "checkbox") and not field.checked:
+                continue
+            data.append((field.name, field.value))
+        for select in self.selects:
+            if not select.name:
+                continue
+            value = select.value
+            if value is None:
+                value = select.options[0].value if select.options else ""
+            data.append((select.name, value))
+        return data
+
+
+class _Page(HTMLParser):
+    """The forms, selects and element ids of one page, parsed in a single pass over the HTML."""
+
+    def __init__(self, response: HttpResponse):
+        super().__init__(convert_charrefs=True)
+        self.url = response.url
+        self.encoding = response.headers.get_content_charset() or "utf-8"
+        self.text = html.unescape(response.text)
+        self.forms: List[_Form] = []
+        self.selects: Dict[str, _Select] = {}
+        self.element_ids = set()
+        self._form: Optional[_Form] = None
+        self._select: Optional[_Select] = None
+        self._option: Optional[Tuple[Optional[str], bool, List[str]]] = None
+        self._textarea: Optional[_Field] = None
+        self.feed(response.text)
+        self.close()
+
+    def handle_starttag(self, tag, attrs):
+        attrs = {name: value if value is not None else "" for name, value in attrs}
+        if "id" in attrs:
+            self.element_ids.add(attrs["id"])
+            if self._form is not None:
+                self._form.element_ids.add(attrs["id"])
+        if tag == "form":
+            self._form = _Form(attrs)
+            self.forms.append(self._form)
+        elif tag in ("input", "button"):
+            field = _Field(attrs)
+            if self._form is not None:
+                self._form.fields.append(field)
+        elif tag == "textarea":
+            self._textarea = _Field(attrs)
+            if self._form is not None:
+                self._form.fields.append(self._textarea)
+        elif tag == "select":
+            self._select = _Select(attrs)
+            if self._select.id:
+                self.selects[self._select.id] = self._select
+            if self._form is not None:
+                self._form.selects.append(self._select)
+        elif tag == "option" and self._select is not None:
+            self._finish_option()
+            self._option = (attrs.get("value"), "selected" in attrs, [])
+
+    def handle_endtag(self, tag):
+        if tag == "form":
+            self._form = None
+        elif tag == "textarea":
+            self._textarea = None
+        elif tag == "option":
+            self._finish_option()
+        elif tag == "select":
+            self._finish_option()
+            self._select = None
+
+    def handle_data(self, data):
+        if self._option is not None:
+            self._option[2].append(data)
+        elif self._textarea is not None:
+            self._textarea.value += data
+
+    def _finish_option(self):
+        if self._option is None or self._select is None:
+            return
+        value, selected, parts = self._option
+        text = " ".join("".join(parts).split())
+        option = Option.create(self._select.id or "", value if value is not None else text, text)
+        self._select.options.append(option)
+        if selected:
+            self._select.value = option.value
+        self._option = None
+
+    def form_with(self, element_id: str) -> _Form:
+        try:
+            return next(form for form in self.forms if element_id in form.element_ids)
+        except StopIteration:
+            raise FlowDivergedException(f"No form containing #{element_id} on {self.url}")
+
+    def options(self, select_id: str, accept: Callable[[Option], bool] = lambda _: True) -> List[Option]:
+        select = self.selects.get(select_id)
+        if select is None:
+            return []
+        return [option for option in select.options if accept(option)]
+
+    def select(self, option: Optional[Option]) -> None:
+        if option is not None:
+            self.selects[option.select_id].value = option.value
+
+
+class HttpCheckEngine:
+    """Replays the ICP form sequence with plain HTTP requests instead of a browser.
+    This only works as long as the pages can be submitted without running their JavaScript; whenever the flow looks
+    different than expected, a FlowDivergedException is raised.
+    """
+
+    def __init__(self, start_url: str = url, session: HttpSession = None, budget: RequestBudget = None):
+        self.start_url = start_url
+        self.session = session if session is not None else HttpSession(budget=budget)
+        # the options selected during the last check
+        self.last_province: Optional[Option] = None
+        self.last_office: Optional[Option] = None
+
+    def _get(self, target: str, referer: str = None) -> _Page:
+        return self._page(self.session.request("GET", target, referer=referer))
+
+    def _submit(self, page: _Page, button_id: str, values: Dict[str, str] = None) -> _Page:
+        form = page.form_with(button_id)
+        data = form.data()
+        if values:
+            data = [(name, values.pop(name) if name in values else value) for name, value in data]
+            data.extend(values.items())
+        action = urllib.parse.urljoin(page.url, form.action)
+        if form.method == "POST":
+            response = self.session.request("POST", action, data, referer=page.url, encoding=page.encoding)
+        else:
+            query = urllib.parse.urlencode(data, encoding=page.encoding)
+            response = self.session.request("GET", urllib.parse.urljoin(action, "?" + query), referer=page.url)
+        return self._page(response)
+
+    @staticmethod
+    def _page(response: HttpResponse) -> _Page:
+        if response.status >= 400:
+            raise FlowDivergedException(f"{response.url} returned status {response.status}")
+        return _Page(response)
+
+    def _select_province(self, page: _Page, office_strategy: OfficeSelectionStrategy) -> _Page:
+        provinces = page.options("form", lambda option: option.value != "")
+        if not provinces:
+            raise FlowDivergedException(f"No provinces found on {page.url}")
+        province = office_strategy.select_province(provinces)
+        if province is None:
+            raise FlowDivergedException("The office strategy did not select a province")
+        self.last_province = province
+        page.select(province)
+        # the province options link to the page of the province, which is opened via JavaScript
+        if "/" in province.value or "?" in province.value:
+            return self._get(urllib.parse.urljoin(page.url, province.value), referer=page.url)
+        return self._submit(page, "btnAceptar")
+
+    def _select_intention(self, page: _Page, office_strategy: OfficeSelectionStrategy,
+                          intention_strategy: IntentionSelectionStrategy) -> _Page:
+        offices = page.options("sede", lambda option: option.value not in ("", "99"))
+        self.last_office = office_strategy.pre_select_office(offices)
+        page.select(self.last_office)
+
+        intention_options = [option for select_id, select in page.selects.items() if "tramiteGrupo[" in select_id
+                             for option in select.options if is_intention_option(option)]
+        page.select(intention_strategy(intention_options))
+        return self._submit(page, "btnAceptar")
+
+    @staticmethod
+    def _applicant_data(page: _Page, form_values: FormValues) -> Dict[str, str]:
+        form = page.form_with("btnEnviar")
+        values = {}
+        for field in form.fields:
+            if field.type == "radio" and field.id == form_values.identification_method.value:
+                values[field.name] = field.value
+        for field_id, value in (("txtIdCitado", form_values.identifier),
+                                ("txtDesCitado", form_values[FormField.Name]),
+                                ("txtAnnoCitado", form_values[FormField.YearOfBirth])):
+            field = next((field for field in form.fields if field.id == field_id), None)
+            if value and field is not None and field.name:
+                values[field.name] = value
+
+        native_country = form_values[FormField.NativeCountry]
+        countries = page.selects.get("txtPaisNac")
+        if native_country and countries is not None and countries.name:
+            country = next((option for option in countries.options if
+                            option.normalized == normalize_option_text(native_country)), None)
+            if country is not None:
+                values[countries.name] = country.value
+        return values
+
+    def check_citas_available(self, form_values: FormValues, office_strategy: OfficeSelectionStrategy,
+                              intention_strategy: IntentionSelectionStrategy) -> bool:
+        """Runs the form sequence up to the point where the site tells whether there are appointments.
+        Returns False if there are none and True otherwise, without selecting an office or filling in contact data.
+        """
+        self.last_province = self.last_office = None
+        page = self._get(self.start_url)
+        page = self._select_province(page, office_strategy)
+        page = self._select_intention(page, office_strategy, intention_strategy)
+        page = self._submit(page, "btnEntrar")
+        page = self._submit(page, "btnEnviar", self._applicant_data(page, form_values))
+        page = self._submit(page, "btnEnviar")
+
+        if no_appointments_text in page.text:
+            return False
+        if "idSede" in page.element_ids or "btnSiguiente" in page.element_ids:
+            return True
+        raise FlowDivergedException(f"Unexpected result page {page.url}")
+
+
+class _RepeatedSelections(OfficeSelectionStrategy):
+    """Passes the choices of an office strategy through and repeats them when asked again, so that the browser check
+    that follows an HTTP check selects what the HTTP check selected, even with a strategy that chooses differently
+    every time, e.g. by exploring. Releasing an office lets the strategy choose anew.
+    """
+
+    def __init__(self, strategy: OfficeSelectionStrategy):
+        self.strategy = strategy
+        self._choices: Dict[str, Optional[Option]] = {}
+
+    def _choose(self, name: str, options: List[Option]) -> Optional[Option]:
+        if name not in self._choices:
+            self._choices[name] = getattr(self.strategy, name)(options)
+        return self._choices[name]
+
+    def select_province(self, provinces: List[Option]) -> Optional[Option]:
+        return self._choose("select_province", provinces)
+
+    def select_office(self, offices: List[Option]) -> Optional[Option]:
+        return self._choose("select_office", offices)
+
+    def pre_select_office(self, offices: List[Option]) -> Optional[Option]:
+        return self._choose("pre_select_office", offices)
+
+    def release_office(self, province: Option, office: Option) -> None:
+        self._choices.clear()
+        self.strategy.release_office(province, office)
+
+    def resolve(self, catalog: Catalog) -> None:
+        self.strategy.resolve(catalog)
+
+
+class FastAppointmentChecker(AppointmentChecker):
+    """Checks with plain HTTP requests first and only uses the browser if there seem to be appointments or if the
+    HTTP flow diverges from the expected one. In both cases, the browser ends up where AppointmentChecker would.
+    """
+
+    def __init__(self, slow: bool = False, profile: DriverProfile = None, pacing: Pacing = None,
+                 catalog: Catalog = None, engine: HttpCheckEngine = None, start_url: str = url,
+                 instrumentation: CheckInstrumentation = None, lifecycle: DriverLifecycle = None,
+                 budget: RequestBudget = None, on_browser_restart: Callable[[BaseException], None] = None):
+        super().__init__(slow, profile, pacing, catalog, start_url, instrumentation, lifecycle, budget,
+                         on_browser_restart)
+        self.engine = engine if engine is not None else HttpCheckEngine(start_url, budget=budget)
+
+    def _check_with_engine(self, form_values: FormValues, office_strategy: OfficeSelectionStrategy,
+                           intention_strategy: IntentionSelectionStrategy) -> bool:
+        """Returns whether the HTTP check found no appointments, in which case its selections are the last ones."""
+        self.last_province = self.last_office = None
+        self.last_booking = None
+        if self.instrumentation is not None:
+            self.instrumentation.start_check()
+            self.instrumentation.enter_step("http")
+        try:
+            available = self.engine.check_citas_available(form_values, office_strategy, intention_strategy)
+        except (FlowDivergedException, http.client.HTTPException, OSError):
+            return False
+        if available:
+            return False
+        self.last_province, self.last_office = self.engine.last_province, self.engine.last_office
+        if self.instrumentation is not None:
+            self.instrumentation.finish_check(*self._selection_texts(), available=False)
+        return True
+
+    def check_citas_available(self, form_values: FormValues, office_strategy: OfficeSelectionStrategy,
+                              intention_strategy: IntentionSelectionStrategy):
+        # an interactive strategy needs the browser from the start
+        if office_strategy.interactive:
+            return super().check_citas_available(form_values, office_strategy, intention_strategy)
+        # the browser selects the province and office the HTTP check found appointments for
+        office_strategy = _RepeatedSelections(office_strategy)
+        if self._check_with_engine(form_values, office_strategy, intention_strategy):
+            return False
+        return super().check_citas_available(form_values, office_strategy, intention_strategy)
@@ -0,0 +1,132 @@
+import collections
+import datetime
+import json
+import statistics
+import threading
+import time
+from typing import Dict, Optional, Deque, Tuple, List, TYPE_CHECKING
+
+from niescraper.readiness import steps
+
+if TYPE_CHECKING:
+    from niescraper.browserbackend import BrowserBackend
+
+# several checkers may append to the same file
+_file_lock = threading.Lock()
+
+
+class StepRecord:
+    """What happened during a step: the time spent on its page including submitting it, the browser commands sent
+    and the time spent in them, and the time slept to stay on the page for its minimum delay.
+    """
+
+    def __init__(self):
+        self.seconds = 0.0
+        self.commands = 0
+        self.command_seconds = 0.0
+        self.sleep_seconds = 0.0
+
+    def to_json(self) -> Dict[str, float]:
+        return {"seconds": round(self.seconds, 4), "commands": self.commands,
+                "command_seconds": round(self.command_seconds, 4), "sleep_seconds": round(self.sleep_seconds, 4)}
+
+
+class CheckInstrumentation:
+    """Opt-in timing of the steps of every check. Writes a JSON line per check if a path is given and keeps the step
+    times of the recent checks for a summary.
+    """
+
+    def __init__(self, path: str = None, window: int = 100):
+        self.path = path
+        self.last_record: Optional[dict] = None
+        self._steps: Dict[str, StepRecord] = {}
+        self._step: Optional[str] = None
+        self._step_started = 0.0
+        self._recent: Dict[str, Deque[float]] = collections.defaultdict(lambda: collections.deque(maxlen=window))
+
+    def wrap(self, driver: "BrowserBackend") -> "BrowserBackend":
+        """Counts and times the commands that are sent to the browser."""
+        execute = driver.execute
+
+        def timed_execute(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return execute(*args, **kwargs)
+            finally:
+                if self._step is not None:
+                    record = self._steps[self._step]
+                    record.commands += 1
+                    record.command_seconds += time.perf_counter() - start
+
+        driver.execute = timed_execute
+        return driver
+
+    def start_check(self) -> None:
+        self._steps = {}
+        self._step = None
+
+    def enter_step(self, step: str) -> None:
+        """Ends the current step and starts the given one. Entering a step again adds to its record."""
+        self.pause()
+        self._step = step
+        self._step_started = time.perf_counter()
+        self._steps.setdefault(step, StepRecord())
+
+    def pause(self) -> None:
+        """Ends the current step without starting another, e.g. while a prepared check waits for its release."""
+        if self._step is not None:
+            self._steps[self._step].seconds += time.perf_counter() - self._step_started
+            self._step = None
+
+    def add_sleep(self, seconds: float) -> None:
+        if self._step is not None:
+            self._steps[self._step].sleep_seconds += seconds
+
+    def finish_check(self, province: str, office: str, available: bool = None, error: BaseException = None) -> dict:
+        self.pause()
+        record = {
+            "time": datetime.datetime.now().isoformat(timespec="seconds"),
+            "province": province,
+            "office": office,
+            "result": type(error).__name__ if error is not None else available,
+            "seconds": round(sum(step.seconds for step in self._steps.values()), 4),
+            "steps": {step: record.to_json() for step, record in self._steps.items()},
+        }
+        self.last_record = record
+        for step, step_record in self._steps.items():
+            self._recent[step].append(step_record.seconds)
+        self._recent["total"].append(record["seconds"])
+        if self.path is not None:
+            with _file_lock, open(self.path, "a", encoding="utf-8") as file:
+                file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        return record
+
+    def breakdown(self) -> str:
+        """The step times of the last check, e.g. "province 1.20s/6, intention 0.85s/9, ..." with command counts."""
+        if self.last_record is None:
+            return ""
+        return ", ".join(f"{step} {record['seconds']:.2f}s/{record['commands']}"
+                         for step, record in self.last_record["steps"].items())
+
+    def summary(self) -> Dict[str, Tuple[float, float]]:
+        """Returns the 50th and 95th percentile of the recent times of every recorded step and of the whole check.
+        Steps that are not steps of the browser check, like the HTTP check that precedes it, come first.
+        """
+        recorded = sorted((step for step in self._recent if step != "total"),
+                          key=lambda step: steps.index(step) if step in steps else -1)
+        summary = {}
+        for step in [*recorded, "total"]:
+            times = list(self._recent.get(step, ()))
+            if not times:
+                continue
+            if len(times) == 1:
+                summary[step] = (times[0], times[0])
+            else:
+                summary[step] = (statistics.median(times), statistics.quantiles(times, n=20)[-1])
+        return summary
+
+    def summary_lines(self) -> List[str]:
+        lines = [f"{'step':<10} {'p50':>8} {'p95':>8}"]
+        for step, (p50, p95) in self.summary().items():
+            lines.append(f"{step:<10} {p50:>7.2f}s {p95:>7.2f}s")
+        return lines
@@ -0,0 +1,126 @@
+import asyncio
+import heapq
+import json
+import traceback
+from typing import NamedTuple, Optional, List, Callable, Awaitable, Tuple
+
+from niescraper.appointmentchecker import AppointmentChecker, OfficeSelectionStrategy, IntentionSelectionStrategy, \
+    FormValues, FormField, IdentificationMethod
+from niescraper.intentionselection import find_assign_nie_option, find_register_eu_citizen_option
+from niescraper.officeselection import NearestValenciaOfficeSelectionStrategy, SpecificOfficeSelectionStrategy
+from niescraper.requestbudget import BlockedException
+
+intention_strategies = {
+    "nie": find_assign_nie_option,
+    "registration": find_register_eu_citizen_option,
+}
+
+
+class MonitorTarget(NamedTuple):
+    name: str
+    office_strategy: OfficeSelectionStrategy
+    intention_strategy: IntentionSelectionStrategy
+    form_values: FormValues
+    # seconds between two checks of the target; None follows the release schedule
+    interval: Optional[float] = None
+
+
+def load_targets(path: str) -> List[MonitorTarget]:
+    """Reads the targets from a JSON file like
+    [{"name": "nie-bailen", "intention": "nie", "office": {"province": "Valencia", "office": "Bailen"},
+      "identification": "ByNIE", "applicant": {"NieNumber": "Y1234567X", "Name": "My Name"}, "interval": 30}].
+    The office can also be "nearvalencia". Applicant fields are named like the members of FormField.
+    Raises a ValueError if the file has no targets.
+    """
+    with open(path, encoding="utf-8") as file:
+        entries = json.load(file)
+    if not entries:
+        raise ValueError(f"{path} has no targets")
+    targets = []
+    for number, entry in enumerate(entries):
+        office = entry.get("office", "nearvalencia")
+        if office == "nearvalencia":
+            office_strategy = NearestValenciaOfficeSelectionStrategy()
+        else:
+            office_strategy = SpecificOfficeSelectionStrategy(office["province"], office["office"])
+        form_values = FormValues(IdentificationMethod[entry.get("identification", "ByNIE")],
+                                 {FormField[field]: value for field, value in entry.get("applicant", {}).items()})
+        targets.append(MonitorTarget(entry.get("name", f"target {number + 1}"), office_strategy,
+                                     intention_strategies[entry.get("intention", "nie")], form_values,
+                                     entry.get("interval")))
+    return targets
+
+
+class _DueQueue:
+    """Hands out the indices of the targets that are due, longest waiting first, so that all targets get their turn
+    even if the checkers cannot keep up with the intervals.
+    """
+
+    def __init__(self):
+        self._heap: List[Tuple[float, int, int]] = []
+        self._sequence = 0
+        self._condition = asyncio.Condition()
+
+    async def put(self, index: int, due: float) -> None:
+        async with self._condition:
+            heapq.heappush(self._heap, (due, self._sequence, index))
+            self._sequence += 1
+            self._condition.notify_all()
+
+    async def get(self) -> int:
+        loop = asyncio.get_running_loop()
+        async with self._condition:
+            while True:
+                if self._heap and self._heap[0][0] <= loop.time():
+                    return heapq.heappop(self._heap)[2]
+                timeout = self._heap[0][0] - loop.time() if self._heap else None
+                try:
+                    await asyncio.wait_for(self._condition.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+
+
+async def monitor_targets(targets: List[MonitorTarget], checkers: List[AppointmentChecker],
+                          on_result: Callable[[MonitorTarget, AppointmentChecker, bool], bool],
+                          alarm: Callable[[MonitorTarget, AppointmentChecker], Awaitable[None]],
+                          next_interval: Callable[[], float] = lambda: 60, checks: int = None,
+                          on_blocked: Callable[[MonitorTarget, BlockedException], None] = None) -> None:
+    """Keeps checking the targets, each checker with its own browser checking one target at a time.
+    on_result is called in the thread of the check and returns whether to raise the alarm for the result.
+    on_blocked is called if the request budget held a check back, which is then repeated after the interval.
+    The checker of a target with an alarm is kept on its page until the alarm is acknowledged, while the other
+    checkers continue.
+    Stops after the given number of checks, or never.
+    """
+    loop = asyncio.get_running_loop()
+    queue = _DueQueue()
+    for index in range(len(targets)):
+        await queue.put(index, loop.time())
+    started = 0
+
+    def check(checker: AppointmentChecker, target: MonitorTarget) -> bool:
+        available = checker.check_citas_available(target.form_values, target.office_strategy,
+                                                  target.intention_strategy)
+        return on_result(target, checker, available)
+
+    async def worker(checker: AppointmentChecker) -> None:
+        nonlocal started
+        while checks is None or started < checks:
+            index = await queue.get()
+            if checks is not None and started >= checks:
+                return
+            started += 1
+            target = targets[index]
+            try:
+                # the browser blocks, so the check runs in a thread of its own
+                if await asyncio.to_thread(check, checker, target):
+                    await alarm(target, checker)
+            except BlockedException as e:
+                if on_blocked is not None:
+                    on_blocked(target, e)
+            except Exception:
+                traceback.print_exc()
+            interval = target.interval if target.interval is not None else next_interval()
+            await queue.put(index, loop.time() + interval)
+
+    await asyncio.gather(*(worker(checker) for checker in checkers))
@@ -0,0 +1,202 @@
+import abc
+import datetime
+import json
+import queue
+import shutil
+import subprocess
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import NamedTuple, List, Optional, Callable, Dict, Deque
+
+
+class Notification(NamedTuple):
+    title: str
+    message: str
+    # notifications with the same key are only sent once within the deduplication window
+    key: str = ""
+
+
+class Alert:
+    """A notification that was sent and waits for the user to acknowledge it."""
+
+    def __init__(self, notification: Notification):
+        self.notification = notification
+        self.acknowledged = threading.Event()
+
+
+class NotificationSink(abc.ABC):
+    @abc.abstractmethod
+    def send(self, notification: Notification) -> None:
+        pass
+
+    def acknowledge(self) -> None:
+        """Called once all alerts are acknowledged."""
+        pass
+
+
+def _play_alarm_file(block: bool = True) -> None:
+    # imported on the first alarm, since playsound loads PyObjC on macOS, which takes a while
+    import importlib.resources
+    from playsound import playsound
+    import niescraper.resources
+
+    with importlib.resources.path(niescraper.resources, 'alarm.mp3') as alarm_file:
+        playsound(str(alarm_file), block)
+
+
+class SoundSink(NotificationSink):
+    """Plays the alarm sound again and again until the alerts are acknowledged, but at most for max_seconds.
+    There is only one player thread, so the sounds of several alerts never overlap.
+    """
+
+    def __init__(self, max_seconds: float = 10 * 60, play: Callable[[], None] = _play_alarm_file):
+        self.max_seconds = max_seconds
+        self._play = play
+        self._stop = threading.Event()
+        self._until = 0.0
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def send(self, notification: Notification) -> None:
+        with self._lock:
+            self._until = time.monotonic() + self.max_seconds
+            self._stop.clear()
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="alarm-sound", daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stop.is_set() and time.monotonic() < self._until:
+            try:
+                self._play()
+            except Exception:
+                traceback.print_exc()
+                return
+
+    def acknowledge(self) -> None:
+        self._stop.set()
+
+    def join(self, timeout: float = None) -> None:
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+
+class DesktopSink(NotificationSink):
+    """Shows a desktop notification with notify-send on Linux or osascript on macOS, if available."""
+
+    def send(self, notification: Notification) -> None:
+        if sys.platform == "darwin" and shutil.which("osascript"):
+            script = f"display notification {json.dumps(notification.message)} " \
+                     f"with title {json.dumps(notification.title)}"
+            subprocess.run(["osascript", "-e", script], check=False, timeout=10)
+        elif shutil.which("notify-send"):
+            subprocess.run(["notify-send", "--urgency=critical", notification.title, notification.message],
+                           check=False, timeout=10)
+
+
+class WebhookSink(NotificationSink):
+    """Posts every notification as JSON, e.g. to a chat integration."""
+
+    def __init__(self, url: str, timeout: float = 10):
+        self.url = url
+        self.timeout = timeout
+
+    def send(self, notification: Notification) -> None:
+        import urllib.request
+
+        body = json.dumps({"title": notification.title, "message": notification.message, "key": notification.key,
+                           "time": datetime.datetime.now().isoformat(timespec="seconds")}).encode("utf-8")
+        request = urllib.request.Request(self.url, body, {"Content-Type": "application/json"}, method="POST")
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
+
+
+class FileSink(NotificationSink):
+    """Appends every notification as a JSON line."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def send(self, notification: Notification) -> None:
+        with open(self.path, "a", encoding="utf-8") as file:
+            file.write(json.dumps({"time": datetime.datetime.now().isoformat(timespec="seconds"),
+                                   **notification._asdict()}, ensure_ascii=False) + "\n")
+
+
+class NotificationDispatcher:
+    """Sends notifications to the sinks on a background thread, so that a slow sink never delays the checks.
+    Notifications with the same key are dropped within the deduplication window, and at most max_per_minute
+    notifications are sent.
+    """
+
+    def __init__(self, sinks: List[NotificationSink], dedup_seconds: float = 10 * 60, max_per_minute: int = 6):
+        self.sinks = sinks
+        self.dedup_seconds = dedup_seconds
+        self.max_per_minute = max_per_minute
+        self._sent_keys: Dict[str, float] = {}
+        self._sent_times: Deque[float] = deque()
+        self._alerts: List[Alert] = []
+        self._lock = threading.Lock()
+        self._queue: "queue.Queue[Optional[Notification]]" = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="notifications", daemon=True)
+        self._thread.start()
+        self._prompt: Optional[threading.Thread] = None
+
+    def notify(self, notification: Notification) -> Optional[Alert]:
+        """Queues the notification and returns its alert, or None if it was deduplicated or rate limited."""
+        now = time.monotonic()
+        with self._lock:
+            if notification.key and now - self._sent_keys.get(notification.key, -self.dedup_seconds) \
+                    < self.dedup_seconds:
+                return None
+            while self._sent_times and now - self._sent_times[0] >= 60:
+                self._sent_times.popleft()
+            if len(self._sent_times) >= self.max_per_minute:
+                print(f"Too many notifications, dropped: {notification.title}")
+                return None
+            self._sent_times.append(now)
+            if notification.key:
+                self._sent_keys[notification.key] = now
+            alert = Alert(notification)
+            self._alerts.append(alert)
+        self._queue.put(notification)
+        return alert
+
+    def _run(self) -> None:
+        while True:
+            notification = self._queue.get()
+            if notification is None:
+                return
+            for sink in self.sinks:
+                try:
+                    sink.send(notification)
+                except Exception as e:
+                    print(f"{type(sink).__name__} failed to send the notification: {e}")
+
+    def acknowledge_all(self) -> None:
+        with self._lock:
+            alerts, self._alerts = self._alerts, []
+        for alert in alerts:
+            alert.acknowledged.set()
+        for sink in self.sinks:
+            sink.acknowledge()
+
+    def prompt_for_acknowledgement(self) -> None:
+        """Lets the user acknowledge all alerts by pressing Enter, without blocking anything else."""
+        if self._prompt is not None:
+            return
+
+        def prompt():
+            while sys.stdin.readline():
+                self.acknowledge_all()
+
+        self._prompt = threading.Thread(target=prompt, name="acknowledgement", daemon=True)
+        self._prompt.start()
+
+    def close(self, timeout: float = None) -> None:
+        """Sends the queued notifications and stops the background thread."""
+        self._queue.put(None)
+        self._thread.join(timeout)
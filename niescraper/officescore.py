@@ -0,0 +1,72 @@
+import math
+from datetime import datetime
+from typing import Dict, Tuple, List
+
+from niescraper.history import AppointmentHistory
+
+
+class OfficeStats:
+    """How often an office was checked and had appointments, in total and by hour of the day."""
+
+    def __init__(self):
+        self.checks = 0
+        self.hits = 0
+        # the slots found by all checks with appointments
+        self.slots = 0
+        self.hourly_checks = [0] * 24
+        self.hourly_hits = [0] * 24
+
+    def record(self, hour: int, slot_count: int, checks: int = 1) -> None:
+        self.checks += checks
+        self.hourly_checks[hour] += checks
+        if slot_count > 0:
+            self.hits += checks
+            self.hourly_hits[hour] += checks
+            self.slots += slot_count * checks
+
+
+class OfficeScores:
+    """Learns from past checks how likely each office is to have appointments, so that crawls can check the
+    likeliest offices first.
+    The score of an office is its hit rate at the hour of the day, times a bonus for offices that offer many slots at
+    once. The hit rates are smoothed: an office that was never checked has the prior hit rate, and the rate at an
+    hour only departs from the overall rate of the office as checks at that hour add up.
+    """
+
+    def __init__(self, prior_hit_rate: float = 0.05, prior_checks: float = 2):
+        self.prior_hit_rate = prior_hit_rate
+        self.prior_checks = prior_checks
+        self._stats: Dict[Tuple[str, str], OfficeStats] = {}
+        self._offices_by_province: Dict[str, List[str]] = {}
+
+    @staticmethod
+    def from_history(history: AppointmentHistory, intention: str) -> "OfficeScores":
+        scores = OfficeScores()
+        for province, office, first_seen, scrapes, slot_count in history.observations(intention):
+            # scrapes with the same slots are merged, so all of them count for the hour in which the slots appeared
+            scores.record(province, office, slot_count, first_seen, scrapes)
+        return scores
+
+    def record(self, province: str, office: str, slot_count: int, seen: datetime = None, checks: int = 1) -> None:
+        key = (province, office)
+        if key not in self._stats:
+            self._stats[key] = OfficeStats()
+            self._offices_by_province.setdefault(province, []).append(office)
+        self._stats[key].record((seen if seen is not None else datetime.now()).hour, slot_count, checks)
+
+    def score(self, province: str, office: str, hour: int = None) -> float:
+        stats = self._stats.get((province, office))
+        if stats is None:
+            return self.prior_hit_rate
+        hit_rate = (stats.hits + self.prior_hit_rate * self.prior_checks) / (stats.checks + self.prior_checks)
+        if hour is not None:
+            hit_rate = (stats.hourly_hits[hour] + hit_rate) / (stats.hourly_checks[hour] + 1)
+        slots_per_hit = stats.slots / stats.hits if stats.hits else 0
+        return hit_rate * (1 + math.log1p(slots_per_hit))
+
+    def province_score(self, province: str, hour: int = None) -> float:
+        """The score of the likeliest office of the province. A province without known offices has the prior."""
+        offices = self._offices_by_province.get(province)
+        if not offices:
+            return self.prior_hit_rate
+        return max(self.score(province, office, hour) for office in offices)
@@ -1,8 +1,12 @@
-from typing import List, Tuple, Set
+import random
+from contextlib import nullcontext
+from datetime import datetime
+from typing import List, Tuple, MutableSet, MutableMapping, ContextManager, Optional, Dict, Callable
 
-from selenium.webdriver.remote.webelement import WebElement
-
-from niescraper.appointmentchecker import OfficeSelectionStrategy
+from niescraper.forms import OfficeSelectionStrategy
+from niescraper.catalog import Catalog
+from niescraper.officescore import OfficeScores
+from niescraper.options import Option, normalize_option_text
 
 office_priorities = ["bailen",  # in Valencia
                      "patraix extran",  # in Valencia
@@ -16,44 +20,80 @@ office_priorities = ["bailen",  # in Valencia
                      ]
 
 
-class NearestValenciaOfficeSelectionStrategy(OfficeSelectionStrategy):
-    def select_province(self, provinces: List[WebElement]) -> None:
-        next(province for province in provinces if "valencia" in province.text.lower()).click()
+class _RememberingOfficeSelectionStrategy(OfficeSelectionStrategy):
+    """Base for strategies that always choose the same options.
+    The choice per select is remembered, so the options only need to be matched again if they change.
+    """
+
+    def __init__(self):
+        self._choices: Dict[str, Option] = dict()
+
+    def _remembered(self, options: List[Option], choose: Callable[[List[Option]], Option]) -> Option:
+        if options:
+            choice = self._choices.get(options[0].select_id)
+            if choice in options:
+                return choice
+        choice = choose(options)
+        self._choices[choice.select_id] = choice
+        return choice
+
+    def resolve(self, catalog: Catalog) -> None:
+        provinces = catalog.get(Catalog.provinces)
+        if not provinces:
+            return
+        province = self.select_province(provinces)
+        offices = catalog.get(Catalog.offices, province.value)
+        if offices:
+            self.pre_select_office(offices)
+
+
+class NearestValenciaOfficeSelectionStrategy(_RememberingOfficeSelectionStrategy):
+    def select_province(self, provinces: List[Option]) -> Option:
+        return self._remembered(provinces, lambda options: next(province for province in options
+                                                                if "valencia" in province.normalized))
+
+    @staticmethod
+    def _priority(office: Option) -> int:
+        return next((rank for rank, priority in enumerate(office_priorities) if priority in office.normalized),
+                    len(office_priorities))
 
     @staticmethod
-    def find_office(offices: List[WebElement]) -> WebElement:
-        for priority in office_priorities:
-            try:
-                return next(office for office in offices if priority.lower() in office.text.lower())
-            except StopIteration:
-                pass
-        return offices[0]
+    def find_office(offices: List[Option]) -> Option:
+        # min() keeps the first of equally ranked offices, i.e. the first office if none is prioritized
+        return min(offices, key=NearestValenciaOfficeSelectionStrategy._priority)
 
-    def select_office(self, offices: List[WebElement]) -> None:
-        self.find_office(offices).click()
+    def select_office(self, offices: List[Option]) -> Option:
+        return self._remembered(offices, self.find_office)
 
 
-class SpecificOfficeSelectionStrategy(OfficeSelectionStrategy):
+class SpecificOfficeSelectionStrategy(_RememberingOfficeSelectionStrategy):
     def __init__(self, province: str, office: str):
+        super().__init__()
         self.province = province
         self.office = office
+        self._normalized_province = normalize_option_text(province)
+        self._normalized_office = normalize_option_text(office)
 
-    def select_province(self, provinces: List[WebElement]) -> None:
+    def _find_province(self, provinces: List[Option]) -> Option:
         try:
-            province_element = next(province for province in provinces if self.province.lower().strip() in province.text.lower().strip())
-            province_element.click()
+            return next(province for province in provinces if self._normalized_province in province.normalized)
         except StopIteration:
             raise SpecificOfficeSelectionStrategy.ProvinceNotFoundException()
 
-    def select_office(self, offices: List[WebElement]) -> None:
+    def _find_office(self, offices: List[Option]) -> Option:
         try:
-            office_element = next(office for office in offices if self.office.lower().strip() in office.text.lower().strip())
-            office_element.click()
+            return next(office for office in offices if self._normalized_office in office.normalized)
         except StopIteration:
             raise SpecificOfficeSelectionStrategy.OfficeNotFoundException()
 
-    def pre_select_office(self, offices: List[WebElement]) -> None:
-        self.select_office(offices)
+    def select_province(self, provinces: List[Option]) -> Option:
+        return self._remembered(provinces, self._find_province)
+
+    def select_office(self, offices: List[Option]) -> Option:
+        return self._remembered(offices, self._find_office)
+
+    def pre_select_office(self, offices: List[Option]) -> Option:
+        return self.select_office(offices)
 
     class OfficeNotFoundException(Exception):
         pass
@@ -63,60 +103,101 @@ class SpecificOfficeSelectionStrategy(OfficeSelectionStrategy):
 
 
 class ManualOfficeSelectionStrategy(OfficeSelectionStrategy):
+    interactive = True
+
     @staticmethod
-    def _click_single_or_pause(options: List[WebElement], message: str) -> None:
+    def _single_or_pause(options: List[Option], message: str) -> Optional[Option]:
         if len(options) == 1:
-            options[0].click()
-            return
+            return options[0]
         input(message)
+        return None
 
-    def select_office(self, offices: List[WebElement]) -> None:
-        self._click_single_or_pause(offices, "Select the office in the browser and press Enter to continue...")
+    def select_office(self, offices: List[Option]) -> Optional[Option]:
+        return self._single_or_pause(offices, "Select the office in the browser and press Enter to continue...")
 
-    def select_province(self, provinces: List[WebElement]) -> None:
-        self._click_single_or_pause(provinces, "Select the province in the browser and press Enter to continue...")
+    def select_province(self, provinces: List[Option]) -> Optional[Option]:
+        return self._single_or_pause(provinces, "Select the province in the browser and press Enter to continue...")
 
 
 class DFSOfficeSelectionStrategy(OfficeSelectionStrategy):
-    def __init__(self):
+    """Visits every office once. Without scores, the provinces and offices are visited in page order; with scores,
+    the likeliest ones come first, except that with the probability of exploration a random one is picked, so that
+    offices that had no appointments so far are still checked now and then if the crawl stops early.
+    """
+
+    def __init__(self, finished_offices: MutableSet[Tuple[str, str]] = None,
+                 finished_provinces: MutableSet[str] = None, lock: ContextManager = None,
+                 scores: OfficeScores = None, exploration: float = 0.1, rng: random.Random = None):
         self.last_province: str
-        self.last_office: str
-        self.finished_offices: Set[Tuple[str, str]] = set()
-        self.finished_provinces: Set[str] = set()
+        self.last_office: Optional[str] = None
+        self.finished_offices: MutableSet[Tuple[str, str]] = finished_offices if finished_offices is not None \
+            else set()
+        self.finished_provinces: MutableSet[str] = finished_provinces if finished_provinces is not None else set()
         self.last_province_reached_office_selection: bool
+        self._lock = lock if lock is not None else nullcontext()
+        self.scores = scores
+        self.exploration = exploration
+        self._rng = rng if rng is not None else random.Random()
+
+    def _prioritized(self, options: List[Option], score: Callable[[Option, int], float]) -> List[Option]:
+        if self.scores is None or len(options) < 2:
+            return options
+        if self._rng.random() < self.exploration:
+            explored = self._rng.choice(options)
+            return [explored, *(option for option in options if option is not explored)]
+        hour = datetime.now().hour
+        # sorted() is stable, so equally likely options stay in page order
+        return sorted(options, key=lambda option: -score(option, hour))
+
+    def _ordered_provinces(self, provinces: List[Option]) -> List[Option]:
+        return self._prioritized(provinces, lambda province, hour: self.scores.province_score(province.text, hour))
 
-    def select_province(self, provinces: List[WebElement]) -> None:
-        for province in provinces:
-            if province.text not in self.finished_provinces:
-                self.last_province = province.text
-                province.click()
-                self.last_province_reached_office_selection = False # reset flag
-                return
-        raise DFSOfficeSelectionStrategy.NoMoreProvincesException()
+    def _pick_province(self, provinces: List[Option]) -> Option:
+        unfinished = [province for province in provinces if province.text not in self.finished_provinces]
+        if not unfinished:
+            raise DFSOfficeSelectionStrategy.NoMoreProvincesException()
+        return self._ordered_provinces(unfinished)[0]
 
-    def select_office(self, offices: List[WebElement]) -> None:
+    def select_province(self, provinces: List[Option]) -> Option:
+        province = self._pick_province(provinces)
+        self.last_province = province.text
+        self.last_office = None
+        self.last_province_reached_office_selection = False # reset flag
+        return province
+
+    def select_office(self, offices: List[Option]) -> Option:
         # remember that this province has offices so that we do not ignore it only because we do not find an
         # appointment right away
         self.last_province_reached_office_selection = True
 
-        # find the offices we have not yet visited
-        unvisited_offices = {office for office in offices
-                             if not (self.last_province, office.text) in self.finished_offices}
+        # checking and claiming an office has to be atomic if the bookkeeping is shared with other workers
+        with self._lock:
+            # find the offices we have not yet visited
+            unvisited_offices = [office for office in offices
+                                 if not (self.last_province, office.text) in self.finished_offices]
 
-        # All offices visited? Cancel
-        if len(unvisited_offices) == 0:
-            self.finished_provinces.add(self.last_province)
-            raise DFSOfficeSelectionStrategy.NoMoreOfficesException()
+            # All offices visited? Cancel
+            if len(unvisited_offices) == 0:
+                self.finished_provinces.add(self.last_province)
+                raise DFSOfficeSelectionStrategy.NoMoreOfficesException()
 
-        # Select the first office we have not visited so far and remember it
-        office = unvisited_offices.pop()
-        self.last_office = office.text
-        self.finished_offices.add((self.last_province, office.text))
-        office.click()
+            # Select the likeliest office we have not visited so far and remember it
+            office = self._prioritized(unvisited_offices, lambda option, hour: self.scores.score(
+                self.last_province, option.text, hour))[0]
+            unvisited_offices.remove(office)
+            self.last_office = office.text
+            self.finished_offices.add((self.last_province, office.text))
 
-        # If this was the last office of this province, we can ignore the province
-        if not unvisited_offices:
-            self.finished_provinces.add(self.last_province)
+            # If this was the last office of this province, we can ignore the province
+            if not unvisited_offices:
+                self.finished_provinces.add(self.last_province)
+        return office
+
+    def release_office(self, province: Option, office: Option) -> None:
+        with self._lock:
+            self.finished_offices.discard((province.text, office.text))
+            # the province was finished if this was its last office
+            self.finished_provinces.discard(province.text)
 
     def notify_about_no_appointments_for_last_selection(self):
         # Handle the case that we did not even reach the office selection and therefore also did not already kick out
@@ -129,3 +210,90 @@ class DFSOfficeSelectionStrategy(OfficeSelectionStrategy):
 
     class NoMoreProvincesException(Exception):
         pass
+
+
+class SharedDFSOfficeSelectionStrategy(DFSOfficeSelectionStrategy):
+    """DFS strategy for one of several workers crawling the same offices.
+    The bookkeeping containers are shared between the workers. Provinces currently checked by fewer workers are
+    preferred, so that the workers spread over the provinces first and only share a province's offices once there
+    are fewer unfinished provinces than workers.
+    """
+
+    def __init__(self, finished_offices: MutableSet[Tuple[str, str]], finished_provinces: MutableSet[str],
+                 active_provinces: MutableMapping[str, int], lock: ContextManager, scores: OfficeScores = None,
+                 exploration: float = 0.1):
+        super().__init__(finished_offices, finished_provinces, lock, scores, exploration)
+        self.active_provinces = active_provinces
+        self._claimed_province: Optional[str] = None
+
+    def _ordered_provinces(self, provinces: List[Option]) -> List[Option]:
+        # the likeliest of the provinces with the fewest workers
+        active = dict(self.active_provinces)
+        return sorted(super()._ordered_provinces(provinces), key=lambda option: active.get(option.text, 0))
+
+    def _pick_province(self, provinces: List[Option]) -> Option:
+        self.release_province()
+        with self._lock:
+            province = super()._pick_province(provinces)
+            self._claimed_province = province.text
+            self.active_provinces[province.text] = self.active_provinces.get(province.text, 0) + 1
+        return province
+
+    def release_province(self) -> None:
+        """Tells the other workers that this worker is done with the province it selected last."""
+        if self._claimed_province is None:
+            return
+        with self._lock:
+            remaining = self.active_provinces.get(self._claimed_province, 1) - 1
+            if remaining > 0:
+                self.active_provinces[self._claimed_province] = remaining
+            else:
+                self.active_provinces.pop(self._claimed_province, None)
+            self._claimed_province = None
+
+
+class WorkUnitOfficeSelectionStrategy(OfficeSelectionStrategy):
+    """Selects the province and office of a work unit of a distributed crawl, or the first one the site offers if the
+    unit does not name it yet. The other provinces and offices offered instead are remembered as discovered, so that
+    they become work units of their own.
+    """
+
+    def __init__(self, province: Optional[str] = None, office: Optional[str] = None):
+        self.province = province
+        self.office = office
+        self.last_province: Optional[str] = None
+        self.last_office: Optional[str] = None
+        # (province, office or None)
+        self.discovered: List[Tuple[str, Optional[str]]] = []
+
+    def select_province(self, provinces: List[Option]) -> Option:
+        if self.province is None:
+            if not provinces:
+                raise WorkUnitOfficeSelectionStrategy.OptionNotFoundException("No province offered")
+            province = provinces[0]
+            self.discovered.extend((option.text, None) for option in provinces[1:])
+        else:
+            province = next((option for option in provinces if option.text == self.province), None)
+            if province is None:
+                raise WorkUnitOfficeSelectionStrategy.OptionNotFoundException(f"{self.province} is not offered")
+        self.last_province = province.text
+        self.last_office = None
+        return province
+
+    def select_office(self, offices: List[Option]) -> Option:
+        if self.office is None:
+            if not offices:
+                raise WorkUnitOfficeSelectionStrategy.OptionNotFoundException("No office offered")
+            office = offices[0]
+            self.discovered.extend((self.last_province, option.text) for option in offices[1:])
+        else:
+            # the result belongs to the office of the unit even if the site does not offer it
+            self.last_office = self.office
+            office = next((option for option in offices if option.text == self.office), None)
+            if office is None:
+                raise WorkUnitOfficeSelectionStrategy.OptionNotFoundException(f"{self.office} is not offered")
+        self.last_office = office.text
+        return office
+
+    class OptionNotFoundException(Exception):
+        pass
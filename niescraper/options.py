@@ -0,0 +1,60 @@
+from typing import NamedTuple, List, Callable, Optional, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from niescraper.browserbackend import BrowserBackend
+
+
+def normalize_option_text(text: str) -> str:
+    text = text.lower().translate(str.maketrans("áéíóúÁÉÍÓÚñÑ", "aeiouaeiounn", ".;,:¿?¡!¿¡"))
+    return " ".join(text.split())
+
+
+class Option(NamedTuple):
+    """An option of a select element, read from the page at once so that strategies can work on plain data."""
+    select_id: str
+    value: str
+    text: str
+    normalized: str
+
+    @staticmethod
+    def create(select_id: str, value: str, text: str) -> "Option":
+        text = " ".join(text.split())
+        return Option(select_id, value, text, normalize_option_text(text))
+
+
+# returns [select id, value, text] of all options matching the CSS selector
+_read_options_script = """
+return Array.from(document.querySelectorAll(arguments[0]), function (option) {
+    var select = option.closest('select');
+    return [select ? select.id : '', option.value, option.textContent];
+});
+"""
+
+_select_option_script = """
+var select = document.getElementById(arguments[0]);
+if (!select) {
+    return false;
+}
+select.value = arguments[1];
+if (select.value !== arguments[1]) {
+    return false;
+}
+select.dispatchEvent(new Event('input', {bubbles: true}));
+select.dispatchEvent(new Event('change', {bubbles: true}));
+return true;
+"""
+
+
+def read_options(driver: "BrowserBackend", css_selector: str, accept: Callable[[Option], bool] = lambda _: True) \
+        -> List[Option]:
+    options = (Option.create(*option) for option in driver.execute_script(_read_options_script, css_selector))
+    return [option for option in options if accept(option)]
+
+
+def select_option(driver: "BrowserBackend", option: Optional[Option]) -> bool:
+    """Selects the option in its select element. Nothing happens if no option is given.
+    Returns False if the page has no such option.
+    """
+    if option is None:
+        return True
+    return driver.execute_script(_select_option_script, option.select_id, option.value)
@@ -0,0 +1,173 @@
+import multiprocessing
+import multiprocessing.managers
+import traceback
+from typing import MutableSet, Iterator, MutableMapping, TypeVar, List, Type, Iterable, Tuple, AbstractSet, Optional, \
+    Callable, NamedTuple
+
+from niescraper.appointmentchecker import AppointmentChecker, FormValues, IntentionSelectionStrategy
+from niescraper.browserprofile import DriverProfile
+from niescraper.catalog import Catalog
+from niescraper.checkpoint import CrawlCheckpoint
+from niescraper.crawl import crawl_offices, OfficeResult
+from niescraper.driverlifecycle import DriverLifecycle
+from niescraper.instrumentation import CheckInstrumentation
+from niescraper.officescore import OfficeScores
+from niescraper.officeselection import SharedDFSOfficeSelectionStrategy
+from niescraper.readiness import Pacing
+from niescraper.requestbudget import RequestBudget
+
+T = TypeVar('T')
+
+
+class _ProxySet(MutableSet[T]):
+    """Set view on a (possibly shared) dict, because multiprocessing managers do not offer a set proxy."""
+
+    def __init__(self, data: MutableMapping[T, bool]):
+        self._data = data
+
+    def add(self, value: T) -> None:
+        self._data[value] = True
+
+    def discard(self, value: T) -> None:
+        self._data.pop(value, None)
+
+    def __contains__(self, value) -> bool:
+        return value in self._data
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __iter__(self) -> Iterator[T]:
+        return iter(list(self._data.keys()))
+
+
+class CrawlFrontier:
+    """The bookkeeping of an all-offices crawl, shared by all workers of a pool."""
+
+    def __init__(self, manager: multiprocessing.managers.SyncManager,
+                 finished_offices: Iterable[Tuple[str, str]] = (), finished_provinces: Iterable[str] = ()):
+        self.finished_offices = manager.dict({office: True for office in finished_offices})
+        self.finished_provinces = manager.dict({province: True for province in finished_provinces})
+        self.active_provinces = manager.dict()
+        # re-entrant, because the strategy releases its last province while picking the next one
+        self.lock = manager.RLock()
+
+    def create_strategy(self, scores: OfficeScores = None, exploration: float = 0.1) \
+            -> SharedDFSOfficeSelectionStrategy:
+        return SharedDFSOfficeSelectionStrategy(_ProxySet(self.finished_offices), _ProxySet(self.finished_provinces),
+                                                self.active_provinces, self.lock, scores, exploration)
+
+    def finished(self) -> Tuple[AbstractSet[Tuple[str, str]], AbstractSet[str]]:
+        """Returns a snapshot of the offices claimed by the workers, including those still being checked, and of the
+        finished provinces.
+        """
+        with self.lock:
+            return set(self.finished_offices.keys()), set(self.finished_provinces.keys())
+
+
+class WorkerSettings(NamedTuple):
+    """The settings from the command line from which every worker builds the budget, the browser lifecycle and the
+    instrumentation of its checker in its own process.
+    """
+    requests_per_minute: float = 180
+    session_requests_per_minute: float = 120
+    max_checks: Optional[int] = None
+    max_memory_mb: Optional[float] = None
+    standby: bool = False
+    instrumentation_path: Optional[str] = None
+    # called in the worker with every block, see RequestBudget
+    on_block: Optional[Callable[[str, float, float], None]] = None
+
+    def create_checker(self, checker_type: Type[AppointmentChecker], profile: DriverProfile, pacing: Pacing,
+                       catalog: Catalog, on_browser_restart: Callable[[BaseException], None]) -> AppointmentChecker:
+        profile = profile if profile is not None else DriverProfile()
+        lifecycle = DriverLifecycle(profile.create_driver, self.max_checks, self.max_memory_mb, self.standby)
+        instrumentation = CheckInstrumentation(self.instrumentation_path) if self.instrumentation_path else None
+        return checker_type(profile=profile, pacing=pacing, catalog=catalog, instrumentation=instrumentation,
+                            lifecycle=lifecycle,
+                            budget=RequestBudget(self.requests_per_minute, self.session_requests_per_minute,
+                                                 on_block=self.on_block),
+                            on_browser_restart=on_browser_restart)
+
+
+def _crawl_worker(frontier: CrawlFrontier, results: multiprocessing.Queue,
+                  intention_strategy: IntentionSelectionStrategy, form_values: FormValues,
+                  checker_type: Type[AppointmentChecker], profile: DriverProfile, pacing: Pacing, catalog: Catalog,
+                  scores: OfficeScores, exploration: float, on_browser_restart: Callable[[BaseException], None],
+                  settings: WorkerSettings):
+    try:
+        checker = settings.create_checker(checker_type, profile, pacing, catalog, on_browser_restart)
+        strategy = frontier.create_strategy(scores, exploration)
+        try:
+            for result in crawl_offices(checker, strategy, intention_strategy, form_values):
+                # the office this worker checked; the shared bookkeeping also holds those other workers still check
+                office = (strategy.last_province, strategy.last_office) if strategy.last_office is not None else None
+                results.put((result, office))
+        finally:
+            strategy.release_province()
+            del checker
+    except Exception:
+        traceback.print_exc()
+    finally:
+        results.put(None)
+
+
+def _checkpoint(checkpoint: CrawlCheckpoint, frontier: CrawlFrontier, result: Optional[OfficeResult],
+                office: Optional[Tuple[str, str]]) -> None:
+    """Records the result with the offices the workers reported as checked. The offices that are claimed but not
+    reported yet are left out, and so are their provinces, so that a resumed crawl checks them.
+    """
+    finished_offices = set(checkpoint.finished_offices)
+    if office is not None:
+        finished_offices.add(office)
+    claimed_offices, finished_provinces = frontier.finished()
+    unreported_provinces = {province for province, _ in claimed_offices - finished_offices}
+    checkpoint.record(result, finished_offices, finished_provinces - unreported_provinces)
+
+
+def crawl_offices_in_pool(workers: int, intention_strategy: IntentionSelectionStrategy, form_values: FormValues,
+                          checker_type: Type[AppointmentChecker] = AppointmentChecker,
+                          profile: DriverProfile = None, pacing: Pacing = None, catalog: Catalog = None,
+                          checkpoint: CrawlCheckpoint = None, scores: OfficeScores = None,
+                          exploration: float = 0.1, on_browser_restart: Callable[[BaseException], None] = None,
+                          settings: WorkerSettings = WorkerSettings()) -> Iterator[OfficeResult]:
+    """Crawls all offices with a pool of workers, each controlling its own browser in a separate process.
+    The results are yielded in the order in which the workers report them. If a checkpoint is given, the offices
+    finished according to it are skipped and its results are yielded first. Closing the iterator stops the workers.
+    Every worker has a request budget of its own, since a budget cannot be shared between processes, and gets its
+    share of the rate per IP address, so that the pool as a whole sends the requests at the given rate.
+    """
+    settings = settings._replace(requests_per_minute=settings.requests_per_minute / workers)
+    with multiprocessing.Manager() as manager:
+        if checkpoint is not None:
+            frontier = CrawlFrontier(manager, checkpoint.finished_offices, checkpoint.finished_provinces)
+            yield from list(checkpoint.results)
+        else:
+            frontier = CrawlFrontier(manager)
+        results = manager.Queue()
+        processes: List[multiprocessing.Process] = [
+            multiprocessing.Process(target=_crawl_worker, name=f"niescraper-worker-{i}", daemon=True,
+                                    args=(frontier, results, intention_strategy, form_values, checker_type, profile,
+                                          pacing, catalog, scores, exploration, on_browser_restart, settings))
+            for i in range(workers)]
+        for process in processes:
+            process.start()
+        try:
+            running = len(processes)
+            while running:
+                reported = results.get()
+                if reported is None:
+                    running -= 1
+                    continue
+                result, office = reported
+                if checkpoint is not None:
+                    _checkpoint(checkpoint, frontier, result, office)
+                yield result
+            if checkpoint is not None:
+                # offices of workers that failed while checking them stay unfinished
+                _checkpoint(checkpoint, frontier, None, None)
+        finally:
+            for process in processes:
+                if process.is_alive():
+                    process.terminate()
+                process.join()
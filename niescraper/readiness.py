@@ -0,0 +1,174 @@
+from time import monotonic, sleep
+from typing import Dict, Iterable, Callable, TypeVar, Optional, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from niescraper.browserbackend import BrowserBackend
+
+T = TypeVar('T')
+
+# the pages of a check, in order, followed by those of a booking
+steps = ("province", "intention", "entrar", "applicant", "result", "office", "contact", "slot", "confirm")
+
+
+class StepPacing:
+    """How long to wait for the page of a step to become ready, and how long to stay on it at least."""
+
+    def __init__(self, timeout: float = 15, min_delay: float = 0):
+        self.timeout = timeout
+        self.min_delay = min_delay
+
+
+class Pacing:
+    def __init__(self, step_pacings: Dict[str, StepPacing] = None, default: StepPacing = None,
+                 option_timeout: float = 1, poll_interval: float = 0.05):
+        self.step_pacings = step_pacings if step_pacings is not None else dict()
+        self.default = default if default is not None else StepPacing()
+        # how long options that are loaded after the page are waited for, e.g. the trámites of an office
+        self.option_timeout = option_timeout
+        self.poll_interval = poll_interval
+
+    def __getitem__(self, step: str) -> StepPacing:
+        return self.step_pacings.get(step, self.default)
+
+    @staticmethod
+    def human(min_delay: float = 2) -> "Pacing":
+        """Stays on every page for a while, as a person filling in the forms would."""
+        return Pacing(default=StepPacing(min_delay=min_delay))
+
+    def with_step_delays(self, delays: Iterable[str]) -> "Pacing":
+        """Returns a copy with the minimum delays given as "step=seconds" strings. Raises a ValueError for an unknown
+        step or a delay that is not a number of seconds.
+        """
+        step_pacings = dict(self.step_pacings)
+        for delay in delays:
+            step, _, seconds = delay.partition("=")
+            if step not in steps:
+                raise ValueError(f"Unknown step {step!r}; the steps are {', '.join(steps)}")
+            try:
+                min_delay = float(seconds)
+            except ValueError:
+                min_delay = -1
+            if not min_delay >= 0:
+                raise ValueError(f"{delay!r} does not give the seconds as STEP=SECONDS")
+            step_pacings[step] = StepPacing(self[step].timeout, min_delay)
+        return Pacing(step_pacings, self.default, self.option_timeout, self.poll_interval)
+
+
+class PageTimer:
+    """Remembers when the current page became ready to enforce the minimum delay of its step."""
+
+    def __init__(self):
+        self._ready_at = monotonic()
+
+    def page_ready(self) -> None:
+        self._ready_at = monotonic()
+
+    def wait_min_delay(self, step_pacing: StepPacing) -> float:
+        """Sleeps for the rest of the minimum delay and returns how long."""
+        remaining = step_pacing.min_delay - (monotonic() - self._ready_at)
+        if remaining <= 0:
+            return 0
+        sleep(remaining)
+        return remaining
+
+
+_element_clickable_script = """
+var element = document.getElementById(arguments[0]);
+return !!element && !element.disabled && element.getClientRects().length > 0
+    && window.getComputedStyle(element).visibility !== 'hidden';
+"""
+
+
+def element_clickable(element_id: str) -> Callable[["BrowserBackend"], bool]:
+    """Waits until the element is shown and enabled."""
+
+    def condition(driver: "BrowserBackend") -> bool:
+        return driver.execute_script(_element_clickable_script, element_id)
+
+    return condition
+
+
+_element_present_script = """
+for (var i = 0; i < arguments.length; i++) {
+    if (document.querySelector(arguments[i])) {
+        return arguments[i];
+    }
+}
+return null;
+"""
+
+
+def element_present(*css_selectors: str) -> Callable[["BrowserBackend"], str]:
+    """Waits until an element matches one of the CSS selectors and returns the first selector that matches."""
+
+    def condition(driver: "BrowserBackend") -> str:
+        return driver.execute_script(_element_present_script, *css_selectors)
+
+    return condition
+
+
+_page_replaced_script = """
+var root = document.documentElement;
+return !!root && !root.hasAttribute('data-niescraper-page') && document.readyState !== 'loading';
+"""
+
+
+def mark_page(driver: "BrowserBackend") -> None:
+    """Marks the current document, so that page_replaced() notices when another one replaced it."""
+    # an attribute rather than a property, since the scripts of some drivers see the page through wrappers
+    driver.execute_script("document.documentElement.setAttribute('data-niescraper-page', '');")
+
+
+def page_replaced(driver: "BrowserBackend") -> bool:
+    """Waits until the marked page is gone and the DOM of the new page has been parsed."""
+    return driver.execute_script(_page_replaced_script)
+
+
+# the states of a new page in which opening it is done, by page load strategy
+ready_states = {
+    "normal": ("complete",),
+    "eager": ("interactive", "complete"),
+    "none": ("loading", "interactive", "complete"),
+}
+_new_page_state_script = """
+var root = document.documentElement;
+return !root || root.hasAttribute('data-niescraper-page') ? null : document.readyState;
+"""
+
+
+def new_page_state(driver: "BrowserBackend") -> Optional[str]:
+    """Returns the ready state of the page that replaced the marked one, or None while the marked page is shown."""
+    return driver.execute_script(_new_page_state_script)
+
+
+_result_state_script = """
+var text = document.body ? document.body.textContent : '';
+if (text.indexOf('En este momento no hay citas disponibles') >= 0) {
+    return 'none';
+}
+if (document.getElementById('idSede')) {
+    return 'office';
+}
+if (document.getElementById('btnSiguiente')) {
+    return 'contact';
+}
+return null;
+"""
+
+
+def result_state(driver: "BrowserBackend") -> str:
+    """Whether the result page says there are no appointments ("none"), asks for the office ("office") or directly
+    for the contact data ("contact"). Returns None while the page does not show any of these.
+    """
+    return driver.execute_script(_result_state_script)
+
+
+_booking_reference_script = """
+var reference = document.getElementById('justificanteFinal');
+return reference ? reference.textContent.trim() : null;
+"""
+
+
+def booking_reference(driver: "BrowserBackend") -> str:
+    """The number of the booking confirmation, or None while the page does not show one."""
+    return driver.execute_script(_booking_reference_script)
@@ -0,0 +1,205 @@
+import socket
+import threading
+import time
+import urllib.parse
+import weakref
+from typing import Optional, Dict, Callable, Hashable, Iterable
+
+# HTTP statuses with which the site or its firewall throttles or rejects the requests
+block_statuses = (403, 429, 503)
+# texts of the pages that are shown instead of the requested one
+block_texts = ("The requested URL was rejected", "Request Rejected", "Too Many Requests", "demasiadas peticiones",
+               "Service Unavailable")
+# page requests of a check that does not find appointments
+requests_per_check = 6
+
+
+class BlockedException(Exception):
+    """The site answered with a page that says the requests were throttled or rejected."""
+
+
+def block_reason(text: str, status: int = None) -> Optional[str]:
+    """Returns why the response looks like a block page, or None if it looks like a regular page."""
+    if status in block_statuses:
+        return f"status {status}"
+    lowered = text.lower()
+    return next((block_text for block_text in block_texts if block_text.lower() in lowered), None)
+
+
+class TokenBucket:
+    """Allows a number of requests per second on average, and bursts of up to capacity requests."""
+
+    def __init__(self, rate: float, capacity: float, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self._clock = clock
+        self._tokens = capacity
+        self._updated = clock()
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def seconds_until(self, tokens: float = 1) -> float:
+        """How long it takes until the given number of tokens is available."""
+        self._refill()
+        return max(0.0, (min(tokens, self.capacity) - self._tokens) / self.rate)
+
+    def take(self, tokens: float = 1) -> None:
+        self._refill()
+        self._tokens -= tokens
+
+
+class CircuitBreaker:
+    """Stops all requests after a block, for base_delay seconds after the first block and twice as long after every
+    further one, up to max_delay. Once the delay is over, a single probe request may go out; if it succeeds, the
+    breaker closes again, otherwise the next delay starts.
+    """
+
+    def __init__(self, base_delay: float = 60, max_delay: float = 30 * 60, probe_timeout: float = 60,
+                 clock: Callable[[], float] = time.monotonic):
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        # a probe that neither succeeded nor was blocked within this time, e.g. because it failed, is given up
+        self.probe_timeout = probe_timeout
+        self._clock = clock
+        self.failures = 0
+        self._open_until = 0.0
+        self._probe_until = 0.0
+
+    @property
+    def closed(self) -> bool:
+        return self.failures == 0
+
+    @property
+    def probing(self) -> bool:
+        return self._probe_until > 0
+
+    def seconds_until_allowed(self) -> float:
+        if self.closed:
+            return 0.0
+        now = self._clock()
+        return max(0.0, self._open_until - now, self._probe_until - now)
+
+    def start_request(self) -> None:
+        if not self.closed:
+            self._probe_until = self._clock() + self.probe_timeout
+
+    def record_success(self) -> None:
+        # requests that were sent before the breaker opened do not close it
+        if self.closed or self.probing:
+            self.failures = 0
+            self._probe_until = 0.0
+
+    def record_block(self) -> float:
+        """Opens the breaker and returns for how long."""
+        self.failures += 1
+        delay = min(self.max_delay, self.base_delay * 2 ** (self.failures - 1))
+        self._open_until = self._clock() + delay
+        self._probe_until = 0.0
+        return delay
+
+
+def _resolve(host: str) -> str:
+    try:
+        return socket.getaddrinfo(host, None)[0][4][0]
+    except (OSError, IndexError):
+        return host
+
+
+class RequestBudget:
+    """Paces the page requests of all checkers that share it, with a token bucket per session and one per IP address
+    of the site, and stops them with a circuit breaker once the site blocks them. Sessions are the objects that keep
+    the cookies, i.e. the checkers and the HTTP sessions.
+    The rate per IP address adapts to what the site tolerates: it grows slowly with every successful request up to
+    requests_per_minute and is halved after every block.
+    """
+
+    def __init__(self, requests_per_minute: float = 180, session_requests_per_minute: float = 120, burst: float = 12,
+                 breaker: CircuitBreaker = None, min_requests_per_minute: float = 6,
+                 clock: Callable[[], float] = time.monotonic, sleep: Callable[[float], None] = time.sleep,
+                 resolve: Callable[[str], str] = _resolve, on_block: Callable[[str, float, float], None] = None):
+        self.max_rate = requests_per_minute / 60
+        self.min_rate = min(min_requests_per_minute / 60, self.max_rate)
+        self.session_rate = session_requests_per_minute / 60
+        self.burst = burst
+        self.breaker = breaker if breaker is not None else CircuitBreaker(clock=clock)
+        self._clock = clock
+        self._sleep = sleep
+        self._resolve = resolve
+        # called with the reason of every block, how long the checks pause and the new rate per minute
+        self.on_block = on_block
+        self._rate = self.max_rate
+        self._lock = threading.Lock()
+        self._session_buckets: "weakref.WeakKeyDictionary[Hashable, TokenBucket]" = weakref.WeakKeyDictionary()
+        self._address_buckets: Dict[str, TokenBucket] = {}
+        self._addresses: Dict[str, str] = {}
+
+    @property
+    def requests_per_minute(self) -> float:
+        """The current rate per IP address."""
+        return self._rate * 60
+
+    def _address(self, target: str) -> str:
+        host = urllib.parse.urlsplit(target).hostname or target
+        if host not in self._addresses:
+            self._addresses[host] = self._resolve(host)
+        return self._addresses[host]
+
+    def _buckets(self, session: Optional[Hashable], target: str) -> Iterable[TokenBucket]:
+        address = self._address(target)
+        if address not in self._address_buckets:
+            self._address_buckets[address] = TokenBucket(self._rate, self.burst, self._clock)
+        yield self._address_buckets[address]
+        if session is not None:
+            if session not in self._session_buckets:
+                self._session_buckets[session] = TokenBucket(self.session_rate, self.burst, self._clock)
+            yield self._session_buckets[session]
+
+    def seconds_until(self, target: str, requests: float = 1, session: Hashable = None) -> float:
+        """How long the given number of requests would have to wait, e.g. to plan the next check."""
+        with self._lock:
+            return max(self.breaker.seconds_until_allowed(),
+                       *(bucket.seconds_until(requests) for bucket in self._buckets(session, target)))
+
+    def acquire(self, session: Hashable, target: str) -> float:
+        """Waits until the session may send a request to the target and returns how long it waited."""
+        waited = 0.0
+        while True:
+            with self._lock:
+                buckets = list(self._buckets(session, target))
+                delay = max(self.breaker.seconds_until_allowed(), *(bucket.seconds_until() for bucket in buckets))
+                if delay <= 0:
+                    for bucket in buckets:
+                        bucket.take()
+                    self.breaker.start_request()
+                    return waited
+            # wake up now and then, since a probe that succeeded closes the breaker early
+            delay = min(delay, 1.0)
+            self._sleep(delay)
+            waited += delay
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.breaker.record_success()
+            if self.breaker.closed:
+                # additive increase: every request that was not blocked raises the rate by one request per minute
+                self._set_rate(self._rate + 1 / 60)
+
+    def record_block(self, reason: str) -> float:
+        """Halves the rate, opens the circuit breaker and returns for how long it stays open."""
+        with self._lock:
+            if not self.breaker.closed and not self.breaker.probing:
+                # the answer to a request that was sent before the breaker opened
+                return self.breaker.seconds_until_allowed()
+            self._set_rate(self._rate / 2)
+            delay = self.breaker.record_block()
+        if self.on_block is not None:
+            self.on_block(reason, delay, self.requests_per_minute)
+        return delay
+
+    def _set_rate(self, rate: float) -> None:
+        self._rate = max(self.min_rate, min(self.max_rate, rate))
+        for bucket in self._address_buckets.values():
+            bucket.rate = self._rate
@@ -0,0 +1,87 @@
+import abc
+import csv
+import json
+import sys
+from datetime import datetime
+from typing import TextIO, Dict, Type, Optional
+
+from niescraper.crawl import OfficeResult
+
+
+def office_record(result: OfficeResult) -> dict:
+    return {
+        "province": result.province,
+        "office": result.office,
+        "intention_available": result.intention_available,
+        "appointments": [appointment.isoformat() for appointment in result.appointments],
+        "checked_at": result.checked_at.isoformat(timespec="seconds") if result.checked_at else None,
+        "seconds": result.seconds,
+    }
+
+
+def office_result(record: dict) -> OfficeResult:
+    """Reads a record written by office_record()."""
+    checked_at = record.get("checked_at")
+    return OfficeResult(record["province"], record["office"],
+                        [datetime.fromisoformat(appointment) for appointment in record["appointments"]],
+                        record["intention_available"], datetime.fromisoformat(checked_at) if checked_at else None,
+                        record.get("seconds"))
+
+
+class ResultWriter(abc.ABC):
+    """Writes a record per office as soon as it was checked, so that other tools can follow a crawl while it runs.
+    Nothing is kept after a record was written.
+    """
+
+    def __init__(self, file: TextIO):
+        self.file = file
+
+    @abc.abstractmethod
+    def _write(self, result: OfficeResult) -> None:
+        pass
+
+    def write(self, result: OfficeResult) -> None:
+        self._write(result)
+        self.file.flush()
+
+    def close(self) -> None:
+        if self.file is sys.stdout:
+            self.file.flush()
+        else:
+            self.file.close()
+
+
+class JsonLinesResultWriter(ResultWriter):
+    def _write(self, result: OfficeResult) -> None:
+        self.file.write(json.dumps(office_record(result), ensure_ascii=False) + "\n")
+
+
+class CsvResultWriter(ResultWriter):
+    """Writes a row per office, with the appointments separated by spaces."""
+
+    columns = ("province", "office", "intention_available", "appointments", "checked_at", "seconds")
+
+    def __init__(self, file: TextIO):
+        super().__init__(file)
+        self._writer = csv.writer(file)
+        self._writer.writerow(self.columns)
+
+    def _write(self, result: OfficeResult) -> None:
+        record = office_record(result)
+        record["appointments"] = " ".join(record["appointments"])
+        self._writer.writerow(record[column] for column in self.columns)
+
+
+result_writers: Dict[str, Type[ResultWriter]] = {
+    "jsonl": JsonLinesResultWriter,
+    "csv": CsvResultWriter,
+}
+
+
+def open_result_writer(output_format: str, path: Optional[str] = None) -> ResultWriter:
+    """Opens a writer for the format that writes to the file, or to stdout if no path is given or the path is "-"."""
+    if path is None or path == "-":
+        file = sys.stdout
+    else:
+        file = open(path, "w", encoding="utf-8", newline="" if output_format == "csv" else None)
+    return result_writers[output_format](file)
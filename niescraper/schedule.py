@@ -0,0 +1,137 @@
+import datetime
+import email.utils
+import time
+from typing import List, Iterable, Optional, Tuple, TYPE_CHECKING
+
+import pytz
+
+if TYPE_CHECKING:
+    from niescraper.httpchecker import HttpSession
+
+
+class ReleaseSchedule:
+    """The times at which new appointments are expected to be released, in the time zone of the offices."""
+
+    def __init__(self, times: Iterable[datetime.time], weekdays: Iterable[int] = range(5),
+                 timezone: str = "Europe/Madrid"):
+        self.times = sorted(set(times))
+        if not self.times:
+            raise ValueError("A release schedule needs at least one release time")
+        self.weekdays = frozenset(weekdays)
+        self.timezone = pytz.timezone(timezone)
+
+    @staticmethod
+    def parse(specs: Iterable[str]) -> "ReleaseSchedule":
+        """Parses release times given as "HH:MM" or as ranges "HH:MM-HH:MM/MINUTES", e.g. "08:00-10:45/15"."""
+        times = []
+        for spec in specs:
+            time_range, _, interval = spec.partition("/")
+            first, _, last = time_range.partition("-")
+            first = datetime.datetime.strptime(first.strip(), "%H:%M")
+            last = datetime.datetime.strptime(last.strip(), "%H:%M") if last else first
+            step = datetime.timedelta(minutes=int(interval) if interval else 15)
+            if step <= datetime.timedelta(0):
+                raise ValueError(f"The interval of {spec} must be at least one minute")
+            while first <= last:
+                times.append(first.time())
+                first += step
+        return ReleaseSchedule(times)
+
+    def localize(self, now: datetime.datetime) -> datetime.datetime:
+        """Returns the naive wall clock time in the time zone of the schedule."""
+        if now.tzinfo is None:
+            return now
+        return now.astimezone(self.timezone).replace(tzinfo=None)
+
+    def releases_on(self, day: datetime.date) -> List[datetime.datetime]:
+        if day.weekday() not in self.weekdays:
+            return []
+        return [datetime.datetime.combine(day, release) for release in self.times]
+
+    def next_release(self, now: datetime.datetime) -> datetime.datetime:
+        """Returns the next release at or after now. The result is aware if now is aware, naive otherwise."""
+        local_now = self.localize(now)
+        for days in range(8):
+            for release in self.releases_on(local_now.date() + datetime.timedelta(days=days)):
+                if release >= local_now:
+                    if now.tzinfo is None:
+                        return release
+                    return self.timezone.localize(release).astimezone(now.tzinfo)
+        raise ValueError("The release schedule has no weekdays")
+
+    def nearest_release(self, now: datetime.datetime) -> Optional[Tuple[datetime.datetime, float]]:
+        """Returns the release of the day nearest to now and the seconds between them, negative if it is ahead."""
+        local_now = self.localize(now)
+        releases = self.releases_on(local_now.date())
+        if not releases:
+            return None
+        release = min(releases, key=lambda release: abs((local_now - release).total_seconds()))
+        return release, (local_now - release).total_seconds()
+
+
+default_schedule = ReleaseSchedule.parse(["08:00-10:45/15"])
+
+
+class ServerClock:
+    """Estimates the offset of the server clock from the Date headers of its responses.
+    A Date header only has a resolution of one second. Every response limits the offset to an interval, and the
+    intersection of the intervals of responses at different fractions of a second narrows it down.
+    """
+
+    def __init__(self):
+        self.lower: Optional[float] = None
+        self.upper: Optional[float] = None
+
+    @property
+    def offset(self) -> float:
+        """Seconds that the server clock is ahead of the local clock."""
+        if self.lower is None:
+            return 0
+        return (self.lower + self.upper) / 2
+
+    @property
+    def uncertainty(self) -> float:
+        if self.lower is None:
+            return float("inf")
+        return (self.upper - self.lower) / 2
+
+    def add_sample(self, sent: float, received: float, server_second: float) -> None:
+        """Adds a response that was sent and received at the given local times and dated at the given second."""
+        # the server time was in [server_second, server_second + 1) somewhere between sending and receiving
+        lower, upper = server_second - received, server_second + 1 - sent
+        if self.lower is None or lower > self.upper or upper < self.lower:
+            # the first sample, or the clocks were adjusted
+            self.lower, self.upper = lower, upper
+        else:
+            self.lower, self.upper = max(self.lower, lower), min(self.upper, upper)
+
+    def synchronize(self, session: "HttpSession", target: str, samples: int = 8) -> float:
+        """Requests the target several times, spread over a second, and returns the estimated offset."""
+        for sample in range(samples):
+            # start every request at another fraction of the second
+            fraction = sample / samples
+            time.sleep((fraction - time.time() % 1) % 1)
+            sent = time.time()
+            response = session.request("HEAD", target)
+            received = time.time()
+            date = response.headers.get("Date")
+            if date:
+                self.add_sample(sent, received, email.utils.parsedate_to_datetime(date).timestamp())
+        return self.offset
+
+    def now(self) -> datetime.datetime:
+        return datetime.datetime.fromtimestamp(time.time() + self.offset, pytz.utc)
+
+    def monotonic_deadline(self, server_time: datetime.datetime) -> float:
+        """Converts a server time into a time of the monotonic clock, which is not affected by clock adjustments."""
+        return time.monotonic() + server_time.timestamp() - self.offset - time.time()
+
+
+def sleep_until(deadline: float, spin: float = 0.005) -> None:
+    """Sleeps until the monotonic deadline. The last milliseconds are spent polling to not wake up late."""
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return
+        if remaining > spin:
+            time.sleep(remaining - spin)
@@ -0,0 +1,134 @@
+import threading
+from typing import Callable, Optional, Dict, List, TYPE_CHECKING
+
+from niescraper.driverlifecycle import DriverLifecycle, is_browser_failure, browser_memory_mb
+
+if TYPE_CHECKING:
+    from niescraper.browserbackend import BrowserBackend
+
+
+def _quit(backend: "BrowserBackend") -> None:
+    try:
+        backend.quit()
+    except Exception:
+        # the browser might be gone already
+        pass
+
+
+class TabbedBrowser:
+    """One browser whose tabs are handed out to checkers in place of browsers of their own. The checks of the tabs
+    run in threads of their own and overlap: while one tab waits for the site, the others send their commands.
+    The browser is launched with the first tab and launched again if it failed. The checks of all tabs count towards
+    the browser, which is replaced as a whole after a number of checks or when it uses too much memory: its tabs are
+    closed after their current checks and reopened in the new browser, and the old browser quits with its last tab.
+    """
+
+    def __init__(self, create_driver: Callable[[], "BrowserBackend"], max_checks: int = None,
+                 max_memory_mb: float = None,
+                 memory: Callable[["BrowserBackend"], Optional[float]] = browser_memory_mb):
+        self.create_driver = create_driver
+        self.max_checks = max_checks
+        self.max_memory_mb = max_memory_mb
+        self._memory = memory
+        self._browser: Optional["BrowserBackend"] = None
+        # the browser of every open tab, by the id of the tab, and the replaced browsers that still have open tabs
+        self._tab_browsers: Dict[int, "BrowserBackend"] = {}
+        self._retired: List["BrowserBackend"] = []
+        self._lock = threading.Lock()
+        self.checks = 0
+        self.recycled = 0
+
+    def lifecycle(self) -> "TabLifecycle":
+        return TabLifecycle(self)
+
+    def open_tab(self) -> "BrowserBackend":
+        with self._lock:
+            if self._browser is None:
+                self._browser = self.create_driver()
+                self.checks = 0
+            try:
+                tab = self._browser.open_tab()
+            except Exception as e:
+                if not is_browser_failure(e):
+                    raise
+                # the other tabs fail with their next command and get new tabs in the new browser
+                self._forget(self._browser)
+                _quit(self._browser)
+                self._browser = self.create_driver()
+                self.checks = 0
+                tab = self._browser.open_tab()
+            self._tab_browsers[id(tab)] = self._browser
+            return tab
+
+    def check_done(self, tab: "BrowserBackend") -> bool:
+        """Counts a finished check of the tab and replaces the browser if it reached the number of checks or the
+        memory limit. Returns whether the tab belongs to a replaced browser and is to be closed.
+        """
+        with self._lock:
+            browser = self._tab_browsers.get(id(tab))
+            if browser is None or browser is not self._browser:
+                return True
+            self.checks += 1
+            if self.max_checks is not None and self.checks >= self.max_checks:
+                self._retire()
+            elif self.max_memory_mb is not None:
+                memory = self._memory(browser)
+                if memory is not None and memory > self.max_memory_mb:
+                    self._retire()
+            return browser is not self._browser
+
+    def close_tab(self, tab: "BrowserBackend") -> None:
+        """Closes the tab, and quits its browser in the background if it was replaced and this was its last tab."""
+        with self._lock:
+            browser = self._tab_browsers.pop(id(tab), None)
+            _quit(tab)
+            if browser is not None and browser in self._retired and browser not in self._tab_browsers.values():
+                self._retired.remove(browser)
+                threading.Thread(target=_quit, args=(browser,), daemon=True).start()
+
+    def _retire(self) -> None:
+        browser, self._browser = self._browser, None
+        self.recycled += 1
+        if browser in self._tab_browsers.values():
+            self._retired.append(browser)
+        else:
+            threading.Thread(target=_quit, args=(browser,), daemon=True).start()
+
+    def _forget(self, browser: "BrowserBackend") -> None:
+        for tab_id in [tab_id for tab_id, tab_browser in self._tab_browsers.items() if tab_browser is browser]:
+            del self._tab_browsers[tab_id]
+
+    def quit(self) -> None:
+        with self._lock:
+            for browser in [self._browser, *self._retired]:
+                if browser is not None:
+                    _quit(browser)
+            self._browser = None
+            self._retired = []
+            self._tab_browsers = {}
+
+
+class TabLifecycle(DriverLifecycle):
+    """Owns a tab of a TabbedBrowser in place of a browser. The tab is not recycled on its own, since closing it
+    frees little; it is replaced after it failed or once the TabbedBrowser replaced the browser.
+    """
+
+    def __init__(self, browser: TabbedBrowser):
+        super().__init__(browser.open_tab)
+        self.browser = browser
+
+    def check_done(self) -> None:
+        self.checks += 1
+        if self._driver is not None and self.browser.check_done(self._driver):
+            self.recycle()
+
+    def recycle(self) -> None:
+        tab, self._driver = self._driver, None
+        if tab is not None:
+            self.recycled += 1
+            self.browser.close_tab(tab)
+
+    def quit(self) -> None:
+        if self._driver is not None:
+            self.browser.close_tab(self._driver)
+            self._driver = None
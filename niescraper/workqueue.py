@@ -0,0 +1,176 @@
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from typing import NamedTuple, Optional, List, Iterable, Tuple, Dict
+
+from niescraper.crawl import OfficeResult
+from niescraper.resultwriter import office_record, office_result
+
+_schema = """
+-- the province or office is '' while it is not known yet, i.e. the first one offered by the site is checked
+CREATE TABLE IF NOT EXISTS units (
+    id INTEGER PRIMARY KEY,
+    intention TEXT NOT NULL,
+    province TEXT NOT NULL,
+    office TEXT NOT NULL,
+    -- pending, leased, done or failed
+    state TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    token TEXT,
+    worker TEXT,
+    lease_expires REAL,
+    error TEXT,
+    UNIQUE (intention, province, office)
+);
+CREATE INDEX IF NOT EXISTS units_by_state ON units (intention, state);
+CREATE UNIQUE INDEX IF NOT EXISTS units_by_token ON units (token);
+-- one result per office; results reported again for the same office are ignored
+CREATE TABLE IF NOT EXISTS results (
+    intention TEXT NOT NULL,
+    province TEXT NOT NULL,
+    office TEXT NOT NULL,
+    record TEXT NOT NULL,
+    PRIMARY KEY (intention, province, office)
+) WITHOUT ROWID;
+"""
+
+
+class WorkUnit(NamedTuple):
+    # None for the first province or office offered by the site
+    province: Optional[str]
+    office: Optional[str]
+    intention: str
+
+
+class Lease(NamedTuple):
+    token: str
+    unit: WorkUnit
+    # time.time() at which the unit is handed out again if the worker did not report back
+    expires: float
+
+
+class WorkQueue:
+    """Persistent queue of the work units of a distributed all-offices crawl, shared by the workers through leases.
+    A unit is handed out to one worker at a time. If the worker neither reports a result nor a failure before its
+    lease runs out, the unit is handed out again; after the maximum number of attempts, the unit is given up.
+    Results are stored once per office, so that results reported twice, e.g. by a worker whose lease ran out, are
+    ignored.
+    """
+
+    def __init__(self, path: str, lease_seconds: float = 5 * 60, max_attempts: int = 3):
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        # the coordinator serves every worker in its own thread
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode = WAL")
+        self._connection.executescript(_schema)
+
+    def seed(self, intention: str) -> bool:
+        """Adds the unit that starts a crawl, unless there are units for the intention already. Returns whether the
+        crawl starts anew.
+        """
+        with self._lock, self._connection:
+            if self._connection.execute("SELECT 1 FROM units WHERE intention = ? LIMIT 1", (intention,)).fetchone():
+                return False
+            self._connection.execute("INSERT INTO units (intention, province, office) VALUES (?, '', '')",
+                                     (intention,))
+        return True
+
+    def _expire_leases(self, now: float) -> None:
+        self._connection.execute(
+            "UPDATE units SET state = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+            "error = 'The lease ran out' WHERE state = 'leased' AND lease_expires < ?", (self.max_attempts, now))
+
+    def claim(self, worker: str, intention: str, now: float = None) -> Optional[Lease]:
+        """Leases the next unit to the worker, or returns None if all remaining units are leased by other workers.
+        The offices of provinces with appointments come first. Raises a NoMoreUnitsException if the crawl is done.
+        """
+        now = now if now is not None else time.time()
+        with self._lock, self._connection:
+            self._expire_leases(now)
+            row = self._connection.execute(
+                "SELECT id, province, office FROM units WHERE intention = ? AND state = 'pending' "
+                "ORDER BY office = '', id LIMIT 1", (intention,)).fetchone()
+            if row is None:
+                if not self._remaining(intention):
+                    raise WorkQueue.NoMoreUnitsException()
+                return None
+            unit_id, province, office = row
+            lease = Lease(uuid.uuid4().hex, WorkUnit(province or None, office or None, intention),
+                          now + self.lease_seconds)
+            self._connection.execute(
+                "UPDATE units SET state = 'leased', attempts = attempts + 1, token = ?, worker = ?, "
+                "lease_expires = ? WHERE id = ?", (lease.token, worker, lease.expires, unit_id))
+        return lease
+
+    def complete(self, unit: WorkUnit, results: Iterable[OfficeResult],
+                 discovered: Iterable[Tuple[str, Optional[str]]] = ()) -> List[OfficeResult]:
+        """Stores the results of a unit and adds the discovered provinces and offices, as (province, office or None),
+        as new units. The unit is done even if another worker holds the lease by now, since its results are as good.
+        Returns the results that were not reported before.
+        """
+        new_results = []
+        with self._lock, self._connection:
+            for result in results:
+                stored = self._connection.execute(
+                    "INSERT OR IGNORE INTO results (intention, province, office, record) VALUES (?, ?, ?, ?)",
+                    (unit.intention, result.province, result.office or "",
+                     json.dumps(office_record(result), ensure_ascii=False)))
+                if stored.rowcount:
+                    new_results.append(result)
+            # offices that already have a result, e.g. because they were checked for their province, are not added
+            self._connection.executemany(
+                "INSERT OR IGNORE INTO units (intention, province, office) SELECT ?, ?, ? WHERE NOT EXISTS "
+                "(SELECT 1 FROM results WHERE intention = ? AND province = ? AND office = ?)",
+                [(unit.intention, province, office or "") * 2 for province, office in discovered])
+            self._connection.execute(
+                "UPDATE units SET state = 'done', error = NULL WHERE intention = ? AND province = ? AND office = ?",
+                (unit.intention, unit.province or "", unit.office or ""))
+        return new_results
+
+    def fail(self, token: str, error: str) -> bool:
+        """Hands the unit of the lease out again, or gives it up after the maximum number of attempts. Returns False
+        if the lease ran out before, in which case the unit was already handed out again.
+        """
+        with self._lock, self._connection:
+            updated = self._connection.execute(
+                "UPDATE units SET state = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, error = ? "
+                "WHERE token = ? AND state = 'leased'", (self.max_attempts, error, token))
+        return bool(updated.rowcount)
+
+    def _remaining(self, intention: str) -> int:
+        return self._connection.execute(
+            "SELECT COUNT(*) FROM units WHERE intention = ? AND state IN ('pending', 'leased')",
+            (intention,)).fetchone()[0]
+
+    def finished(self, intention: str) -> bool:
+        with self._lock:
+            return not self._remaining(intention)
+
+    def progress(self, intention: str) -> Dict[str, int]:
+        """Returns the number of units per state."""
+        with self._lock:
+            return dict(self._connection.execute(
+                "SELECT state, COUNT(*) FROM units WHERE intention = ? GROUP BY state", (intention,)))
+
+    def failed(self, intention: str) -> List[Tuple[WorkUnit, str]]:
+        """Returns the units that were given up, with the last error."""
+        with self._lock:
+            return [(WorkUnit(province or None, office or None, intention), error)
+                    for province, office, error in self._connection.execute(
+                        "SELECT province, office, error FROM units WHERE intention = ? AND state = 'failed' "
+                        "ORDER BY id", (intention,))]
+
+    def results(self, intention: str) -> List[OfficeResult]:
+        with self._lock:
+            return [office_result(json.loads(record)) for (record,) in self._connection.execute(
+                "SELECT record FROM results WHERE intention = ? ORDER BY province, office", (intention,))]
+
+    def close(self) -> None:
+        self._connection.close()
+
+    class NoMoreUnitsException(Exception):
+        pass
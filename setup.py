@@ -19,8 +19,10 @@ setup(
         'playsound',
         'selenium',
         'pytz',
-        'aioconsole',
-        'PyObjC'
+        # talks to Chromium through the DevTools protocol
+        'websocket-client',
+        # playsound needs PyObjC on macOS only
+        'PyObjC; sys_platform == "darwin"'
     ],
     tests_require=[
         'pytest'
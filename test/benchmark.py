@@ -0,0 +1,91 @@
+import json
+import os
+import shutil
+import statistics
+import time
+from typing import Dict, Callable, List
+
+import pytest
+
+from niescraper.chromiumbackend import chromium_executables
+
+baseline_path = os.path.join(os.path.dirname(__file__), "benchmark_baseline.json")
+
+requires_browser = pytest.mark.skipif(shutil.which("firefox") is None, reason="Firefox is not installed")
+requires_chromium = pytest.mark.skipif(not any(map(shutil.which, chromium_executables)),
+                                       reason="Chromium is not installed")
+# the browsers a benchmark is run with, each skipped if it is not installed
+browser_params = [pytest.param("firefox", marks=requires_browser), pytest.param("chromium", marks=requires_chromium)]
+
+
+def median_seconds(function: Callable[[], object], repetitions: int = 10) -> float:
+    durations = []
+    for _ in range(repetitions):
+        start = time.perf_counter()
+        function()
+        durations.append(time.perf_counter() - start)
+    return statistics.median(durations)
+
+
+class Baseline:
+    """Compares benchmark results with the stored baseline. Counts must not grow at all, while times may grow by the
+    tolerance factor plus a few milliseconds, since they depend on the machine. Times are only compared if asked for,
+    so that a busy machine does not fail the tests. A benchmark without any baseline is skipped, e.g. the browser
+    benchmarks until they were recorded on a machine with the browser, while a new metric of a recorded benchmark
+    fails instead of passing unchecked.
+    """
+
+    slack_seconds = 0.01
+
+    def __init__(self, path: str = baseline_path, tolerance: float = 2, update: bool = False,
+                 compare_times: bool = False):
+        self.path = path
+        self.tolerance = tolerance
+        self.update = update
+        self.compare_times = compare_times
+        try:
+            with open(path, encoding="utf-8") as file:
+                self.stored: Dict[str, Dict[str, float]] = json.load(file)
+        except FileNotFoundError:
+            self.stored = {}
+        self.results: Dict[str, Dict[str, float]] = {}
+
+    def check(self, benchmark: str, **metrics: float) -> None:
+        """Records the metrics of the benchmark. Names of time metrics end with "_seconds"."""
+        self.results[benchmark] = metrics
+        if self.update:
+            return
+        if benchmark not in self.stored:
+            pytest.skip(f"{benchmark} has no baseline; run pytest -m benchmark --update-benchmark-baseline to "
+                        "record it")
+        stored = self.stored[benchmark]
+        missing = [name for name in metrics if name not in stored]
+        assert not missing, (f"{benchmark} has no baseline for {', '.join(missing)}; run "
+                             "pytest -m benchmark --update-benchmark-baseline to record it")
+        regressions = []
+        for name, value in metrics.items():
+            limit = stored[name]
+            if name.endswith("_seconds"):
+                if not self.compare_times:
+                    continue
+                limit = limit * self.tolerance + self.slack_seconds
+            if value > limit:
+                regressions.append(f"{name} is {value:.4g}, the baseline is {stored[name]:.4g}")
+        assert not regressions, f"{benchmark} regressed: " + "; ".join(regressions)
+
+    def save(self) -> None:
+        if not self.update or not self.results:
+            return
+        with open(self.path, "w", encoding="utf-8") as file:
+            json.dump({**self.stored, **self.results}, file, indent=2, sort_keys=True)
+            file.write("\n")
+
+    def report(self) -> List[str]:
+        lines = []
+        for benchmark, metrics in sorted(self.results.items()):
+            stored = self.stored.get(benchmark, {})
+            lines.append(benchmark)
+            for name, value in metrics.items():
+                baseline = f" (baseline {stored[name]:.4g})" if name in stored else ""
+                lines.append(f"    {name}: {value:.4g}{baseline}")
+        return lines
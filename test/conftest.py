@@ -0,0 +1,36 @@
+import pytest
+
+from test.benchmark import Baseline
+
+baseline_key = pytest.StashKey[Baseline]()
+
+
+def pytest_addoption(parser):
+    parser.addoption("--update-benchmark-baseline", action="store_true",
+                     help="Store the benchmark results as the new baseline instead of comparing with it")
+    parser.addoption("--benchmark-tolerance", type=float, default=2,
+                     help="Factor by which times may exceed the benchmark baseline (default: %(default)s)")
+    parser.addoption("--benchmark-times", action="store_true",
+                     help="Also compare the benchmark times with the baseline, not only the counts")
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "benchmark: compares performance with the stored baseline")
+
+
+@pytest.fixture(scope="session")
+def baseline(request):
+    baseline = Baseline(tolerance=request.config.getoption("--benchmark-tolerance"),
+                        update=request.config.getoption("--update-benchmark-baseline"),
+                        compare_times=request.config.getoption("--benchmark-times"))
+    request.config.stash[baseline_key] = baseline
+    yield baseline
+    baseline.save()
+
+
+def pytest_terminal_summary(terminalreporter, config):
+    baseline = config.stash.get(baseline_key, None)
+    if baseline is not None and baseline.results:
+        terminalreporter.section("benchmarks")
+        for line in baseline.report():
+            terminalreporter.write_line(line)
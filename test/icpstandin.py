@@ -0,0 +1,254 @@
+import threading
+import time
+import urllib.parse
+from datetime import datetime
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import List, Tuple, Dict, Iterable, Optional
+
+# the buttons of the ICP pages submit their forms via JavaScript, so the stand-in does the same
+_submit = "onclick='this.form.submit()'"
+
+
+def _page(body: str) -> str:
+    return f"<!DOCTYPE html><html><head><meta charset='utf-8'></head><body>{body}</body></html>"
+
+
+default_appointments = (datetime(2022, 1, 27, 9, 50), datetime(2022, 1, 27, 10, 0), datetime(2022, 2, 3, 13, 5))
+
+
+class IcpStandIn:
+    """Local stand-in for the pages of the ICP appointment flow, usable with the HTTP engine and with a browser.
+    Every response can be delayed, either by path or all of them, to simulate a slow site.
+    """
+
+    def __init__(self, appointments_available: bool = False,
+                 provinces: List[Tuple[str, str]] = (("46", "Valencia"), ("8", "Barcelona")),
+                 offices: List[Tuple[str, str]] = (("1", "CNP Bailen"), ("2", "CNP Patraix Extranjeros")),
+                 appointments: Iterable[datetime] = default_appointments, view: str = "box",
+                 ask_office: bool = True, delay: float = 0, delays: Dict[str, float] = None, block_after: int = None,
+                 taken: Iterable[datetime] = ()):
+        self.appointments_available = appointments_available
+        self.provinces = list(provinces)
+        self.offices = list(offices)
+        self.appointments = sorted(appointments)
+        # "box" or "table", the two ways the site shows the appointments
+        self.view = view
+        # whether the office is chosen after asking for appointments
+        self.ask_office = ask_office
+        self.delay = delay
+        # path -> delay, e.g. {"/icpplus/acCitar": 1.5}
+        self.delays = dict(delays or {})
+        # number of requests after which every response is the rejection page of the firewall
+        self.block_after = block_after
+        # appointments that someone else books while they are offered
+        self.taken = set(taken)
+        self.bookings: List[datetime] = []
+        self.requests: List[Tuple[str, str, dict]] = []
+        self.client_ports = set()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @staticmethod
+    def with_catalog_size(provinces: int, offices: int, **kwargs) -> "IcpStandIn":
+        """Creates a stand-in with many provinces and offices; Valencia and its CNP Bailen are always among them."""
+        return IcpStandIn(provinces=[("46", "Valencia")] + [(str(100 + number), f"Provincia {number}")
+                                                            for number in range(provinces - 1)],
+                          offices=[("1", "CNP Bailen")] + [(str(100 + number), f"CNP Oficina {number}")
+                                                           for number in range(offices - 1)], **kwargs)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server.server_port}/icpplus/index.html"
+
+    def __enter__(self) -> "IcpStandIn":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _index(self) -> str:
+        options = "".join(f"<option value='/icpplus/citar?p={value}&locale=es'>{name}</option>"
+                          for value, name in self.provinces)
+        return _page(f"<form id='portadaForm' method='get'><select id='form' name='form'>"
+                     f"<option value=''>Seleccione</option>{options}</select>"
+                     f"<input id='btnAceptar' type='button' value='Aceptar' "
+                     f"onclick='location.href = document.getElementById(\"form\").value'></form>")
+
+    def _citar(self, query: dict) -> str:
+        offices = "".join(f"<option value='{value}'>{name}</option>" for value, name in self.offices)
+        return _page(f"<form id='portadaForm' method='post' action='/icpplus/acInfo'>"
+                     f"<input type='hidden' name='p' value='{query.get('p', [''])[0]}'>"
+                     f"<select id='sede' name='sede'><option value=''>Cualquier oficina</option>"
+                     f"<optgroup label='Oficinas'>{offices}<option value='99'>Otra</option></optgroup></select>"
+                     f"<select id='tramiteGrupo[0]' name='tramiteGrupo[0]'>"
+                     f"<option value='-1'>Seleccione</option>"
+                     f"<option value='4036'>POLICIA - RECOGIDA DE TARJETA</option>"
+                     f"<option value='4031'>POLICIA-CERTIFICADO DE REGISTRO DE CIUDADANO DE LA U.E.</option>"
+                     f"<option value='4096'>POLICÍA-ASIGNACIÓN DE NIE</option></select>"
+                     f"<input id='btnAceptar' type='button' value='Aceptar' {_submit}></form>")
+
+    @staticmethod
+    def _info() -> str:
+        return _page(f"<form method='post' action='/icpplus/acEntrada'>"
+                     f"<input id='btnEntrar' type='button' value='Entrar' {_submit}></form>")
+
+    @staticmethod
+    def _entrada() -> str:
+        return _page("<form method='post' action='/icpplus/acValidarEntrada'>"
+                     "<input type='radio' id='rdbTipoDocNie' name='rdbTipoDoc' value='N.I.E.'>"
+                     "<input type='radio' id='rdbTipoDocPas' name='rdbTipoDoc' value='PASAPORTE' checked>"
+                     "<input type='text' id='txtIdCitado' name='txtIdCitado'>"
+                     "<input type='text' id='txtDesCitado' name='txtDesCitado'>"
+                     "<input type='text' id='txtAnnoCitado' name='txtAnnoCitado'>"
+                     "<select id='txtPaisNac' name='txtPaisNac'><option value=''></option>"
+                     "<option value='104'>ALEMANIA</option><option value='109'>FRANCIA</option></select>"
+                     f"<input id='btnEnviar' type='button' value='Aceptar' {_submit}></form>")
+
+    @staticmethod
+    def _validar() -> str:
+        return _page(f"<form method='post' action='/icpplus/acCitar'>"
+                     f"<input type='hidden' name='token' value='abc'>"
+                     f"<input id='btnEnviar' type='button' value='Solicitar Cita' {_submit}></form>")
+
+    def _citas(self) -> str:
+        if not self.appointments_available:
+            return _page("<p>En este momento no hay citas disponibles.</p>"
+                         "<form action='/icpplus/index.html'><input id='btnSalir' type='button'></form>")
+        if not self.ask_office:
+            return self._contact()
+        offices = "".join(f"<option value='{value}'>{name}</option>" for value, name in self.offices)
+        return _page(f"<form method='post' action='/icpplus/acVerFormulario'>"
+                     f"<select id='idSede' name='idSede'><option value=''></option>{offices}</select>"
+                     f"<input id='btnSiguiente' type='button' value='Siguiente' {_submit}></form>")
+
+    @staticmethod
+    def _contact() -> str:
+        return _page(f"<form method='post' action='/icpplus/acOfertarCita'>"
+                     f"<input type='text' id='txtTelefonoCitado' name='txtTelefonoCitado'>"
+                     f"<input type='text' id='emailUNO' name='emailUNO'>"
+                     f"<input type='text' id='emailDOS' name='emailDOS'>"
+                     f"<textarea id='txtObservaciones' name='txtObservaciones'></textarea>"
+                     f"<input id='btnSiguiente' type='button' value='Siguiente' {_submit}></form>")
+
+    def _offer(self) -> str:
+        if self.view == "table":
+            days = sorted({appointment.date() for appointment in self.appointments})
+            times = sorted({appointment.time() for appointment in self.appointments})
+            heads = "".join(f"<th>{day:%d/%m/%Y}</th>" for day in days)
+            rows = "".join(f"<tr><td>{slot:%H:%M}</td>" + "".join(
+                f"<td><a href='#' onclick='{self._select_script(datetime.combine(day, slot))}'>LIBRE</a></td>"
+                if datetime.combine(day, slot) in self.appointments else "<td>RESERVADO</td>" for day in days)
+                           + "</tr>" for slot in times)
+            return _page(f"<form method='post' action='/icpplus/acVerificarCita'>"
+                         f"<input type='hidden' id='rdbCita' name='rdbCita'>"
+                         f"<table id='VistaMapa_Datatable'><thead><tr><th></th>{heads}</tr></thead>"
+                         f"<tbody>{rows}</tbody></table>"
+                         f"<input id='btnSiguiente' type='button' value='Siguiente' {_submit}></form>")
+        boxes = "".join(f"<div><input type='radio' id='rdbCita{number}' name='rdbCita' value='{number}'>"
+                        f"<label id='lCita_{number}' for='rdbCita{number}'>CITA {number}<br>"
+                        f"Día: {appointment:%d/%m/%Y}<br>Hora: {appointment:%H:%M}</label></div>"
+                        for number, appointment in enumerate(self.appointments, start=1))
+        return _page(f"<form method='post' action='/icpplus/acVerificarCita'>{boxes}"
+                     f"<input id='btnSiguiente' type='button' value='Siguiente' {_submit}></form>")
+
+    def _select_script(self, appointment: datetime) -> str:
+        number = self.appointments.index(appointment) + 1
+        return f"document.getElementById(\"rdbCita\").value = \"{number}\"; return false;"
+
+    def _selected(self, form: dict) -> Optional[datetime]:
+        number = form.get("rdbCita", [""])[0]
+        if not number.isdigit() or not 0 < int(number) <= len(self.appointments):
+            return None
+        return self.appointments[int(number) - 1]
+
+    def _verify(self, form: dict) -> str:
+        appointment = self._selected(form)
+        if appointment is None:
+            return _page("<p>Debe seleccionar una cita.</p>")
+        return _page(f"<form method='post' action='/icpplus/acGrabarCita'>"
+                     f"<input type='hidden' name='rdbCita' value='{form['rdbCita'][0]}'>"
+                     f"<p>Cita: {appointment:%d/%m/%Y %H:%M}</p>"
+                     f"<input type='checkbox' id='chkTotal' name='chkTotal' value='true'>"
+                     f"<input type='checkbox' id='enviarCorreo' name='enviarCorreo' value='true'>"
+                     f"<input id='btnConfirmar' type='button' value='Confirmar' {_submit}></form>")
+
+    def _book(self, form: dict) -> str:
+        appointment = self._selected(form)
+        if appointment is None or "chkTotal" not in form or appointment in self.taken:
+            return _page("<p>La cita seleccionada ya no está disponible.</p>")
+        self.bookings.append(appointment)
+        self.appointments.remove(appointment)
+        return _page(f"<p>Número de justificante de cita: <span id='justificanteFinal'>"
+                     f"{46000000 + len(self.bookings)}</span></p>")
+
+    def _handler(self):
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # the headers and the body are written separately, which Nagle's algorithm would delay
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def _respond(self, status: int, body: str = "", headers: dict = None):
+                content = body.encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(content)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(content)
+
+            def _handle(self, method: str):
+                stand_in.client_ports.add(self.client_address[1])
+                path = urllib.parse.urlsplit(self.path)
+                query = urllib.parse.parse_qs(path.query)
+                length = int(self.headers.get("Content-Length") or 0)
+                form = urllib.parse.parse_qs(self.rfile.read(length).decode("utf-8")) if length else {}
+                stand_in.requests.append((method, path.path, form))
+                delay = stand_in.delays.get(path.path, stand_in.delay)
+                if delay:
+                    time.sleep(delay)
+
+                if stand_in.block_after is not None and len(stand_in.requests) > stand_in.block_after:
+                    self._respond(200, _page("<h1>Request Rejected</h1><p>The requested URL was rejected. "
+                                             "Please consult with your administrator.</p>"))
+                elif path.path == "/icpplus/index.html":
+                    self._respond(200, stand_in._index(), {"Set-Cookie": "JSESSIONID=standin; Path=/icpplus"})
+                elif "JSESSIONID=standin" not in (self.headers.get("Cookie") or ""):
+                    self._respond(200, _page("<p>Su sesión ha caducado</p>"))
+                elif path.path == "/icpplus/citar":
+                    self._respond(302, headers={"Location": f"/icpplus/citar/form?{path.query}"})
+                elif path.path == "/icpplus/citar/form":
+                    self._respond(200, stand_in._citar(query))
+                elif path.path == "/icpplus/acInfo" and method == "POST":
+                    self._respond(200, stand_in._info())
+                elif path.path == "/icpplus/acEntrada" and method == "POST":
+                    self._respond(200, stand_in._entrada())
+                elif path.path == "/icpplus/acValidarEntrada" and method == "POST":
+                    self._respond(200, stand_in._validar())
+                elif path.path == "/icpplus/acCitar" and method == "POST":
+                    self._respond(200, stand_in._citas())
+                elif path.path == "/icpplus/acVerFormulario" and method == "POST":
+                    self._respond(200, stand_in._contact())
+                elif path.path == "/icpplus/acOfertarCita" and method == "POST":
+                    self._respond(200, stand_in._offer())
+                elif path.path == "/icpplus/acVerificarCita" and method == "POST":
+                    self._respond(200, stand_in._verify(form))
+                elif path.path == "/icpplus/acGrabarCita" and method == "POST":
+                    self._respond(200, stand_in._book(form))
+                else:
+                    self._respond(404, _page("Not found"))
+
+            def do_GET(self):
+                self._handle("GET")
+
+            def do_POST(self):
+                self._handle("POST")
+
+        return Handler
@@ -0,0 +1,37 @@
+from datetime import datetime
+
+from niescraper.appointmentscraper import scrape_appointments_from_html
+
+box_page = """<html><body><form>
+<div id="cita1"><input type="radio" id="rdbCita1" name="rdbCita" value="1">
+<label id="lCita_1" for="rdbCita1"><span>CITA 1</span><br/>Día: <span>27/01/2022</span><br/>Hora: <span>09:50</span>
+<br/>Oficina: CNP Bailen</label></div>
+<div id="cita2"><input type="radio" id="rdbCita2" name="rdbCita" value="2">
+<label id="lCita_2" for="rdbCita2"><span>CITA 2</span><br/>Día: <span>3/2/2022</span><br/>Hora: <span>13:05</span>
+</label></div>
+</form></body></html>"""
+
+table_page = """<html><body>
+<table id="VistaMapa_Datatable">
+<thead><tr><th></th><th>24/01/2022</th><th>25/01/2022</th></tr></thead>
+<tbody>
+<tr><td>09:00</td><td><span>LIBRE</span></td><td>RESERVADO</td></tr>
+<tr><td>09:10</td><td>RESERVADO</td><td><a href="#">Libre</a></td></tr>
+</tbody>
+</table>
+<table id="leyenda"><tr><td>LIBRE</td></tr></table>
+</body></html>"""
+
+
+def test_scrape_box_appointments():
+    assert list(scrape_appointments_from_html(box_page)) == [datetime(2022, 1, 27, 9, 50),
+                                                              datetime(2022, 2, 3, 13, 5)]
+
+
+def test_scrape_table_appointments():
+    assert list(scrape_appointments_from_html(table_page)) == [datetime(2022, 1, 24, 9, 0),
+                                                                datetime(2022, 1, 25, 9, 10)]
+
+
+def test_scrape_page_without_appointments():
+    assert list(scrape_appointments_from_html("<html><body><p>No hay citas</p></body></html>")) == []
@@ -0,0 +1,104 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from niescraper.app import run_check_all_offices
+from niescraper.appointmentchecker import FormValues, IdentificationMethod, FormField, AppointmentChecker
+from niescraper.appointmentscraper import scrape_appointments, scrape_appointments_from_html
+from niescraper.browserprofile import DriverProfile
+from niescraper.httpchecker import HttpCheckEngine
+from niescraper.instrumentation import CheckInstrumentation
+from niescraper.intentionselection import find_assign_nie_option
+from niescraper.officeselection import SpecificOfficeSelectionStrategy
+from test.benchmark import Baseline, median_seconds, requires_browser, browser_params
+from test.icpstandin import IcpStandIn
+
+pytestmark = pytest.mark.benchmark
+
+form_values = FormValues(IdentificationMethod.ByNIE, {
+    FormField.NieNumber: "Y1234567X",
+    FormField.Name: "My Name",
+    FormField.NativeCountry: "Alemania",
+    FormField.YearOfBirth: "1990",
+    FormField.PhoneNumber: "123456789",
+    FormField.Email: "mail@example.org",
+})
+many_appointments = [datetime(2022, 1, 24, 9) + timedelta(days=day, minutes=10 * slot)
+                     for day in range(20) for slot in range(30)]
+
+
+def check_bailen(checker):
+    return checker.check_citas_available(form_values, SpecificOfficeSelectionStrategy("valencia", "bailen"),
+                                         find_assign_nie_option)
+
+
+def test_http_check(baseline):
+    with IcpStandIn.with_catalog_size(provinces=52, offices=40) as stand_in:
+        engine = HttpCheckEngine(stand_in.url)
+        check_bailen(engine)
+        requests = len(stand_in.requests)
+        baseline.check("http_check", latency_seconds=median_seconds(lambda: check_bailen(engine), 20),
+                       http_requests=requests)
+
+
+@pytest.mark.parametrize("view", ["box", "table"])
+def test_scrape_appointments(baseline, view):
+    stand_in = IcpStandIn(appointments=many_appointments, view=view)
+    page = stand_in._offer()
+    assert len(list(scrape_appointments_from_html(page))) == len(many_appointments)
+    baseline.check(f"scrape_{view}", latency_seconds=median_seconds(
+        lambda: list(scrape_appointments_from_html(page))))
+
+
+def browser_profile(browser: str = "firefox") -> DriverProfile:
+    return DriverProfile(headless=True, browser=browser)
+
+
+@pytest.mark.parametrize("browser", browser_params)
+@pytest.mark.parametrize("appointments_available", [False, True])
+def test_browser_check(baseline, browser, appointments_available):
+    with IcpStandIn.with_catalog_size(provinces=52, offices=40, appointments=many_appointments,
+                                      appointments_available=appointments_available) as stand_in:
+        checker = AppointmentChecker(profile=browser_profile(browser), start_url=stand_in.url,
+                                     instrumentation=CheckInstrumentation())
+        # the first check also starts the browser
+        assert check_bailen(checker) == appointments_available
+        latency = median_seconds(lambda: check_bailen(checker), 5)
+        steps = checker.instrumentation.last_record["steps"]
+        metrics = {}
+        for step, record in steps.items():
+            metrics[f"{step}_seconds"] = record["seconds"]
+            metrics[f"{step}_commands"] = record["commands"]
+        if appointments_available:
+            metrics["scrape_seconds"] = median_seconds(lambda: list(scrape_appointments(checker.driver)), 5)
+        baseline.check(f"{browser}_check_" + ("appointments" if appointments_available else "none"),
+                       latency_seconds=latency, browser_commands=sum(record["commands"] for record in steps.values()),
+                       **metrics)
+
+
+@requires_browser
+def test_check_all_offices(baseline, capsys):
+    with IcpStandIn.with_catalog_size(provinces=3, offices=3, appointments_available=True) as stand_in:
+        checker = AppointmentChecker(profile=browser_profile(), start_url=stand_in.url)
+        latency = median_seconds(lambda: run_check_all_offices(checker, find_assign_nie_option, form_values), 1)
+        assert "has appointments" in capsys.readouterr().out
+        baseline.check("check_all_offices", latency_seconds=latency)
+
+
+def test_baseline_compares_times_only_if_asked(tmp_path):
+    path = tmp_path / "baseline.json"
+    path.write_text('{"check": {"latency_seconds": 0.1, "browser_commands": 20}}')
+    Baseline(str(path)).check("check", latency_seconds=1, browser_commands=20)
+    with pytest.raises(AssertionError, match="latency_seconds"):
+        Baseline(str(path), compare_times=True).check("check", latency_seconds=1, browser_commands=20)
+    with pytest.raises(AssertionError, match="browser_commands"):
+        Baseline(str(path)).check("check", latency_seconds=0.1, browser_commands=21)
+    with pytest.raises(AssertionError, match="no baseline for province_commands"):
+        Baseline(str(path)).check("check", latency_seconds=0.1, browser_commands=20, province_commands=3)
+
+
+def test_benchmark_without_baseline_is_skipped(tmp_path):
+    path = tmp_path / "baseline.json"
+    path.write_text('{"check": {"latency_seconds": 0.1}}')
+    with pytest.raises(pytest.skip.Exception, match="firefox_check_none has no baseline"):
+        Baseline(str(path)).check("firefox_check_none", latency_seconds=1, browser_commands=20)
@@ -0,0 +1,76 @@
+from datetime import datetime, time, date
+
+import pytest
+
+from niescraper.appointmentchecker import AppointmentChecker, FormValues, IdentificationMethod, FormField
+from niescraper.appointmentscraper import scrape_slots_from_html, Slot
+from niescraper.booking import SlotPreference, BookingFailedException
+from niescraper.browserprofile import DriverProfile
+from niescraper.intentionselection import find_assign_nie_option
+from niescraper.officeselection import SpecificOfficeSelectionStrategy
+from test.benchmark import browser_params
+from test.icpstandin import IcpStandIn
+
+form_values = FormValues(IdentificationMethod.ByNIE, {
+    FormField.NieNumber: "Y1234567X",
+    FormField.Name: "My Name",
+    FormField.NativeCountry: "Alemania",
+    FormField.YearOfBirth: "1990",
+    FormField.PhoneNumber: "123456789",
+    FormField.Email: "mail@example.org",
+})
+slots = [Slot(datetime(2022, 1, 27, 9, 50), "#a"), Slot(datetime(2022, 1, 27, 10, 0), "#b"),
+         Slot(datetime(2022, 2, 3, 13, 5), "#c"), Slot(datetime(2022, 1, 26, 11, 0), None)]
+
+
+def test_preference_parses_limits():
+    preference = SlotPreference.parse("09:00-12:30", "mon,Wednesday", "2022-01-01", "2022-02-28")
+    assert (preference.start_time, preference.end_time) == (time(9), time(12, 30))
+    assert preference.weekdays == {0, 2}
+    assert (preference.first_date, preference.last_date) == (date(2022, 1, 1), date(2022, 2, 28))
+    with pytest.raises(ValueError, match="weekday"):
+        SlotPreference.parse(weekdays="mon,xyz")
+
+
+def test_preference_chooses_earliest_acceptable_slot():
+    assert SlotPreference().choose(slots).selector == "#a"
+    assert SlotPreference.parse("10:00-").choose(slots).selector == "#b"
+    assert SlotPreference.parse(weekdays="thu", first_date="2022-02-01").choose(slots).selector == "#c"
+    # slots that cannot be selected are never chosen
+    assert SlotPreference.parse("11:00-11:00").choose(slots) is None
+
+
+@pytest.mark.parametrize("view", ["box", "table"])
+def test_slots_of_the_offer_can_be_selected(view):
+    with IcpStandIn(view=view) as stand_in:
+        offered = list(scrape_slots_from_html(stand_in._offer()))
+    assert [slot.appointment for slot in offered] == list(stand_in.appointments)
+    assert all(slot.selector for slot in offered)
+    if view == "box":
+        assert offered[1].selector == '[id="rdbCita2"]'
+
+
+def check_and_book(stand_in: IcpStandIn, browser: str, preference: SlotPreference):
+    checker = AppointmentChecker(profile=DriverProfile(headless=True, browser=browser), start_url=stand_in.url)
+    assert checker.check_citas_available(form_values, SpecificOfficeSelectionStrategy("valencia", "bailen"),
+                                         find_assign_nie_option)
+    return checker.book(preference)
+
+
+@pytest.mark.parametrize("browser", browser_params)
+@pytest.mark.parametrize("view", ["box", "table"])
+def test_books_preferred_appointment(browser, view):
+    with IcpStandIn(appointments_available=True, view=view) as stand_in:
+        booking = check_and_book(stand_in, browser, SlotPreference.parse("10:00-"))
+    assert booking.appointment == datetime(2022, 1, 27, 10, 0)
+    assert booking.reference == "46000001"
+    assert stand_in.bookings == [booking.appointment]
+    assert len(booking.offered) == 3
+
+
+@pytest.mark.parametrize("browser", browser_params)
+def test_booking_fails_if_appointment_was_taken(browser):
+    with IcpStandIn(appointments_available=True, taken=[datetime(2022, 1, 27, 9, 50)]) as stand_in:
+        with pytest.raises(BookingFailedException):
+            check_and_book(stand_in, browser, SlotPreference())
+    assert stand_in.bookings == []
@@ -0,0 +1,72 @@
+import base64
+
+import pytest
+
+from niescraper.appointmentchecker import AppointmentChecker
+from niescraper.browserprofile import DriverProfile
+from niescraper.driverlifecycle import DriverLifecycle
+
+
+def test_default_profile_blocks_nothing():
+    profile = DriverProfile()
+    preferences = profile.preferences()
+    assert "permissions.default.image" not in preferences and "network.proxy.type" not in preferences
+    assert preferences["toolkit.telemetry.enabled"] is False
+    assert profile.cookie_banner_in_the_way
+    assert profile.blocked_url_patterns() == []
+    assert "--headless=new" not in profile.chromium_arguments()
+
+
+def test_lean_profile_blocks_resources():
+    profile = DriverProfile.lean(headless=True)
+    preferences = profile.preferences()
+    assert preferences["permissions.default.image"] == 2
+    assert preferences["permissions.default.stylesheet"] == 2
+    assert preferences["gfx.downloadable_fonts.enabled"] is False
+    assert preferences["network.prefetch-next"] is False
+    assert preferences["browser.cache.disk.enable"] is False
+    # without stylesheets the banner does not cover the buttons
+    assert not profile.cookie_banner_in_the_way
+
+    options = profile.firefox_options()
+    assert "-headless" in options.arguments and options.page_load_strategy == "eager"
+    assert options.preferences["permissions.default.image"] == 2
+
+
+def test_third_party_hosts_go_to_missing_proxy():
+    profile = DriverProfile(block_third_party_hosts=True, allowed_hosts=["icp.example.org"])
+    auto_config_url = profile.preferences()["network.proxy.autoconfig_url"]
+    prefix = "data:application/x-ns-proxy-autoconfig;base64,"
+    assert auto_config_url.startswith(prefix)
+    script = base64.b64decode(auto_config_url[len(prefix):]).decode()
+    assert '["icp.example.org"]' in script and "PROXY 127.0.0.1:9" in script
+    assert "--proxy-pac-url=" + auto_config_url in profile.chromium_arguments()
+
+
+def test_chromium_blocks_stylesheets_and_fonts_by_url():
+    profile = DriverProfile.lean(browser="chromium")
+    assert "*.css" in profile.blocked_url_patterns() and "*.woff2" in profile.blocked_url_patterns()
+    assert "--blink-settings=imagesEnabled=false" in profile.chromium_arguments()
+    with pytest.raises(ValueError):
+        DriverProfile(browser="safari")
+
+
+class FakeDriver:
+    def __init__(self):
+        self.scripts = []
+        self.clicked = []
+
+    def execute_script(self, script: str, *args):
+        self.scripts.append(script)
+
+    def click(self, element_id: str):
+        self.clicked.append(element_id)
+
+
+@pytest.mark.parametrize(("profile", "banner_removed"), [(DriverProfile(), True), (DriverProfile.lean(), False)])
+def test_cookie_banner_is_removed_only_if_in_the_way(profile, banner_removed):
+    driver = FakeDriver()
+    checker = AppointmentChecker(profile=profile, lifecycle=DriverLifecycle(lambda: driver))
+    checker._click("btnAceptar")
+    assert driver.clicked == ["btnAceptar"]
+    assert any("cookie-law-info-bar" in script for script in driver.scripts) == banner_removed
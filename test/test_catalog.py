@@ -0,0 +1,79 @@
+import time
+
+from niescraper.appointmentchecker import AppointmentChecker
+from niescraper.catalog import Catalog
+from niescraper.driverlifecycle import DriverLifecycle
+from niescraper.officeselection import SpecificOfficeSelectionStrategy
+from niescraper.options import Option
+
+provinces = [Option.create("form", "/citar?p=46", "Valencia"), Option.create("form", "/citar?p=8", "Barcelona")]
+
+
+def test_persists_options(tmp_path):
+    path = str(tmp_path / "catalog.json")
+    assert Catalog(path).update(Catalog.provinces, provinces)
+    assert Catalog(path).get(Catalog.provinces) == provinces
+    assert Catalog(path).get(Catalog.offices, "/citar?p=46") is None
+
+
+def test_only_writes_changes(tmp_path):
+    catalog = Catalog(str(tmp_path / "catalog.json"))
+    assert catalog.update(Catalog.provinces, provinces)
+    assert not catalog.update(Catalog.provinces, list(provinces))
+    assert catalog.update(Catalog.provinces, provinces[:1])
+    assert catalog.get(Catalog.provinces) == provinces[:1]
+
+
+def test_ignores_outdated_options(tmp_path, monkeypatch):
+    catalog = Catalog(str(tmp_path / "catalog.json"), ttl=60)
+    catalog.update(Catalog.provinces, provinces)
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 61)
+    assert catalog.get(Catalog.provinces) is None
+    assert catalog.update(Catalog.provinces, provinces)
+
+
+def test_strategy_resolves_choice_from_catalog(tmp_path):
+    catalog = Catalog(str(tmp_path / "catalog.json"))
+    catalog.update(Catalog.provinces, provinces)
+    catalog.update(Catalog.offices, [Option.create("sede", "1", "CNP Bailen")], "/citar?p=46")
+
+    strategy = SpecificOfficeSelectionStrategy("valencia", "bailen")
+    strategy.resolve(catalog)
+    # the remembered choices are used as long as the page offers them
+    strategy._normalized_province = strategy._normalized_office = "nothing matches"
+    assert strategy.select_province(provinces).text == "Valencia"
+    assert strategy.pre_select_office([Option.create("sede", "1", "CNP Bailen")]).value == "1"
+
+
+class FakeDriver:
+    """A province select with the given options, which answers the fill script with them."""
+
+    def __init__(self, options):
+        self.options = options
+        self.scripts = 0
+        self.selected = None
+
+    def fill(self, values, read_options_of=None):
+        self.scripts += 1
+        self.selected = values.get("form")
+        return [Option.create("form", "", "Seleccione"), *self.options]
+
+    def select_by_value(self, option):
+        self.scripts += 1
+        self.selected = option.value
+        return True
+
+
+def test_live_options_are_merged_on_every_pass(tmp_path):
+    catalog = Catalog(str(tmp_path / "catalog.json"))
+    catalog.update(Catalog.provinces, provinces[:1])
+    new_province = Option.create("form", "/citar?p=3", "Alicante")
+    driver = FakeDriver([*provinces, new_province])
+    checker = AppointmentChecker(catalog=catalog, lifecycle=DriverLifecycle(lambda: driver))
+    strategy = SpecificOfficeSelectionStrategy("valencia", "bailen")
+    assert checker._select_from_catalog(Catalog.provinces, "", None, strategy.select_province,
+                                        lambda option: option.value != "") == provinces[0]
+    # the choice was selected and the live options read in a single call
+    assert driver.scripts == 1 and driver.selected == "/citar?p=46"
+    assert Catalog(catalog.path).get(Catalog.provinces) == [*provinces, new_province]
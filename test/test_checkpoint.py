@@ -0,0 +1,102 @@
+import pytest
+
+from niescraper.checkpoint import CrawlCheckpoint, checkpointed
+from niescraper.crawl import crawl_offices
+from niescraper.officeselection import DFSOfficeSelectionStrategy
+from niescraper.options import Option
+from niescraper.pool import crawl_offices_in_pool
+
+offices_with_appointments = {
+    "Alicante": ["Office A1", "Office A2"],
+    "Valencia": ["Office V1", "Office V2", "Office V3"],
+}
+box_page = '<label id="lCita_1">CITA 1<br>Día: 27/01/2022<br>Hora: 09:50</label>'
+
+
+class FakeDriver:
+    page_source = ""
+
+
+class FakeChecker:
+    """Answers checks like the site would, without a browser."""
+
+    # the office whose check crashes the browser
+    crash_at = None
+
+    def __init__(self, fail_after: int = None):
+        self.driver = FakeDriver()
+        self.checks = 0
+        self.fail_after = fail_after
+
+    def check_citas_available(self, form_values, office_strategy, intention_strategy):
+        if self.fail_after is not None and self.checks >= self.fail_after:
+            raise ConnectionError("browser crashed")
+        self.checks += 1
+        provinces = [Option.create("form", name, name) for name in ("Alicante", "Barcelona", "Valencia")]
+        province = office_strategy.select_province(provinces).text
+        offices = offices_with_appointments.get(province)
+        if not offices:
+            return False
+        office = office_strategy.select_office([Option.create("idSede", name, name) for name in offices])
+        if office.text == self.crash_at:
+            raise ConnectionError("browser crashed")
+        self.driver.page_source = box_page if office.text.endswith("1") else ""
+        return True
+
+
+def crawl(checker, checkpoint):
+    strategy = DFSOfficeSelectionStrategy(set(checkpoint.finished_offices), set(checkpoint.finished_provinces))
+    return list(checkpointed(crawl_offices(checker, strategy, None, None), checkpoint,
+                             strategy.finished_offices, strategy.finished_provinces))
+
+
+def without_timing(results):
+    return [result._replace(checked_at=None, seconds=None) for result in results]
+
+
+def test_resumed_crawl_skips_finished_work_and_reports_everything(tmp_path):
+    path = str(tmp_path / "checkpoint.jsonl")
+    uninterrupted_checker = FakeChecker()
+    uninterrupted = crawl(uninterrupted_checker, CrawlCheckpoint(str(tmp_path / "other.jsonl")))
+
+    with pytest.raises(ConnectionError):
+        crawl(FakeChecker(fail_after=3), CrawlCheckpoint(path))
+    checker = FakeChecker()
+    resumed = crawl(checker, CrawlCheckpoint(path, resume=True))
+
+    assert sorted(without_timing(resumed)) == sorted(without_timing(uninterrupted))
+    assert checker.checks == uninterrupted_checker.checks - 3
+
+
+def test_ignores_incomplete_last_line(tmp_path):
+    path = tmp_path / "checkpoint.jsonl"
+    crawl(FakeChecker(), CrawlCheckpoint(str(path)))
+    complete = CrawlCheckpoint(str(path), resume=True).results
+    path.write_text(path.read_text() + '{"province": "Vale')
+    assert CrawlCheckpoint(str(path), resume=True).results == complete
+
+
+class PoolChecker(FakeChecker):
+    def __init__(self, **kwargs):
+        super().__init__()
+
+
+class CrashingPoolChecker(PoolChecker):
+    crash_at = "Office V2"
+
+
+def test_resumed_pool_crawl_checks_offices_of_failed_workers(tmp_path):
+    path = str(tmp_path / "checkpoint.jsonl")
+    uninterrupted = list(crawl_offices_in_pool(2, None, None, PoolChecker,
+                                               checkpoint=CrawlCheckpoint(str(tmp_path / "other.jsonl"))))
+
+    checkpoint = CrawlCheckpoint(path)
+    list(crawl_offices_in_pool(2, None, None, CrashingPoolChecker, checkpoint=checkpoint))
+    checkpoint.close()
+    checkpoint = CrawlCheckpoint(path, resume=True)
+    # the crashed worker had claimed the office, but did not finish it
+    assert ("Valencia", "Office V2") not in checkpoint.finished_offices
+    assert "Valencia" not in checkpoint.finished_provinces
+
+    resumed = list(crawl_offices_in_pool(2, None, None, PoolChecker, checkpoint=checkpoint))
+    assert sorted(without_timing(resumed)) == sorted(without_timing(uninterrupted))
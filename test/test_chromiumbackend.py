@@ -0,0 +1,81 @@
+from typing import List, Callable
+
+import pytest
+from selenium.common.exceptions import JavascriptException, NoSuchElementException
+
+from niescraper.chromiumbackend import ChromiumBackend, CdpError
+from niescraper.instrumentation import CheckInstrumentation
+from niescraper.readiness import element_present
+
+
+class FakeConnection:
+    """Answers the commands with the results of the given functions, in order, and remembers the commands."""
+
+    def __init__(self, *answers: Callable[[str, dict], dict]):
+        self.answers = list(answers)
+        self.commands: List[tuple] = []
+
+    def send(self, method: str, params: dict) -> dict:
+        self.commands.append((method, params))
+        return self.answers.pop(0)(method, params)
+
+    def close(self) -> None:
+        pass
+
+
+def value(result):
+    return lambda method, params: {"result": {"type": "object", "value": result}}
+
+
+def lost_context(method, params):
+    raise CdpError("Execution context was destroyed.", method)
+
+
+def backend(connection: FakeConnection, **kwargs) -> ChromiumBackend:
+    return ChromiumBackend(connection, poll_interval=0, **kwargs)
+
+
+def test_scripts_are_called_with_their_arguments():
+    connection = FakeConnection(value("#prov_selecc"))
+    assert element_present("select#form option[value]", "#prov_selecc")(backend(connection)) == "#prov_selecc"
+    method, params = connection.commands[0]
+    assert method == "Runtime.evaluate"
+    assert params["returnByValue"]
+    assert params["expression"].endswith('.apply(null, ["select#form option[value]", "#prov_selecc"])')
+
+
+def test_script_errors_are_raised():
+    connection = FakeConnection(lambda method, params: {
+        "result": {"type": "object"}, "exceptionDetails": {"text": "Uncaught", "exception": {
+            "description": "TypeError: Cannot read properties of null"}}})
+    with pytest.raises(JavascriptException, match="TypeError"):
+        backend(connection).execute_script("return null.id;")
+
+
+def test_navigate_waits_for_the_new_page():
+    connection = FakeConnection(value(None), lambda method, params: {"frameId": "1"}, lost_context, value(None),
+                                value("loading"), value("interactive"))
+    backend(connection, page_load_strategy="eager").navigate("http://127.0.0.1/icpplus/index.html")
+    methods = [method for method, _ in connection.commands]
+    assert methods == ["Runtime.evaluate", "Page.navigate", *["Runtime.evaluate"] * 4]
+    assert connection.commands[1][1] == {"url": "http://127.0.0.1/icpplus/index.html"}
+
+
+def test_click_sends_mouse_events():
+    connection = FakeConnection(value([40.5, 120]), value(None), value(None), value(None))
+    chromium = backend(connection)
+    chromium.click("btnAceptar")
+    assert [params.get("type") for _, params in connection.commands[1:]] == ["mousePressed", "mouseReleased"]
+    assert connection.commands[1][1]["x"] == 40.5
+    with pytest.raises(NoSuchElementException):
+        chromium.click("btnVolver")
+
+
+def test_instrumentation_counts_protocol_commands():
+    instrumentation = CheckInstrumentation()
+    chromium = instrumentation.wrap(backend(FakeConnection(value([1, 2]), value(None), value(None))))
+    instrumentation.start_check()
+    instrumentation.enter_step("province")
+    chromium.click("btnAceptar")
+    record = instrumentation.finish_check("Valencia", None, available=False)
+    assert record["steps"]["province"]["commands"] == 3
@@ -0,0 +1,143 @@
+import threading
+from time import monotonic
+
+import pytest
+from selenium.common.exceptions import InvalidSessionIdException, NoSuchElementException, TimeoutException
+from urllib3.exceptions import ReadTimeoutError
+
+from niescraper.app import check_at_release
+from niescraper.appointmentchecker import AppointmentChecker
+from niescraper.crawl import crawl_offices
+from niescraper.driverlifecycle import DriverLifecycle, is_browser_failure
+from niescraper.officeselection import DFSOfficeSelectionStrategy
+from niescraper.options import Option
+
+
+class FakeDriver:
+    def __init__(self, number):
+        self.number = number
+        self.quit_called = threading.Event()
+        self.memory_mb = 100
+
+    def quit(self):
+        self.quit_called.set()
+
+
+class DriverFactory:
+    def __init__(self):
+        self.drivers = []
+        self.threads = set()
+
+    def __call__(self):
+        driver = FakeDriver(len(self.drivers))
+        self.drivers.append(driver)
+        self.threads.add(threading.current_thread().name)
+        return driver
+
+
+def test_recycles_after_checks():
+    factory = DriverFactory()
+    lifecycle = DriverLifecycle(factory, max_checks=2)
+    first = lifecycle.driver
+    lifecycle.check_done()
+    assert lifecycle.driver is first
+    lifecycle.check_done()
+    assert lifecycle.driver is not first
+    assert first.quit_called.wait(1)
+
+
+def test_recycles_above_memory_limit():
+    factory = DriverFactory()
+    lifecycle = DriverLifecycle(factory, max_memory_mb=500, memory=lambda driver: driver.memory_mb)
+    first = lifecycle.driver
+    lifecycle.check_done()
+    first.memory_mb = 600
+    lifecycle.check_done()
+    assert lifecycle.driver is not first
+
+
+def test_swaps_in_standby_launched_in_background():
+    factory = DriverFactory()
+    lifecycle = DriverLifecycle(factory, max_checks=1, standby=True)
+    first = lifecycle.driver
+    lifecycle.check_done()
+    second = lifecycle.driver
+    assert second.number == 1
+    lifecycle.quit()
+    # the standby of the second browser was launched as well
+    assert len(factory.drivers) == 3
+    assert any(name.startswith("standby-browser") for name in factory.threads)
+    assert all(driver.quit_called.wait(1) for driver in factory.drivers)
+
+
+class FlakyChecker(AppointmentChecker):
+    def __init__(self, error):
+        self.restarts = []
+        super().__init__(lifecycle=DriverLifecycle(DriverFactory()), on_browser_restart=self.restarts.append)
+        self.error = error
+        self.attempts = 0
+
+    def prepare_check(self, form_values, office_strategy, intention_strategy):
+        self.attempts += 1
+        if self.attempts == 1:
+            raise self.error
+
+    def finish_check(self, form_values, office_strategy):
+        return self.driver.number == 1
+
+
+def test_restarts_crashed_browser_and_retries():
+    error = InvalidSessionIdException("browser crashed")
+    checker = FlakyChecker(error)
+    checker.driver
+    assert checker.check_citas_available(None, None, None)
+    assert checker.attempts == 2 and checker.lifecycle.recycled == 1
+    assert checker.restarts == [error]
+
+
+def test_release_check_is_repeated_in_new_browser():
+    checker = FlakyChecker(InvalidSessionIdException("browser crashed"))
+    checker.driver
+    deadline = monotonic() + 0.05
+    assert check_at_release(checker, None, None, None, deadline, lead=0.01)
+    assert monotonic() >= deadline
+    assert checker.attempts == 2 and checker.lifecycle.recycled == 1
+
+
+def test_does_not_retry_answers_of_working_browser():
+    checker = FlakyChecker(NoSuchElementException("no such trámite"))
+    with pytest.raises(NoSuchElementException):
+        checker.check_citas_available(None, None, None)
+    assert checker.lifecycle.recycled == 0
+
+
+def test_slow_site_is_no_browser_failure():
+    assert not is_browser_failure(TimeoutException("Timed out waiting for the result page"))
+    assert is_browser_failure(ReadTimeoutError(None, "/session", "Read timed out"))
+    assert is_browser_failure(InvalidSessionIdException())
+
+
+class CrashingOnFirstOfficeChecker(AppointmentChecker):
+    def __init__(self):
+        super().__init__(lifecycle=DriverLifecycle(DriverFactory()))
+        self.checked = []
+
+    def prepare_check(self, form_values, office_strategy, intention_strategy):
+        self.last_province = self.last_office = None
+        # launches the browser, like opening the start page would
+        self.driver
+        self.last_province = office_strategy.select_province([Option.create("form", "1", "Valencia")])
+
+    def finish_check(self, form_values, office_strategy):
+        self.last_office = office_strategy.select_office([Option.create("idSede", str(number), f"Office {number}")
+                                                          for number in (1, 2)])
+        if self.lifecycle.recycled == 0:
+            raise InvalidSessionIdException("browser crashed")
+        self.checked.append(self.last_office.text)
+        return False
+
+
+def test_retry_checks_office_of_failed_attempt():
+    checker = CrashingOnFirstOfficeChecker()
+    list(crawl_offices(checker, DFSOfficeSelectionStrategy(), None, None))
+    assert checker.checked == ["Office 1", "Office 2"]
@@ -0,0 +1,56 @@
+from typing import List
+
+from niescraper.appointmentchecker import AppointmentChecker
+from niescraper.driverlifecycle import DriverLifecycle
+from niescraper.forms import FormValues, IdentificationMethod, FormField
+from niescraper.formfill import fill_form
+from niescraper.options import Option
+
+form_values = FormValues(IdentificationMethod.ByNIE, {
+    FormField.NieNumber: "Y1234567X",
+    FormField.Name: "My Name",
+    FormField.NativeCountry: "Alemania",
+    FormField.YearOfBirth: "",
+})
+countries = [["txtPaisNac", "", "Seleccione"], ["txtPaisNac", "104", "ALEMANIA"], ["txtPaisNac", "108", "ANDORRA"]]
+
+
+class FakeDriver:
+    """Records the arguments of every script call and answers with the country options if they are asked for."""
+
+    def __init__(self):
+        self.calls: List[tuple] = []
+
+    def execute_script(self, script: str, *args):
+        self.calls.append(args)
+        return countries if args[1] == "txtPaisNac" else None
+
+    def fill(self, values, read_options_of=None):
+        return fill_form(self, values, read_options_of)
+
+
+def test_fill_form_skips_empty_values_and_reads_options():
+    driver = FakeDriver()
+    assert fill_form(driver, {"txtIdCitado": "Y1234567X", "txtAnnoCitado": "", "rdbTipoDocNie": True,
+                              "chkTotal": False}) is None
+    assert fill_form(driver, {"txtDesCitado": "My Name"}, "txtPaisNac") == [
+        Option("txtPaisNac", "", "Seleccione", "seleccione"), Option("txtPaisNac", "104", "ALEMANIA", "alemania"),
+        Option("txtPaisNac", "108", "ANDORRA", "andorra")]
+    assert driver.calls == [({"txtIdCitado": "Y1234567X", "rdbTipoDocNie": True}, None),
+                            ({"txtDesCitado": "My Name"}, "txtPaisNac")]
+
+
+def test_applicant_data_is_filled_in_one_call_once_countries_are_known(monkeypatch):
+    driver = FakeDriver()
+    checker = AppointmentChecker(lifecycle=DriverLifecycle(lambda: driver))
+    monkeypatch.setattr(checker, "_wait_for_page", lambda step, condition: None)
+    monkeypatch.setattr(checker, "_submit", lambda step, button_id: None)
+    applicant = {"rdbTipoDocNie": True, "txtIdCitado": "Y1234567X", "txtDesCitado": "My Name"}
+
+    checker._fill_applicant_data(form_values)
+    # the first check reads the countries while filling in the other fields
+    assert driver.calls == [(applicant, "txtPaisNac"), ({"txtPaisNac": "104"}, None)]
+
+    driver.calls.clear()
+    checker._fill_applicant_data(form_values)
+    assert driver.calls == [({**applicant, "txtPaisNac": "104"}, None)]
@@ -0,0 +1,44 @@
+from datetime import datetime
+
+from niescraper.history import AppointmentHistory, Target
+
+target = Target("Valencia", "CNP Bailen", "asignacion de nie")
+monday, tuesday, wednesday = datetime(2022, 1, 24, 9, 50), datetime(2022, 1, 25, 10), datetime(2022, 1, 26, 12, 30)
+
+
+def test_diffs_slots(tmp_path):
+    history = AppointmentHistory(str(tmp_path / "history.db"))
+    diff = history.record(target, [monday, tuesday], datetime(2022, 1, 20, 8))
+    assert diff.new == [monday, tuesday] and diff.vanished == [] and diff.available == 2
+
+    diff = history.record(target, [tuesday, wednesday], datetime(2022, 1, 20, 8, 1))
+    assert diff.new == [wednesday] and diff.vanished == [monday] and diff.available == 2
+    assert not history.record(target, [wednesday, tuesday], datetime(2022, 1, 20, 8, 2))
+    assert history.current_slots(target) == [tuesday, wednesday]
+
+
+def test_merges_identical_scrapes(tmp_path):
+    path = str(tmp_path / "history.db")
+    history = AppointmentHistory(path)
+    for minute in range(5):
+        history.record(target, [monday], datetime(2022, 1, 20, 8, minute))
+    history.close()
+
+    history = AppointmentHistory(path)
+    history.record(target, [], datetime(2022, 1, 20, 8, 5))
+    assert history.availability(target) == [(datetime(2022, 1, 20, 8), datetime(2022, 1, 20, 8, 4), 1),
+                                            (datetime(2022, 1, 20, 8, 5), datetime(2022, 1, 20, 8, 5), 0)]
+    assert history.slot_lifetimes(target) == [(monday, 300)]
+
+
+def test_no_appointments_clear_all_offices_of_province(tmp_path):
+    history = AppointmentHistory(str(tmp_path / "history.db"))
+    other_office = target._replace(office="CNP Paterna")
+    history.record(target, [monday])
+    history.record(other_office, [tuesday])
+    history.record(target._replace(province="Barcelona"), [tuesday])
+
+    vanished = {target: diff.vanished for target, diff in
+                history.record_no_appointments("Valencia", "asignacion de nie")}
+    assert vanished == {target: [monday], other_office: [tuesday]}
+    assert history.current_slots(target._replace(province="Barcelona")) == [tuesday]
@@ -0,0 +1,127 @@
+import pytest
+
+from niescraper.appointmentchecker import FormValues, IdentificationMethod, FormField, OfficeSelectionStrategy
+from niescraper.httpchecker import HttpCheckEngine, FlowDivergedException, FastAppointmentChecker
+from niescraper.instrumentation import CheckInstrumentation
+from niescraper.intentionselection import find_assign_nie_option, find_register_eu_citizen_option
+from niescraper.officeselection import SpecificOfficeSelectionStrategy, ManualOfficeSelectionStrategy
+from niescraper.options import Option
+from test.icpstandin import IcpStandIn
+
+form_values = FormValues(IdentificationMethod.ByNIE, {
+    FormField.NieNumber: "Y1234567X",
+    FormField.Name: "My Name",
+    FormField.NativeCountry: "Alemania",
+    FormField.YearOfBirth: "1990",
+})
+
+
+@pytest.mark.parametrize("appointments_available", [False, True])
+def test_detects_appointments(appointments_available):
+    with IcpStandIn(appointments_available=appointments_available) as stand_in:
+        engine = HttpCheckEngine(stand_in.url)
+        assert engine.check_citas_available(form_values, SpecificOfficeSelectionStrategy("valencia", "bailen"),
+                                            find_assign_nie_option) == appointments_available
+
+
+def test_submits_selections_and_applicant_data():
+    with IcpStandIn() as stand_in:
+        engine = HttpCheckEngine(stand_in.url)
+        engine.check_citas_available(form_values, SpecificOfficeSelectionStrategy("barcelona", "patraix"),
+                                     find_register_eu_citizen_option)
+
+        posts = {path: form for method, path, form in stand_in.requests if method == "POST"}
+        assert posts["/icpplus/acInfo"] == {"p": ["8"], "sede": ["2"], "tramiteGrupo[0]": ["4031"]}
+        assert posts["/icpplus/acValidarEntrada"] == {"rdbTipoDoc": ["N.I.E."], "txtIdCitado": ["Y1234567X"],
+                                                      "txtDesCitado": ["My Name"], "txtAnnoCitado": ["1990"],
+                                                      "txtPaisNac": ["104"]}
+        assert posts["/icpplus/acCitar"] == {"token": ["abc"]}
+
+
+def test_reuses_connection():
+    with IcpStandIn() as stand_in:
+        engine = HttpCheckEngine(stand_in.url)
+        for _ in range(3):
+            engine.check_citas_available(form_values, SpecificOfficeSelectionStrategy("valencia", "bailen"),
+                                         find_assign_nie_option)
+        assert len(stand_in.client_ports) == 1
+
+
+def test_diverging_flow_raises():
+    with IcpStandIn() as stand_in:
+        engine = HttpCheckEngine(stand_in.url.replace("index.html", "missing.html"))
+        with pytest.raises(FlowDivergedException):
+            engine.check_citas_available(form_values, SpecificOfficeSelectionStrategy("valencia", "bailen"),
+                                         find_assign_nie_option)
+
+
+@pytest.mark.parametrize(("appointments_available", "start_page", "uses_browser"), [
+    (False, "index.html", False),
+    (True, "index.html", True),
+    (False, "missing.html", True),
+])
+def test_falls_back_to_browser(monkeypatch, appointments_available, start_page, uses_browser):
+    browser_checks = []
+    monkeypatch.setattr("niescraper.appointmentchecker.AppointmentChecker.check_citas_available",
+                        lambda *args: browser_checks.append(args) or True)
+    with IcpStandIn(appointments_available=appointments_available) as stand_in:
+        checker = FastAppointmentChecker(engine=HttpCheckEngine(stand_in.url.replace("index.html", start_page)))
+        result = checker.check_citas_available(form_values, SpecificOfficeSelectionStrategy("valencia", "bailen"),
+                                               find_assign_nie_option)
+        assert bool(browser_checks) == uses_browser
+        assert result == (appointments_available or uses_browser)
+
+
+class ExploringStrategy(OfficeSelectionStrategy):
+    """Chooses another province every time it is asked."""
+
+    def __init__(self):
+        self.offered = []
+        self.selected = []
+
+    def select_province(self, provinces):
+        self.offered = provinces
+        self.selected.append(provinces[len(self.selected)])
+        return self.selected[-1]
+
+    def select_office(self, offices):
+        return offices[0]
+
+    def pre_select_office(self, offices):
+        return offices[0]
+
+
+def test_browser_selects_what_http_check_selected(monkeypatch):
+    strategy = ExploringStrategy()
+    browser_selections = []
+    monkeypatch.setattr("niescraper.appointmentchecker.AppointmentChecker.check_citas_available",
+                        lambda self, values, office_strategy, intention_strategy: browser_selections.append(
+                            office_strategy.select_province(strategy.offered)) or True)
+    with IcpStandIn(appointments_available=True) as stand_in:
+        checker = FastAppointmentChecker(engine=HttpCheckEngine(stand_in.url))
+        assert checker.check_citas_available(form_values, strategy, find_assign_nie_option)
+    # the strategy was asked once, by the HTTP check
+    assert browser_selections == strategy.selected and len(strategy.selected) == 1
+
+
+def test_http_check_sets_selections_and_instrumentation():
+    with IcpStandIn() as stand_in:
+        instrumentation = CheckInstrumentation()
+        instrumentation.last_record = {"steps": {"result": {"seconds": 9, "commands": 9}}}
+        checker = FastAppointmentChecker(engine=HttpCheckEngine(stand_in.url), instrumentation=instrumentation)
+        checker.last_province = checker.last_office = Option.create("form", "1", "From an earlier check")
+        assert not checker.check_citas_available(form_values, SpecificOfficeSelectionStrategy("barcelona", "patraix"),
+                                                 find_assign_nie_option)
+        assert (checker.last_province.text, checker.last_office.text) == ("Barcelona", "CNP Patraix Extranjeros")
+        assert list(instrumentation.last_record["steps"]) == ["http"]
+        assert instrumentation.last_record["province"] == "Barcelona"
+
+
+def test_manual_selection_skips_http_check(monkeypatch):
+    browser_checks = []
+    monkeypatch.setattr("niescraper.appointmentchecker.AppointmentChecker.check_citas_available",
+                        lambda *args: browser_checks.append(args) or False)
+    with IcpStandIn() as stand_in:
+        checker = FastAppointmentChecker(engine=HttpCheckEngine(stand_in.url))
+        assert not checker.check_citas_available(form_values, ManualOfficeSelectionStrategy(), find_assign_nie_option)
+        assert browser_checks and not stand_in.requests
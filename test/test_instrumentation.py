@@ -0,0 +1,64 @@
+import json
+
+from niescraper.instrumentation import CheckInstrumentation
+
+
+class FakeDriver:
+    def execute(self, command, params=None):
+        return {"value": None}
+
+    def execute_script(self, script):
+        return self.execute("executeScript", {"script": script})
+
+
+def run_check(instrumentation, driver, commands_per_step):
+    instrumentation.start_check()
+    for step, commands in commands_per_step.items():
+        instrumentation.enter_step(step)
+        for _ in range(commands):
+            driver.execute_script("return 1")
+    return instrumentation.finish_check("Valencia", "CNP Bailen", available=False)
+
+
+def test_counts_commands_per_step(tmp_path):
+    path = tmp_path / "checks.jsonl"
+    instrumentation = CheckInstrumentation(str(path))
+    driver = instrumentation.wrap(FakeDriver())
+    run_check(instrumentation, driver, {"province": 3, "intention": 2})
+    record = run_check(instrumentation, driver, {"province": 1, "result": 4})
+
+    assert {step: values["commands"] for step, values in record["steps"].items()} == {"province": 1, "result": 4}
+    assert instrumentation.breakdown().startswith("province ")
+    records = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [record["result"] for record in records] == [False, False]
+    assert records[0]["steps"]["intention"]["commands"] == 2
+
+
+def test_records_sleeps_and_errors():
+    instrumentation = CheckInstrumentation()
+    instrumentation.start_check()
+    instrumentation.enter_step("province")
+    instrumentation.add_sleep(1.5)
+    record = instrumentation.finish_check("Valencia", None, error=TimeoutError())
+    assert record["steps"]["province"]["sleep_seconds"] == 1.5
+    assert record["result"] == "TimeoutError"
+
+
+def test_summarizes_recent_checks():
+    instrumentation = CheckInstrumentation(window=3)
+    driver = instrumentation.wrap(FakeDriver())
+    for _ in range(5):
+        run_check(instrumentation, driver, {"province": 1, "applicant": 1})
+    summary = instrumentation.summary()
+    assert list(summary) == ["province", "applicant", "total"]
+    assert all(p50 <= p95 for p50, p95 in summary.values())
+    assert len(instrumentation._recent["total"]) == 3
+
+
+def test_summary_includes_http_check():
+    instrumentation = CheckInstrumentation()
+    driver = instrumentation.wrap(FakeDriver())
+    run_check(instrumentation, driver, {"province": 1})
+    run_check(instrumentation, driver, {"http": 0})
+    assert list(instrumentation.summary()) == ["http", "province", "total"]
+    assert "http" in "\n".join(instrumentation.summary_lines())
@@ -0,0 +1,109 @@
+import asyncio
+import json
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+from niescraper.appointmentchecker import FormField, IdentificationMethod, FormValues
+from niescraper.intentionselection import find_register_eu_citizen_option
+from niescraper.monitor import MonitorTarget, monitor_targets, load_targets
+from niescraper.officeselection import SpecificOfficeSelectionStrategy
+from niescraper.requestbudget import BlockedException
+from test.test_startup import root
+
+
+class FakeChecker:
+    running = 0
+    max_running = 0
+    lock = threading.Lock()
+
+    def __init__(self):
+        self.checked = []
+
+    def check_citas_available(self, form_values, office_strategy, intention_strategy):
+        with FakeChecker.lock:
+            FakeChecker.running += 1
+            FakeChecker.max_running = max(FakeChecker.max_running, FakeChecker.running)
+        time.sleep(0.01)
+        self.checked.append(form_values)
+        with FakeChecker.lock:
+            FakeChecker.running -= 1
+        return form_values.identifier == "available"
+
+
+def targets(*identifiers):
+    return [MonitorTarget(identifier, None, None, FormValues(IdentificationMethod.ByNIE, {
+        FormField.NieNumber: identifier}), interval=0) for identifier in identifiers]
+
+
+def run(targets, checkers, checks, alarm=None):
+    async def no_alarm(*_):
+        pass
+
+    asyncio.run(monitor_targets(targets, checkers, lambda target, checker, available: available,
+                                alarm or no_alarm, checks=checks))
+    return [values.identifier for checker in checkers for values in checker.checked]
+
+
+def test_checks_targets_round_robin():
+    checker = FakeChecker()
+    assert run(targets("a", "b", "c"), [checker], 7) == ["a", "b", "c", "a", "b", "c", "a"]
+
+
+def test_shares_bounded_number_of_checkers():
+    FakeChecker.max_running = 0
+    checkers = [FakeChecker(), FakeChecker()]
+    assert sorted(run(targets(*"abcde"), checkers, 5)) == list("abcde")
+    assert FakeChecker.max_running == 2 and all(checker.checked for checker in checkers)
+
+
+def test_keeps_checker_of_alarm_until_acknowledged():
+    first, second = FakeChecker(), FakeChecker()
+    alarms = []
+
+    async def alarm(target, checker):
+        alarms.append(target.name)
+        await asyncio.sleep(0.2)
+
+    run(targets("available", "x", "y"), [first, second], 6, alarm)
+    assert alarms == ["available"]
+    # the other checker did all the other checks meanwhile
+    assert [values.identifier for values in first.checked] == ["available"]
+
+
+class BlockedChecker:
+    def check_citas_available(self, form_values, office_strategy, intention_strategy):
+        raise BlockedException("The site blocked the requests; next check in 60s")
+
+
+def test_reports_blocked_checks():
+    blocked = []
+    asyncio.run(monitor_targets(targets("a", "b"), [BlockedChecker()], lambda *_: False, None, checks=3,
+                                on_blocked=lambda target, e: blocked.append(target.name)))
+    assert blocked == ["a", "b", "a"]
+
+
+def test_loads_targets(tmp_path):
+    path = tmp_path / "targets.json"
+    path.write_text(json.dumps([{"name": "registration", "intention": "registration", "interval": 30,
+                                 "office": {"province": "Valencia", "office": "Bailen"},
+                                 "identification": "ByPassport", "applicant": {"PassportId": "P123"}}]))
+    target, = load_targets(str(path))
+    assert target.name == "registration" and target.interval == 30
+    assert isinstance(target.office_strategy, SpecificOfficeSelectionStrategy)
+    assert target.intention_strategy is find_register_eu_citizen_option
+    assert target.form_values.identifier == "P123"
+
+
+def test_empty_targets_file_is_reported_as_usage_error(tmp_path):
+    path = tmp_path / "targets.json"
+    path.write_text("[]")
+    with pytest.raises(ValueError):
+        load_targets(str(path))
+    completed = subprocess.run([sys.executable, "-m", "niescraper.app", "--nie", "monitor", str(path)], cwd=root,
+                               capture_output=True, text=True)
+    assert completed.returncode == 2
+    assert "has no targets" in completed.stderr and "Traceback" not in completed.stderr
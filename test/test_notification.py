@@ -0,0 +1,152 @@
+import json
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pytest
+
+from niescraper import app
+from niescraper.notification import Notification, NotificationDispatcher, NotificationSink, FileSink, WebhookSink, \
+    SoundSink
+
+
+class RecordingSink(NotificationSink):
+    def __init__(self, delay: float = 0):
+        self.delay = delay
+        self.sent = []
+        self.acknowledged = 0
+
+    def send(self, notification):
+        time.sleep(self.delay)
+        self.sent.append(notification)
+
+    def acknowledge(self):
+        self.acknowledged += 1
+
+
+def test_deduplicates_and_rate_limits():
+    sink = RecordingSink()
+    dispatcher = NotificationDispatcher([sink], max_per_minute=3)
+    assert dispatcher.notify(Notification("Appointments", "Bailen", "bailen")) is not None
+    assert dispatcher.notify(Notification("Appointments", "Bailen", "bailen")) is None
+    assert dispatcher.notify(Notification("Appointments", "Burjassot", "burjassot")) is not None
+    assert dispatcher.notify(Notification("Error", "TimeoutException")) is not None
+    assert dispatcher.notify(Notification("Error", "TimeoutException")) is None
+    dispatcher.close()
+    assert [notification.message for notification in sink.sent] == ["Bailen", "Burjassot", "TimeoutException"]
+
+
+def test_slow_sink_does_not_block_and_acknowledgement_releases_alerts():
+    sink = RecordingSink(delay=0.5)
+    dispatcher = NotificationDispatcher([sink])
+    start = time.monotonic()
+    alerts = [dispatcher.notify(Notification("Appointments", office, office)) for office in ["Bailen", "Burjassot"]]
+    assert time.monotonic() - start < 0.1
+    assert not any(alert.acknowledged.is_set() for alert in alerts)
+    dispatcher.acknowledge_all()
+    assert all(alert.acknowledged.is_set() for alert in alerts)
+    assert sink.acknowledged == 1
+    dispatcher.close()
+    assert len(sink.sent) == 2
+
+
+def test_file_sink(tmp_path):
+    path = tmp_path / "notifications.jsonl"
+    dispatcher = NotificationDispatcher([FileSink(str(path))])
+    dispatcher.notify(Notification("Appointments", "Valencia – Bailén", "bailen"))
+    dispatcher.close()
+    record = json.loads(path.read_text(encoding="utf-8"))
+    assert record["title"] == "Appointments"
+    assert record["message"] == "Valencia – Bailén"
+    assert record["key"] == "bailen"
+
+
+def test_webhook_sink():
+    received = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            received.append(json.loads(self.rfile.read(int(self.headers["Content-Length"]))))
+            self.send_response(204)
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    with ThreadingHTTPServer(("127.0.0.1", 0), Handler) as server:
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        WebhookSink(f"http://127.0.0.1:{server.server_address[1]}/hook").send(Notification("Appointments", "Bailen"))
+        server.shutdown()
+    assert received[0]["title"] == "Appointments"
+    assert received[0]["message"] == "Bailen"
+
+
+def test_sound_plays_in_one_thread_until_acknowledged():
+    playing = 0
+    max_playing = 0
+    plays = 0
+    lock = threading.Lock()
+
+    def play():
+        nonlocal playing, max_playing, plays
+        with lock:
+            playing += 1
+            plays += 1
+            max_playing = max(max_playing, playing)
+        time.sleep(0.01)
+        with lock:
+            playing -= 1
+
+    sink = SoundSink(play=play)
+    sink.send(Notification("Appointments", "Bailen"))
+    sink.send(Notification("Appointments", "Burjassot"))
+    time.sleep(0.05)
+    sink.acknowledge()
+    sink.join(1)
+    assert max_playing == 1
+    assert plays > 1
+    stopped_at = plays
+    time.sleep(0.03)
+    assert plays == stopped_at
+
+
+def test_sound_stops_after_max_seconds():
+    sink = SoundSink(max_seconds=0.05, play=lambda: time.sleep(0.01))
+    sink.send(Notification("Appointments", "Bailen"))
+    sink.join(1)
+    assert not sink._thread.is_alive()
+
+
+class FailingChecker:
+    catalog = None
+    budget = None
+
+    def __init__(self):
+        self.checks = 0
+
+    def check_citas_available(self, form_values, office_strategy, intention_strategy):
+        self.checks += 1
+        raise ConnectionError("site down")
+
+
+class HeldBackNotifier:
+    """Holds every alarm back, as if it repeated one raised just before."""
+
+    def notify(self, notification):
+        return None
+
+
+def test_failed_checks_wait_for_next_check_when_alarm_is_held_back(monkeypatch):
+    sleeps = []
+
+    def sleep(seconds):
+        sleeps.append(seconds)
+        if len(sleeps) == 3:
+            raise KeyboardInterrupt()
+
+    monkeypatch.setattr(app, "sleep", sleep)
+    monkeypatch.setattr(app, "seconds_until_next_check", lambda schedule: 60)
+    checker = FailingChecker()
+    with pytest.raises(KeyboardInterrupt):
+        app.keep_checking(checker, None, None, notifier=HeldBackNotifier())
+    assert checker.checks == 3 and sleeps == [60, 60, 60]
@@ -0,0 +1,44 @@
+from datetime import datetime
+
+from niescraper.crawl import OfficeResult, until_hits
+from niescraper.history import AppointmentHistory, Target
+from niescraper.officescore import OfficeScores
+
+slot = datetime(2022, 1, 27, 9, 50)
+
+
+def test_scores_learn_from_history(tmp_path):
+    history = AppointmentHistory(str(tmp_path / "history.db"))
+    for day in range(1, 6):
+        history.record(Target("Valencia", "Bailen", "asignacion de nie"), [slot.replace(day=day)],
+                       datetime(2022, 1, day, 8))
+        history.record(Target("Valencia", "Bailen", "asignacion de nie"), [], datetime(2022, 1, day, 15))
+        history.record(Target("Valencia", "Patraix", "asignacion de nie"), [], datetime(2022, 1, day, 8))
+    scores = OfficeScores.from_history(history, "asignacion de nie")
+    assert scores.score("Valencia", "Bailen") > scores.score("Valencia", "Unknown") > \
+           scores.score("Valencia", "Patraix")
+    # the appointments of Bailen are found in the morning
+    assert scores.score("Valencia", "Bailen", 8) > scores.score("Valencia", "Bailen", 15)
+    assert scores.province_score("Valencia") == scores.score("Valencia", "Bailen")
+
+
+def test_more_slots_score_higher():
+    scores = OfficeScores()
+    scores.record("Valencia", "Bailen", 10)
+    scores.record("Valencia", "Patraix", 1)
+    assert scores.score("Valencia", "Bailen") > scores.score("Valencia", "Patraix")
+
+
+def test_until_hits_stops_the_crawl():
+    closed = []
+
+    def results():
+        try:
+            for office in ("A", "B", "C", "D"):
+                yield OfficeResult("Valencia", office, [slot] if office in "BC" else [])
+        finally:
+            closed.append(True)
+
+    assert [result.office for result in until_hits(results(), 2)] == ["A", "B", "C"]
+    assert closed
+    assert len(list(until_hits(results(), None))) == 4
@@ -0,0 +1,73 @@
+import random
+
+import pytest as pytest
+
+from niescraper.officeselection import NearestValenciaOfficeSelectionStrategy, SpecificOfficeSelectionStrategy, \
+    DFSOfficeSelectionStrategy
+from niescraper.officescore import OfficeScores
+from niescraper.options import Option
+
+
+def options(select_id, *texts):
+    return [Option.create(select_id, str(value), text) for value, text in enumerate(texts, 1)]
+
+
+def test_nearest_valencia_prefers_prioritized_office():
+    offices = options("idSede", "CNP Alzira, Avda. Luis Suñer", "CNP Bailén, Bailén 9", "CNP Sagunto")
+    assert NearestValenciaOfficeSelectionStrategy.find_office(offices).value == "2"
+
+
+def test_nearest_valencia_falls_back_to_first_office():
+    assert NearestValenciaOfficeSelectionStrategy.find_office(options("idSede", "Oficina A", "Oficina B")).value == "1"
+
+
+def test_specific_office_matches_normalized_text():
+    strategy = SpecificOfficeSelectionStrategy("Málaga", "Bailen")
+    assert strategy.select_province(options("form", "Madrid", "Malaga")).text == "Malaga"
+    assert strategy.pre_select_office(options("sede", "CNP Patraix", "CNP BAILÉN")).text == "CNP BAILÉN"
+    with pytest.raises(SpecificOfficeSelectionStrategy.ProvinceNotFoundException):
+        strategy.select_province(options("form", "Madrid"))
+
+
+def test_dfs_visits_every_office_once():
+    strategy = DFSOfficeSelectionStrategy()
+    provinces = options("form", "Alicante", "Valencia")
+    offices = options("idSede", "Office 1", "Office 2")
+    visited = []
+    while True:
+        try:
+            strategy.select_province(provinces)
+        except DFSOfficeSelectionStrategy.NoMoreProvincesException:
+            break
+        try:
+            visited.append((strategy.last_province, strategy.select_office(offices).text))
+        except DFSOfficeSelectionStrategy.NoMoreOfficesException:
+            pass
+    assert sorted(visited) == [(province, office) for province in ("Alicante", "Valencia")
+                               for office in ("Office 1", "Office 2")]
+
+
+def test_dfs_visits_likeliest_offices_first():
+    scores = OfficeScores()
+    for _ in range(5):
+        scores.record("Valencia", "Office 2", 3)
+        scores.record("Valencia", "Office 1", 0)
+        scores.record("Alicante", "Office 1", 0)
+    strategy = DFSOfficeSelectionStrategy(scores=scores, exploration=0)
+    assert strategy.select_province(options("form", "Alicante", "Valencia")).text == "Valencia"
+    offices = options("idSede", "Office 1", "Office 2", "Office 3")
+    # the office without checks is more likely than the one that never had appointments
+    assert [strategy.select_office(offices).text for _ in range(3)] == ["Office 2", "Office 3", "Office 1"]
+
+
+def test_dfs_explores_cold_offices():
+    scores = OfficeScores()
+    scores.record("Valencia", "Office 1", 5)
+    rng = random.Random(1)
+    first_offices = []
+    for _ in range(50):
+        strategy = DFSOfficeSelectionStrategy(scores=scores, exploration=0.3, rng=rng)
+        strategy.select_province(options("form", "Valencia"))
+        first_offices.append(strategy.select_office(options("idSede", "Office 1", "Office 2", "Office 3")).text)
+    assert set(first_offices) == {"Office 1", "Office 2", "Office 3"}
+    assert first_offices.count("Office 1") > 25
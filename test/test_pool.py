@@ -0,0 +1,114 @@
+import multiprocessing
+import threading
+from collections import Counter
+from time import sleep
+from typing import List, Tuple
+
+import pytest
+
+from niescraper.appointmentchecker import AppointmentChecker
+from niescraper.browserprofile import DriverProfile
+from niescraper.crawl import crawl_offices
+from niescraper.officeselection import DFSOfficeSelectionStrategy
+from niescraper.options import Option
+from niescraper.pool import CrawlFrontier, WorkerSettings
+
+# Ceuta offers no offices for the trámite, so its check ends at the province
+site = {"Alicante": ["Office 1", "Office 2", "Office 3"],
+        "Ceuta": [],
+        "Madrid": ["Office 1"],
+        "Valencia": ["Office 1", "Office 2", "Office 3", "Office 4"]}
+all_offices = sorted((province, office) for province, offices in site.items() for office in offices)
+
+
+def options(select_id: str, texts: List[str]) -> List[Option]:
+    return [Option.create(select_id, str(value), text) for value, text in enumerate(texts, 1)]
+
+
+class FakeChecker:
+    """Walks the selections of the site without appointments and records the offices it checks."""
+
+    driver = None
+
+    def __init__(self, checked: List[Tuple[str, str]], delay: float = 0):
+        self.checked = checked
+        self.delay = delay
+
+    def check_citas_available(self, form_values, office_strategy, intention_strategy) -> bool:
+        province = office_strategy.select_province(options("form", list(site)))
+        sleep(self.delay)
+        offices = site[province.text]
+        if offices:
+            office = office_strategy.select_office(options("idSede", offices))
+            self.checked.append((province.text, office.text))
+        return False
+
+
+@pytest.fixture(scope="module")
+def manager():
+    with multiprocessing.Manager() as manager:
+        yield manager
+
+
+def crawl(frontier: CrawlFrontier, checked: List[Tuple[str, str]]) -> None:
+    strategy = frontier.create_strategy()
+    try:
+        for _ in crawl_offices(FakeChecker(checked, delay=0.01), strategy, None, None):
+            pass
+    finally:
+        strategy.release_province()
+
+
+def test_workers_check_every_office_once(manager):
+    frontier = CrawlFrontier(manager)
+    checked: List[Tuple[str, str]] = []
+    workers = [threading.Thread(target=crawl, args=(frontier, checked)) for _ in range(3)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(timeout=30)
+    assert sorted(checked) == all_offices
+    finished_offices, finished_provinces = frontier.finished()
+    assert finished_offices == set(all_offices) and finished_provinces == set(site)
+    assert not dict(frontier.active_provinces)
+
+
+def test_workers_spread_over_provinces(manager):
+    frontier = CrawlFrontier(manager)
+    strategies = [frontier.create_strategy() for _ in range(3)]
+    provinces = [strategy.select_province(options("form", list(site))).text for strategy in strategies]
+    assert len(set(provinces)) == 3
+    assert Counter(dict(frontier.active_provinces)) == Counter(provinces)
+
+
+def test_released_province_is_finished_by_other_workers(manager):
+    frontier = CrawlFrontier(manager)
+    checked: List[Tuple[str, str]] = []
+    # a worker that stops after its first office
+    stopped = frontier.create_strategy()
+    assert FakeChecker(checked).check_citas_available(None, stopped, None) is False
+    stopped.release_province()
+    assert checked == [("Alicante", "Office 1")] and not dict(frontier.active_provinces)
+
+    crawl(frontier, checked)
+    assert Counter(checked) == Counter(all_offices)
+
+
+def test_frontier_skips_finished_offices(manager):
+    frontier = CrawlFrontier(manager, [("Valencia", "Office 1"), ("Valencia", "Office 2")], ["Alicante", "Ceuta"])
+    checked: List[Tuple[str, str]] = []
+    crawl(frontier, checked)
+    assert sorted(checked) == [("Madrid", "Office 1"), ("Valencia", "Office 3"), ("Valencia", "Office 4")]
+    with pytest.raises(DFSOfficeSelectionStrategy.NoMoreProvincesException):
+        frontier.create_strategy().select_province(options("form", list(site)))
+
+
+def test_worker_checker_is_built_from_settings(tmp_path):
+    settings = WorkerSettings(90, 60, max_checks=50, max_memory_mb=800, standby=True,
+                              instrumentation_path=str(tmp_path / "steps.jsonl"))
+    checker = settings.create_checker(AppointmentChecker, DriverProfile(), None, None, None)
+    assert checker.budget.requests_per_minute == 90 and checker.budget.session_rate == 1
+    lifecycle = checker.lifecycle
+    assert (lifecycle.max_checks, lifecycle.max_memory_mb, lifecycle.standby) == (50, 800, True)
+    assert checker.instrumentation.path == str(tmp_path / "steps.jsonl")
+    assert WorkerSettings().create_checker(AppointmentChecker, None, None, None, None).instrumentation is None
@@ -0,0 +1,82 @@
+import subprocess
+import sys
+from typing import List
+
+import pytest
+from selenium.common.exceptions import TimeoutException, NoSuchElementException
+
+from niescraper.browserbackend import BrowserBackend
+from niescraper.readiness import Pacing, StepPacing, PageTimer, element_clickable, element_present, result_state, \
+    booking_reference
+from test.test_startup import root
+
+
+def test_step_delays_override_default():
+    pacing = Pacing.human(min_delay=2).with_step_delays(["province=0.5", "result=0"])
+    assert pacing["province"].min_delay == 0.5 and pacing["result"].min_delay == 0
+    assert pacing["intention"].min_delay == 2
+    assert pacing["province"].timeout == StepPacing().timeout
+
+
+@pytest.mark.parametrize("delay", ["province", "province=", "province=soon", "province=-1", "province=nan",
+                                   "lunch=2"])
+def test_invalid_step_delays_are_rejected(delay):
+    with pytest.raises(ValueError):
+        Pacing().with_step_delays([delay])
+
+
+def test_invalid_step_delay_is_reported_as_usage_error():
+    completed = subprocess.run([sys.executable, "-m", "niescraper.app", "--nie", "--step-delay", "province",
+                                "manual"], cwd=root, capture_output=True, text=True)
+    assert completed.returncode == 2
+    assert "Invalid step delay" in completed.stderr and "Traceback" not in completed.stderr
+
+
+def test_page_timer_sleeps_for_rest_of_min_delay():
+    timer = PageTimer()
+    assert timer.wait_min_delay(StepPacing(min_delay=0)) == 0
+    assert 0 < timer.wait_min_delay(StepPacing(min_delay=0.05)) <= 0.05
+
+
+class ScriptedBackend(BrowserBackend):
+    """Answers the scripts with the given results in turn and records their arguments."""
+
+    def __init__(self, *results):
+        self.results = list(results)
+        self.arguments: List[tuple] = []
+
+    def navigate(self, url: str) -> None:
+        pass
+
+    def execute_script(self, script: str, *args):
+        self.arguments.append(args)
+        result = self.results.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def click(self, element_id: str) -> None:
+        pass
+
+    def quit(self) -> None:
+        pass
+
+
+def test_conditions_pass_their_arguments():
+    driver = ScriptedBackend(True, "#prov_selecc", "office", "12345")
+    assert element_clickable("btnEnviar")(driver)
+    assert element_present("select#form option[value]", "#prov_selecc")(driver) == "#prov_selecc"
+    assert result_state(driver) == "office"
+    assert booking_reference(driver) == "12345"
+    assert driver.arguments == [("btnEnviar",), ("select#form option[value]", "#prov_selecc"), (), ()]
+
+
+def test_wait_polls_until_condition_holds():
+    driver = ScriptedBackend(None, NoSuchElementException(), False, "none")
+    assert driver.wait(result_state, timeout=1, poll_interval=0.001) == "none"
+
+
+def test_wait_times_out():
+    driver = ScriptedBackend(*[None] * 100)
+    with pytest.raises(TimeoutException, match="result page"):
+        driver.wait(result_state, timeout=0.02, poll_interval=0.005, message="Timed out waiting for the result page")
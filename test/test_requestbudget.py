@@ -0,0 +1,143 @@
+import pytest
+
+from niescraper.appointmentchecker import FormValues, IdentificationMethod, FormField
+from niescraper.crawl import crawl_offices
+from niescraper.httpchecker import HttpCheckEngine, HttpSession
+from niescraper.intentionselection import find_assign_nie_option
+from niescraper.officeselection import SpecificOfficeSelectionStrategy, DFSOfficeSelectionStrategy
+from niescraper.options import Option
+from niescraper.requestbudget import TokenBucket, CircuitBreaker, RequestBudget, BlockedException, block_reason
+from test.icpstandin import IcpStandIn
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+        self.slept = []
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+class Session:
+    pass
+
+
+def budget(clock: FakeClock, **kwargs) -> RequestBudget:
+    return RequestBudget(clock=clock, sleep=clock.sleep, resolve=lambda host: "10.0.0.1", **kwargs)
+
+
+def test_token_bucket_allows_bursts_and_refills():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=2, capacity=3, clock=clock)
+    for _ in range(3):
+        assert bucket.seconds_until() == 0
+        bucket.take()
+    assert bucket.seconds_until() == 0.5
+    assert bucket.seconds_until(3) == 1.5
+    clock.now += 10
+    assert bucket.seconds_until(3) == 0
+
+
+def test_circuit_breaker_backs_off_exponentially():
+    clock = FakeClock()
+    breaker = CircuitBreaker(base_delay=60, max_delay=200, clock=clock)
+    assert [breaker.record_block() for _ in range(4)] == [60, 120, 200, 200]
+    assert breaker.seconds_until_allowed() == 200
+    clock.now += 200
+    assert breaker.seconds_until_allowed() == 0
+    breaker.start_request()
+    # only the probe goes out until it succeeds
+    assert breaker.seconds_until_allowed() == breaker.probe_timeout
+    breaker.record_success()
+    assert breaker.closed
+    assert breaker.seconds_until_allowed() == 0
+
+
+def test_sessions_share_the_address_budget():
+    clock = FakeClock()
+    request_budget = budget(clock, requests_per_minute=60, session_requests_per_minute=30, burst=2)
+    first, second = Session(), Session()
+    assert request_budget.acquire(first, "https://example.org/a") == 0
+    assert request_budget.acquire(second, "https://example.org/b") == 0
+    # the address bucket is empty, the second session still has a token
+    assert request_budget.acquire(second, "https://example.org/b") == 1
+    assert request_budget.seconds_until("https://example.org/", 1, first) == 1
+    assert request_budget.acquire(first, "https://example.org/a") == 1
+    assert request_budget.seconds_until("https://example.org/", 2) == 2
+
+
+def test_block_opens_breaker_and_halves_rate():
+    clock = FakeClock()
+    blocks = []
+    request_budget = budget(clock, requests_per_minute=120, on_block=lambda *block: blocks.append(block))
+    session = Session()
+    request_budget.acquire(session, "https://example.org/")
+    assert request_budget.record_block("status 429") == 60
+    assert request_budget.requests_per_minute == 60
+    # the answers to requests sent before the block do not count again
+    assert request_budget.record_block("status 429") == 60
+    assert blocks == [("status 429", 60, 60)]
+    request_budget.record_success()
+    assert not request_budget.breaker.closed
+    assert request_budget.requests_per_minute == 60
+
+    assert request_budget.acquire(session, "https://example.org/") == pytest.approx(60)
+    request_budget.record_success()
+    assert request_budget.breaker.closed
+    assert request_budget.requests_per_minute == 61
+
+
+def test_block_reason():
+    assert block_reason("<p>The requested URL was rejected. Please consult with your administrator.</p>") \
+           == "The requested URL was rejected"
+    assert block_reason("", 429) == "status 429"
+    assert block_reason("<p>En este momento no hay citas disponibles</p>", 200) is None
+
+
+form_values = FormValues(IdentificationMethod.ByNIE, {FormField.NieNumber: "Y1234567X", FormField.Name: "My Name"})
+
+
+def test_http_engine_detects_block_page():
+    clock = FakeClock()
+    request_budget = budget(clock)
+    with IcpStandIn(block_after=3) as stand_in:
+        engine = HttpCheckEngine(stand_in.url, HttpSession(budget=request_budget))
+        with pytest.raises(BlockedException):
+            engine.check_citas_available(form_values, SpecificOfficeSelectionStrategy("valencia", "bailen"),
+                                         find_assign_nie_option)
+        assert len(stand_in.requests) == 4
+    assert not request_budget.breaker.closed
+    assert request_budget.seconds_until(stand_in.url) == 60
+
+
+class BlockedOnceChecker:
+    """Is blocked on the result page of its first check, after the office was selected."""
+
+    driver = None
+
+    def __init__(self):
+        self.last_province = self.last_office = None
+        self.blocked = False
+        self.checked = []
+
+    def check_citas_available(self, form_values, office_strategy, intention_strategy):
+        self.last_province = office_strategy.select_province([Option.create("form", "1", "Valencia")])
+        self.last_office = office_strategy.select_office([Option.create("idSede", "1", "Office 1"),
+                                                          Option.create("idSede", "2", "Office 2")])
+        if not self.blocked:
+            self.blocked = True
+            raise BlockedException("result page: blocked")
+        self.checked.append(self.last_office.text)
+        return False
+
+
+def test_crawl_checks_blocked_office_again():
+    checker = BlockedOnceChecker()
+    results = list(crawl_offices(checker, DFSOfficeSelectionStrategy(), None, None))
+    assert checker.checked == ["Office 1", "Office 2"]
+    assert [result.office for result in results] == ["Office 1", "Office 2"]
@@ -0,0 +1,63 @@
+import csv
+import io
+import json
+from datetime import datetime
+
+from niescraper.crawl import crawl_offices, OfficeResult
+from niescraper.officeselection import DFSOfficeSelectionStrategy
+from niescraper.resultwriter import JsonLinesResultWriter, CsvResultWriter, open_result_writer
+from test.test_checkpoint import FakeChecker
+
+result = OfficeResult("Valencia", "CNP Bailen", [datetime(2022, 1, 27, 9, 50), datetime(2022, 2, 3, 13, 5)],
+                      checked_at=datetime(2022, 1, 24, 8, 0, 3), seconds=4.2)
+
+
+def test_json_lines():
+    file = io.StringIO()
+    JsonLinesResultWriter(file).write(result)
+    assert json.loads(file.getvalue()) == {
+        "province": "Valencia",
+        "office": "CNP Bailen",
+        "intention_available": True,
+        "appointments": ["2022-01-27T09:50:00", "2022-02-03T13:05:00"],
+        "checked_at": "2022-01-24T08:00:03",
+        "seconds": 4.2,
+    }
+
+
+def test_csv(tmp_path):
+    path = tmp_path / "results.csv"
+    writer = open_result_writer("csv", str(path))
+    assert isinstance(writer, CsvResultWriter)
+    writer.write(result)
+    writer.write(OfficeResult("Alicante", None, []))
+    writer.close()
+    with open(path, newline="", encoding="utf-8") as file:
+        rows = list(csv.DictReader(file))
+    assert rows[0]["appointments"] == "2022-01-27T09:50:00 2022-02-03T13:05:00"
+    assert rows[0]["seconds"] == "4.2"
+    assert rows[1]["office"] == ""
+    assert rows[1]["appointments"] == ""
+
+
+def test_records_are_written_while_crawling():
+    file = io.StringIO()
+    writer = JsonLinesResultWriter(file)
+    results = crawl_offices(FakeChecker(), DFSOfficeSelectionStrategy(), None, None)
+    writer.write(next(results))
+    record = json.loads(file.getvalue())
+    assert record["province"] == "Alicante"
+    assert record["seconds"] is not None
+    for office_result in results:
+        writer.write(office_result)
+    assert len(file.getvalue().splitlines()) == 6
+
+
+def test_appointments_are_written_in_date_order(monkeypatch):
+    # as the table view lists them, by time of day
+    monkeypatch.setattr("niescraper.crawl.scrape_appointments",
+                        lambda driver: iter([datetime(2022, 1, 27, 9, 50), datetime(2022, 1, 26, 13, 5)]))
+    file = io.StringIO()
+    results = crawl_offices(FakeChecker(), DFSOfficeSelectionStrategy(), None, None)
+    JsonLinesResultWriter(file).write(next(result for result in results if result.appointments))
+    assert json.loads(file.getvalue())["appointments"] == ["2022-01-26T13:05:00", "2022-01-27T09:50:00"]
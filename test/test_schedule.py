@@ -0,0 +1,53 @@
+from datetime import datetime, time
+
+import pytest
+import pytz
+
+from niescraper.app import seconds_until_next_check
+from niescraper.schedule import ReleaseSchedule, ServerClock, default_schedule
+from niescraper.httpchecker import HttpSession
+from test.icpstandin import IcpStandIn
+
+
+def test_parses_release_times():
+    schedule = ReleaseSchedule.parse(["08:00-09:00/20", "13:30"])
+    assert schedule.times == [time(8), time(8, 20), time(8, 40), time(9), time(13, 30)]
+
+
+@pytest.mark.parametrize("spec", ["08:00-09:00/0", "08:00-09:00/-15", "08:00-09:00/soon"])
+def test_rejects_invalid_intervals(spec):
+    with pytest.raises(ValueError):
+        ReleaseSchedule.parse([spec])
+
+
+def test_finds_next_release():
+    assert default_schedule.next_release(datetime(2021, 12, 7, 8, 1)) == datetime(2021, 12, 7, 8, 15)
+    assert default_schedule.next_release(datetime(2021, 12, 7, 8, 15)) == datetime(2021, 12, 7, 8, 15)
+    # friday after the last release -> monday
+    assert default_schedule.next_release(datetime(2021, 12, 10, 11)) == datetime(2021, 12, 13, 8)
+
+    utc_now = pytz.utc.localize(datetime(2021, 12, 7, 7, 1))
+    assert default_schedule.next_release(utc_now) == pytz.utc.localize(datetime(2021, 12, 7, 7, 15))
+
+
+def test_waits_according_to_schedule():
+    schedule = ReleaseSchedule.parse(["14:00"])
+    assert seconds_until_next_check(datetime(2021, 12, 7, 9, 30), schedule) == 60
+    assert seconds_until_next_check(datetime(2021, 12, 7, 13, 56), schedule) == 10
+    assert seconds_until_next_check(datetime(2021, 12, 7, 14, 2), schedule) == 1
+
+
+def test_narrows_down_clock_offset():
+    clock = ServerClock()
+    # the server clock is 0.3s ahead
+    for sent in (1000.0, 1001.25, 1002.5, 1003.75, 1004.9):
+        received = sent + 0.05
+        clock.add_sample(sent, received, float(int(received + 0.3)))
+    assert abs(clock.offset - 0.3) <= clock.uncertainty <= 0.15
+
+
+def test_synchronizes_with_date_headers():
+    with IcpStandIn() as stand_in:
+        clock = ServerClock()
+        clock.synchronize(HttpSession(), stand_in.url, samples=4)
+        assert abs(clock.offset) <= clock.uncertainty < 0.5
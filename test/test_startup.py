@@ -0,0 +1,34 @@
+import os
+import subprocess
+import sys
+import time
+
+# time that `niescraper --help` may take on top of starting the interpreter
+help_budget_seconds = 0.25
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_python(*args: str) -> str:
+    return subprocess.run([sys.executable, *args], cwd=root, check=True, capture_output=True, text=True).stdout
+
+
+def fastest_seconds(*args: str, repetitions: int = 3) -> float:
+    durations = []
+    for _ in range(repetitions):
+        start = time.perf_counter()
+        run_python(*args)
+        durations.append(time.perf_counter() - start)
+    return min(durations)
+
+
+def test_help_stays_within_budget():
+    assert "--engine" in run_python("-m", "niescraper.app", "--help")
+    overhead = fastest_seconds("-m", "niescraper.app", "--help") - fastest_seconds("-c", "pass")
+    assert overhead < help_budget_seconds
+
+
+def test_app_does_not_import_heavy_modules():
+    loaded = run_python("-c", "import sys, niescraper.app; print(' '.join(sys.modules))").split()
+    for module in ["selenium.webdriver", "urllib3", "asyncio", "playsound", "niescraper.appointmentchecker"]:
+        assert module not in loaded
@@ -0,0 +1,165 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from time import monotonic
+from typing import List
+
+import pytest
+from selenium.common.exceptions import NoSuchElementException, WebDriverException
+
+from niescraper.appointmentchecker import AppointmentChecker
+from niescraper.browserprofile import DriverProfile
+from niescraper.firefoxbackend import FirefoxBackend, WebDriverTab
+from niescraper.intentionselection import find_assign_nie_option
+from niescraper.officeselection import SpecificOfficeSelectionStrategy
+from niescraper.tabs import TabbedBrowser
+from test.benchmark import browser_params
+from test.icpstandin import IcpStandIn
+from test.test_booking import form_values
+
+
+class FakeFirefox:
+    """Records the commands with the window they were sent to."""
+
+    def __init__(self):
+        self.tab_lock = threading.RLock()
+        self.current_tab = None
+        self.initial_window_taken = False
+        self.window = "first"
+        self.commands: List[tuple] = []
+        browser = self
+
+        class SwitchTo:
+            @staticmethod
+            def window(handle: str):
+                browser.commands.append(("switchToWindow", handle))
+                browser.window = handle
+
+        self.switch_to = SwitchTo()
+        self.process_id = 42
+
+    def execute(self, command: str, params: dict = None) -> dict:
+        self.commands.append((command, self.window))
+        return {"value": params.get("args", [None])[0] if params else None}
+
+
+def test_tabs_switch_windows_only_when_needed():
+    firefox = FakeFirefox()
+    first, second = WebDriverTab(firefox, "a"), WebDriverTab(firefox, "b")
+    first.execute_script("return arguments[0];", 1)
+    first.execute_script("return arguments[0];", 2)
+    assert second.execute_script("return arguments[0];", "x") == "x"
+    first.quit()
+    assert firefox.commands == [("switchToWindow", "a"), ("w3cExecuteScript", "a"), ("w3cExecuteScript", "a"),
+                                ("switchToWindow", "b"), ("w3cExecuteScript", "b"), ("switchToWindow", "a"),
+                                ("close", "a")]
+    assert firefox.current_tab is None
+    assert second.process_id == 42
+
+
+def test_tab_click_fails_without_element():
+    firefox = FakeFirefox()
+    firefox.execute = lambda command, params=None: {"value": False}
+    with pytest.raises(NoSuchElementException):
+        WebDriverTab(firefox, "a").click("btnAceptar")
+
+
+def test_initial_window_is_the_first_tab():
+    firefox = FakeFirefox()
+    firefox.capabilities = {"pageLoadStrategy": "eager"}
+    firefox.current_window_handle = "first"
+
+    def new_window(kind: str):
+        firefox.current_window_handle = "new"
+
+    firefox.switch_to.new_window = new_window
+    first, second = FirefoxBackend.open_tab(firefox), FirefoxBackend.open_tab(firefox)
+    assert (first.handle, second.handle) == ("first", "new")
+    assert first.page_load_strategy == "eager"
+
+
+class FakeTab:
+    def __init__(self, browser: "FakeBrowser"):
+        self.browser = browser
+        self.quit_called = False
+
+    def quit(self):
+        self.quit_called = True
+
+
+class FakeBrowser:
+    def __init__(self, fail: bool = False):
+        self.fail = fail
+        self.tabs: List[FakeTab] = []
+        self.quit_called = threading.Event()
+
+    def open_tab(self):
+        if self.fail:
+            raise WebDriverException("Failed to decode response from marionette")
+        self.tabs.append(FakeTab(self))
+        return self.tabs[-1]
+
+    def quit(self):
+        self.quit_called.set()
+
+
+def test_tabbed_browser_replaces_failed_browser():
+    launched = [FakeBrowser(fail=True), FakeBrowser()]
+    browsers = iter(launched)
+    tabbed = TabbedBrowser(lambda: next(browsers))
+    assert tabbed.open_tab().browser is launched[1]
+    assert tabbed.open_tab().browser is launched[1]
+    assert launched[0].quit_called.is_set() and len(launched[1].tabs) == 2
+
+
+def test_browser_is_recycled_as_a_whole_on_memory():
+    launched = []
+
+    def launch() -> FakeBrowser:
+        launched.append(FakeBrowser())
+        return launched[-1]
+
+    tabbed = TabbedBrowser(launch, max_memory_mb=500, memory=lambda browser: 600 if len(launched) == 1 else 100)
+    lifecycles = [tabbed.lifecycle() for _ in range(3)]
+    tabs = [lifecycle.driver for lifecycle in lifecycles]
+    assert {tab.browser for tab in tabs} == {launched[0]}
+
+    # the first check over the limit replaces the browser, and the other tabs follow after their checks
+    lifecycles[0].check_done()
+    assert tabbed.recycled == 1 and tabs[0].quit_called and not launched[0].quit_called.is_set()
+    assert lifecycles[0].driver.browser is launched[1]
+    lifecycles[1].check_done()
+    lifecycles[2].check_done()
+    assert launched[0].quit_called.wait(timeout=5)
+    assert all(lifecycle.driver.browser is launched[1] for lifecycle in lifecycles)
+
+    # the new browser is below the limit, so its tabs stay
+    for lifecycle in lifecycles:
+        lifecycle.check_done()
+    assert len(launched) == 2 and tabbed.recycled == 1 and all(lifecycle.recycled == 1 for lifecycle in lifecycles)
+    tabbed.quit()
+    assert launched[1].quit_called.is_set()
+
+
+@pytest.mark.parametrize("browser", browser_params)
+def test_tabs_check_at_once(browser):
+    def check(checker: AppointmentChecker) -> bool:
+        return checker.check_citas_available(form_values, SpecificOfficeSelectionStrategy("valencia", "bailen"),
+                                             find_assign_nie_option)
+
+    with IcpStandIn(delay=0.2) as stand_in:
+        tabbed = TabbedBrowser(DriverProfile(headless=True, browser=browser).create_driver)
+        checkers = [AppointmentChecker(start_url=stand_in.url, lifecycle=tabbed.lifecycle())
+                    for _ in range(3)]
+        try:
+            # launches the browser
+            assert not check(checkers[0])
+            start = monotonic()
+            assert not check(checkers[0])
+            single = monotonic() - start
+            start = monotonic()
+            with ThreadPoolExecutor(len(checkers)) as executor:
+                assert not any(executor.map(check, checkers))
+            # the checks wait for the site at the same time instead of one after the other
+            assert monotonic() - start < 2 * single
+        finally:
+            tabbed.quit()
@@ -0,0 +1,135 @@
+import threading
+from datetime import datetime
+from time import sleep
+from typing import List
+
+import pytest
+
+from niescraper.coordinator import CoordinatorServer, CoordinatorClient, work
+from niescraper.crawl import OfficeResult, check_work_unit
+from niescraper.httpchecker import HttpCheckEngine
+from niescraper.intentionselection import find_assign_nie_option
+from niescraper.options import Option
+from niescraper.workqueue import WorkQueue, WorkUnit
+from test.icpstandin import IcpStandIn
+from test.test_appointmentscraper import box_page
+from test.test_booking import form_values
+
+intention = "find_assign_nie_option"
+
+
+def result(province: str, office: str = None, *appointments: datetime) -> OfficeResult:
+    return OfficeResult(province, office, list(appointments))
+
+
+def test_expired_leases_are_handed_out_again(tmp_path):
+    queue = WorkQueue(str(tmp_path / "queue.sqlite"), lease_seconds=60, max_attempts=2)
+    assert queue.seed(intention)
+    first = queue.claim("a", intention, now=1000)
+    assert first.unit == WorkUnit(None, None, intention)
+    assert queue.claim("b", intention, now=1030) is None
+    second = queue.claim("b", intention, now=1061)
+    assert second.unit == first.unit and second.token != first.token
+    # the worker of the expired lease cannot hand the unit out again
+    assert not queue.fail(first.token, "TimeoutException()")
+    assert queue.fail(second.token, "TimeoutException()")
+    with pytest.raises(WorkQueue.NoMoreUnitsException):
+        queue.claim("a", intention, now=1062)
+    assert queue.failed(intention) == [(first.unit, "TimeoutException()")]
+
+
+def test_discovered_offices_come_first_and_results_are_stored_once(tmp_path):
+    queue = WorkQueue(str(tmp_path / "queue.sqlite"))
+    queue.seed(intention)
+    seed = queue.claim("a", intention)
+    hit = result("Valencia", "CNP Bailen", datetime(2022, 1, 27, 9, 50))
+    discovered = [("Barcelona", None), ("Valencia", "CNP Patraix"), ("Valencia", "CNP Bailen")]
+    assert queue.complete(seed.unit, [hit], discovered) == [hit]
+    # reported again by a worker whose lease ran out
+    assert queue.complete(seed.unit, [hit], discovered) == []
+
+    office = queue.claim("a", intention)
+    assert office.unit == WorkUnit("Valencia", "CNP Patraix", intention)
+    queue.complete(office.unit, [result("Valencia", "CNP Patraix")])
+    province = queue.claim("a", intention)
+    assert province.unit == WorkUnit("Barcelona", None, intention)
+    queue.complete(province.unit, [result("Barcelona")])
+    assert queue.finished(intention)
+    assert [(r.province, r.office) for r in queue.results(intention)] == [
+        ("Barcelona", None), ("Valencia", "CNP Bailen"), ("Valencia", "CNP Patraix")]
+    # a restarted coordinator continues the crawl instead of starting anew
+    queue.close()
+    assert not WorkQueue(str(tmp_path / "queue.sqlite")).seed(intention)
+
+
+def test_results_of_last_request_are_passed_on_before_server_closes(tmp_path):
+    queue = WorkQueue(str(tmp_path / "queue.sqlite"))
+    queue.seed(intention)
+    lease = queue.claim("a", intention)
+    reported: List[OfficeResult] = []
+    completing = threading.Event()
+
+    def on_results(results: List[OfficeResult]):
+        # the unit is done once the results are passed on, so the coordinator might close the server meanwhile
+        completing.set()
+        # longer than the server takes to shut down
+        sleep(1)
+        reported.extend(results)
+
+    with CoordinatorServer(queue, on_results=on_results) as server:
+        client = CoordinatorClient(server.url, "a")
+        threading.Thread(target=client.complete, args=(lease, [result("Valencia")], [])).start()
+        assert completing.wait(timeout=10)
+    assert [r.province for r in reported] == ["Valencia"]
+
+
+class FakeDriver:
+    page_source = box_page
+
+
+class FakeChecker:
+    """Offers two provinces, and offices with appointments in Valencia."""
+
+    driver = FakeDriver()
+
+    def check_citas_available(self, form_values, office_strategy, intention_strategy) -> bool:
+        province = office_strategy.select_province([Option.create("form", "1", "Valencia"),
+                                                    Option.create("form", "2", "Barcelona")])
+        if province.text != "Valencia":
+            return False
+        office_strategy.select_office([Option.create("idSede", "1", "CNP Bailen"),
+                                       Option.create("idSede", "2", "CNP Patraix")])
+        return True
+
+
+def test_work_unit_reports_other_options():
+    results, discovered = check_work_unit(FakeChecker(), None, None, find_assign_nie_option, form_values)
+    assert [(r.province, r.office, r.appointments) for r in results] == [
+        ("Valencia", "CNP Bailen", [datetime(2022, 1, 27, 9, 50), datetime(2022, 2, 3, 13, 5)])]
+    assert discovered == [("Barcelona", None), ("Valencia", "CNP Patraix")]
+
+    results, discovered = check_work_unit(FakeChecker(), "Valencia", "CNP Alzira", find_assign_nie_option,
+                                          form_values)
+    assert [(r.province, r.office, r.appointments) for r in results] == [("Valencia", "CNP Alzira", [])]
+    assert check_work_unit(FakeChecker(), "Girona", None, find_assign_nie_option, form_values) == ([], [])
+
+
+def test_workers_crawl_all_provinces_through_coordinator(tmp_path):
+    queue = WorkQueue(str(tmp_path / "queue.sqlite"))
+    queue.seed(intention)
+    reported: List[OfficeResult] = []
+    with IcpStandIn.with_catalog_size(provinces=6, offices=2) as stand_in, \
+            CoordinatorServer(queue, on_results=reported.extend) as server:
+        def worker(name: str):
+            client = CoordinatorClient(server.url, name)
+            list(work(client, HttpCheckEngine(stand_in.url), find_assign_nie_option, form_values, poll_interval=0.05))
+
+        workers = [threading.Thread(target=worker, args=(f"worker-{i}",)) for i in range(3)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join(timeout=30)
+        assert queue.finished(intention)
+    assert sorted(r.province for r in reported) == sorted(name for _, name in stand_in.provinces)
+    assert all(r.office is None and not r.appointments for r in reported)
+    assert queue.progress(intention) == {"done": 6}